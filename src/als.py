@@ -0,0 +1,296 @@
+import numpy as np
+import scipy.sparse as sp
+from joblib import Parallel, delayed, effective_n_jobs
+
+
+def row_blocks(indptr, max_entries, min_blocks=1):
+    """
+    Split the rows of a CSR matrix into contiguous blocks of about max_entries entries (at least one row each),
+    and into at least min_blocks blocks when there are enough rows.
+
+    Parameters:
+        - indptr (ndarray): The index pointer of the matrix.
+        - max_entries (int): The maximum number of entries of a block of several rows.
+        - min_blocks (int): The minimum number of blocks, e.g. the number of parallel jobs.
+
+    Returns:
+        - bounds (list): The (start, stop) rows of each block.
+    """
+    number_of_rows = len(indptr) - 1
+    max_entries = max(1, min(max_entries, -(-indptr[-1] // max(min_blocks, 1))))
+
+    bounds = []
+    start = 0
+    while start < number_of_rows:
+        stop = max(int(np.searchsorted(indptr, indptr[start] + max_entries, side='right')) - 1, start + 1)
+        stop = min(stop, number_of_rows)
+        bounds.append((start, stop))
+        start = stop
+    return bounds
+
+
+def solve_block(ratings, start, stop, fixed_factors, gram, regularization, implicit, alpha):
+    """
+    Solve the regularized least squares of the factors of a block of rows, with the factors of the columns fixed.
+    Runs in the worker threads of ALS.solve.
+
+    The normal equations of the rows of the block are built with batched matrix products: the rows are grouped
+    by their number of ratings (rounded up to a power of 2), and the factors of the rated columns of a group are
+    gathered into a (rows x ratings x rank) array padded with zeros. The (rows x rank x rank) systems are then
+    solved in one batched call.
+
+    Explicit ratings: (Y_u^T Y_u + regularization * n_u * I) x_u = Y_u^T r_u, over the n_u ratings of the row.
+    Implicit ratings, with the confidence c = 1 + alpha * r of each rating and a preference of 1:
+    (Y^T Y + Y_u^T (C_u - I) Y_u + regularization * I) x_u = Y_u^T c_u, over every column.
+
+    Parameters:
+        - ratings (csr_matrix): The (rows x columns) ratings.
+        - start (int): The first row of the block.
+        - stop (int): The row after the last row of the block.
+        - fixed_factors (ndarray): The (columns x rank) fixed factors.
+        - gram (ndarray): Y^T Y of the fixed factors, used in the implicit mode.
+        - regularization (float): The weight of the L2 regularization.
+        - implicit (bool): Whether the ratings are implicit feedback.
+        - alpha (float): The confidence scale of the implicit ratings.
+
+    Returns:
+        - factors (ndarray): The (stop - start x rank) factors of the rows.
+    """
+    rank = fixed_factors.shape[1]
+    indptr = ratings.indptr[start:stop + 1]
+    counts = np.diff(indptr)
+    systems = np.zeros((stop - start, rank, rank), dtype=np.float32)
+    right_hand_sides = np.zeros((stop - start, rank), dtype=np.float32)
+
+    # the padding of a group is less than its number of ratings
+    groups = np.ceil(np.log2(np.maximum(counts, 1))).astype(np.intp)
+    for group in np.unique(groups[counts > 0]):
+        rows = np.flatnonzero((groups == group) & (counts > 0))
+        slots = np.arange(counts[rows].max())
+        filled = slots < counts[rows, None]
+        entries = np.where(filled, indptr[rows, None] + slots, indptr[0])
+        rated_factors = fixed_factors[ratings.indices[entries]] * filled[..., None]
+        values = ratings.data[entries] * filled
+
+        if implicit:
+            weights, targets = alpha * values, (1 + alpha * values) * filled
+        else:
+            weights, targets = filled.astype(np.float32), values
+
+        systems[rows] = (rated_factors * weights[..., None]).transpose(0, 2, 1) @ rated_factors
+        right_hand_sides[rows] = (targets[:, None, :] @ rated_factors)[:, 0]
+
+    identity = np.eye(rank, dtype=np.float32)
+    if implicit:
+        systems += gram + regularization * identity
+    else:
+        # the regularization grows with the number of ratings of the row (weighted-lambda regularization)
+        systems += regularization * np.maximum(counts, 1)[:, None, None] * identity
+
+    return np.linalg.solve(systems, right_hand_sides[..., None])[..., 0]
+
+
+class ALS:
+    """
+    Alternating least squares matrix factorization of sparse ratings.
+
+    Only the known ratings are fitted (explicit mode), or every pair is fitted with a preference of 1 for the
+    rated pairs and 0 for the others, weighted by a confidence that grows with the rating (implicit mode).
+    Each iteration solves the factors of every user with the business factors fixed, then the factors of
+    every business with the user factors fixed. The rows are solved by blocks across a thread pool: the
+    blocks share the rating matrix and the fixed factors in memory, and NumPy releases the GIL in the
+    batched products and solves.
+
+    In the explicit mode, the factors fit the ratings minus their mean (mean_), so the predicted rating of a pair
+    is mean_ plus the dot product of its factors and the regularization shrinks the ratings towards their mean
+    instead of zero; the ranking of the businesses of a user only depends on the dot products.
+
+    In the explicit mode, a fraction of the ratings is held out and the fit stops when the RMSE of the held-out
+    ratings stops decreasing; the factors are then refitted on every rating, held-out ones included, for the
+    number of iterations of the best held-out RMSE. In the implicit mode, the fit stops when the loss over every
+    pair stops decreasing, keeping the factors of the best iteration.
+
+    Parameters:
+        - rank (int): The number of latent factors.
+        - regularization (float): The weight of the L2 regularization of the factors.
+        - implicit (bool): Whether the ratings are implicit feedback, weighted by confidence.
+        - alpha (float): The confidence scale of the implicit ratings, c = 1 + alpha * rating.
+        - max_iter (int): The maximum number of iterations.
+        - tol (float): The minimum relative decrease of the monitored loss to keep iterating.
+        - validation_fraction (float): The fraction of the explicit ratings held out for the early stopping.
+        - patience (int): The number of iterations without improvement before stopping.
+        - block_entries (int): The maximum number of ratings of a block of rows at rank 32, scaled by
+                               (32 / rank)^2, bounding the memory of a solve.
+        - n_jobs (int): The number of threads solving the blocks (None for one, -1 for every core).
+        - seed (int): The seed of the initial factors and of the validation split.
+    """
+
+    def __init__(self, rank=32, regularization=0.1, implicit=False, alpha=40.0, max_iter=15, tol=1e-3,
+                 validation_fraction=0.1, patience=1, block_entries=16_384, n_jobs=None, seed=0):
+        """
+        Initialize the ALS object.
+
+        Parameters:
+            - rank (int): The number of latent factors.
+            - regularization (float): The weight of the L2 regularization of the factors.
+            - implicit (bool): Whether the ratings are implicit feedback, weighted by confidence.
+            - alpha (float): The confidence scale of the implicit ratings, c = 1 + alpha * rating.
+            - max_iter (int): The maximum number of iterations.
+            - tol (float): The minimum relative decrease of the monitored loss to keep iterating.
+            - validation_fraction (float): The fraction of the explicit ratings held out for the early stopping.
+            - patience (int): The number of iterations without improvement before stopping.
+            - block_entries (int): The maximum number of ratings of a block of rows at rank 32, scaled by
+                                   (32 / rank)^2, bounding the memory of a solve.
+            - n_jobs (int): The number of threads solving the blocks (None for one, -1 for every core).
+            - seed (int): The seed of the initial factors and of the validation split.
+        """
+        self.rank = rank
+        self.regularization = regularization
+        self.implicit = implicit
+        self.alpha = alpha
+        self.max_iter = max_iter
+        self.tol = tol
+        self.validation_fraction = validation_fraction
+        self.patience = patience
+        self.block_entries = block_entries
+        self.n_jobs = n_jobs
+        self.seed = seed
+
+    def center(self, ratings):
+        """
+        Subtract the mean rating from the ratings of the explicit mode, keeping the sparsity structure.
+        """
+        ratings = sp.csr_matrix(ratings, dtype=np.float32, copy=True)
+        if not self.implicit:
+            ratings.data -= self.mean_
+        return ratings
+
+    def solve(self, ratings, fixed_factors, parallel=None):
+        """
+        Solve the factors of every row of a rating matrix, with the factors of its columns fixed.
+
+        Parameters:
+            - ratings (csr_matrix): The (rows x columns) ratings.
+            - fixed_factors (ndarray): The (columns x rank) fixed factors.
+            - parallel (Parallel): An optional pool of threads to reuse.
+
+        Returns:
+            - factors (ndarray): The (rows x rank) factors of the rows.
+        """
+        if parallel is None:
+            with Parallel(n_jobs=self.n_jobs, prefer='threads') as parallel:
+                return self.solve(ratings, fixed_factors, parallel)
+
+        ratings = sp.csr_matrix(ratings, dtype=np.float32)
+        fixed_factors = np.ascontiguousarray(fixed_factors, dtype=np.float32)
+        gram = fixed_factors.T @ fixed_factors if self.implicit else None
+
+        # the block size bounds the (rows x rank x rank) systems of a block, and there is at least one block
+        # per thread
+        max_entries = max(1, self.block_entries * 32 ** 2 // self.rank ** 2)
+        bounds = row_blocks(ratings.indptr, max_entries, min_blocks=effective_n_jobs(self.n_jobs))
+        blocks = parallel(delayed(solve_block)(ratings, start, stop, fixed_factors, gram, self.regularization,
+                                               self.implicit, self.alpha) for start, stop in bounds)
+        return np.vstack(blocks) if blocks else np.empty((0, self.rank), dtype=np.float32)
+
+    def implicit_loss(self, ratings, user_factors, item_factors):
+        """
+        Get the loss of the implicit mode over every (user, item) pair, without scoring the unrated pairs:
+        the sum of the squared scores of every pair is trace(X^T X Y^T Y).
+        """
+        coo = ratings.tocoo()
+        scores = np.einsum('ij,ij->i', user_factors[coo.row], item_factors[coo.col]).astype(np.float64)
+        confidence = 1 + self.alpha * coo.data.astype(np.float64)
+        all_squared_scores = np.sum((user_factors.T.astype(np.float64) @ user_factors) *
+                                    (item_factors.T.astype(np.float64) @ item_factors))
+        return (np.sum(confidence * (1 - scores) ** 2) + all_squared_scores - np.sum(scores ** 2) +
+                self.regularization * (np.sum(user_factors.astype(np.float64) ** 2) +
+                                       np.sum(item_factors.astype(np.float64) ** 2)))
+
+    def fit(self, user_item_ratings):
+        """
+        Fit the user and item factors of a user-item matrix.
+
+        Parameters:
+            - user_item_ratings (csr_matrix): The (users x items) ratings.
+
+        Returns:
+            - self (ALS): The fitted model, with the user_factors_ and item_factors_, the mean_ rating of the
+                          explicit mode, the monitored loss of each iteration in history_ and the number of
+                          iterations of the kept factors in n_iter_.
+        """
+        rng = np.random.default_rng(self.seed)
+        ratings = all_ratings = sp.csr_matrix(user_item_ratings, dtype=np.float32)
+        self.mean_ = 0.0
+
+        # hold out a fraction of the explicit ratings to stop when their error stops decreasing
+        validation = None
+        if not self.implicit and self.validation_fraction > 0 and ratings.nnz > 1:
+            coo = ratings.tocoo()
+            held_out = rng.random(coo.nnz) < self.validation_fraction
+            validation = (coo.row[held_out], coo.col[held_out], coo.data[held_out])
+            ratings = sp.csr_matrix((coo.data[~held_out], (coo.row[~held_out], coo.col[~held_out])),
+                                    shape=ratings.shape)
+        if not self.implicit:
+            self.mean_ = float(ratings.data.mean()) if ratings.nnz else 0.0
+            ratings = self.center(ratings)
+            if validation is not None:
+                validation = validation[:2] + (validation[2] - self.mean_,)
+        item_ratings = ratings.T.tocsr()
+
+        initial_item_factors = rng.normal(scale=1 / np.sqrt(self.rank),
+                                          size=(ratings.shape[1], self.rank)).astype(np.float32)
+        item_factors = initial_item_factors
+        best_loss, best_factors, iterations_without_improvement = np.inf, None, 0
+        self.history_ = []
+
+        with Parallel(n_jobs=self.n_jobs, prefer='threads') as parallel:
+            for _ in range(self.max_iter):
+                user_factors = self.solve(ratings, item_factors, parallel)
+                item_factors = self.solve(item_ratings, user_factors, parallel)
+
+                if self.implicit:
+                    loss = self.implicit_loss(ratings, user_factors, item_factors)
+                else:
+                    rows, columns, stars = validation if validation is not None else \
+                        (ratings.tocoo().row, ratings.tocoo().col, ratings.tocoo().data)
+                    predictions = np.einsum('ij,ij->i', user_factors[rows], item_factors[columns])
+                    loss = float(np.sqrt(np.mean((stars - predictions) ** 2))) if len(stars) else 0.0
+                self.history_.append(loss)
+
+                if loss < best_loss * (1 - self.tol):
+                    best_loss, best_factors, iterations_without_improvement = loss, (user_factors, item_factors), 0
+                    self.n_iter_ = len(self.history_)
+                else:
+                    iterations_without_improvement += 1
+                    if iterations_without_improvement >= self.patience:
+                        break
+
+            if best_factors is None:
+                best_factors, self.n_iter_ = (user_factors, item_factors), len(self.history_)
+
+            # the held-out ratings only chose the number of iterations, the final factors fit every rating
+            if validation is not None:
+                self.mean_ = float(all_ratings.data.mean())
+                ratings = self.center(all_ratings)
+                item_ratings = ratings.T.tocsr()
+                item_factors = initial_item_factors
+                for _ in range(self.n_iter_):
+                    user_factors = self.solve(ratings, item_factors, parallel)
+                    item_factors = self.solve(item_ratings, user_factors, parallel)
+                best_factors = (user_factors, item_factors)
+
+        self.user_factors_, self.item_factors_ = best_factors
+        return self
+
+    def fold_in_users(self, user_ratings, item_factors):
+        """
+        Compute the factors of some users from their ratings, with the item factors fixed.
+        """
+        return self.solve(self.center(user_ratings), item_factors)
+
+    def fold_in_items(self, item_ratings, user_factors):
+        """
+        Compute the factors of some items from their (items x users) ratings, with the user factors fixed.
+        """
+        return self.solve(self.center(item_ratings), user_factors)
@@ -0,0 +1,228 @@
+import numpy as np
+import scipy.sparse as sp
+
+from ranking import top_n_indices
+
+
+def augment_item_factors(item_factors, max_norm):
+    """
+    Map the item factors to the unit sphere with one more dimension, so that the items with the highest
+    inner product with a query are the nearest to it (the MIPS to nearest neighbor reduction).
+
+    Each item x becomes [x, sqrt(max_norm^2 - |x|^2)] / max_norm and a query q becomes [q, 0], so the inner
+    product with the query is kept and every item has the same norm.
+
+    Parameters:
+        - item_factors (ndarray): The (items x rank) latent factors of the items.
+        - max_norm (float): The largest norm of the items.
+
+    Returns:
+        - augmented (ndarray): The (items x rank + 1) unit vectors of the items.
+    """
+    item_factors = np.asarray(item_factors, dtype=np.float32)
+    squared_norms = np.einsum('ij,ij->i', item_factors, item_factors)
+    extra = np.sqrt(np.maximum(max_norm ** 2 - squared_norms, 0))
+    return np.hstack([item_factors, extra[:, None]]) / max_norm
+
+
+def assign_to_centroids(vectors, centroids, block_size=65536):
+    """
+    Get the centroid with the highest inner product with each vector, assigning the vectors by blocks.
+    """
+    assignments = np.empty(len(vectors), dtype=np.int32)
+    for start in range(0, len(vectors), block_size):
+        assignments[start:start + block_size] = np.argmax(vectors[start:start + block_size] @ centroids.T, axis=1)
+    return assignments
+
+
+def spherical_kmeans(vectors, number_of_clusters, max_iter, rng):
+    """
+    Cluster unit vectors by their cosine similarity, with centroids on the unit sphere.
+
+    The centroids start at random vectors, and an empty cluster is moved to a random vector.
+
+    Parameters:
+        - vectors (ndarray): The unit vectors to cluster.
+        - number_of_clusters (int): The number of clusters.
+        - max_iter (int): The maximum number of iterations.
+        - rng (Generator): The random generator.
+
+    Returns:
+        - centroids (ndarray): The (clusters x dimensions) unit centroids.
+    """
+    centroids = vectors[rng.choice(len(vectors), number_of_clusters, replace=False)].copy()
+    assignments = None
+
+    for _ in range(max_iter):
+        new_assignments = assign_to_centroids(vectors, centroids)
+        if assignments is not None and (new_assignments == assignments).all():
+            break
+        assignments = new_assignments
+
+        members = sp.csr_matrix((np.ones(len(vectors), dtype=np.float32), (assignments, np.arange(len(vectors)))),
+                                shape=(number_of_clusters, len(vectors)))
+        sums = np.asarray(members @ vectors)
+        empty = np.asarray(members.sum(axis=1)).ravel() == 0
+        sums[empty] = vectors[rng.choice(len(vectors), empty.sum())]
+        centroids = sums / np.maximum(np.linalg.norm(sums, axis=1, keepdims=True), 1e-12)
+
+    return centroids.astype(np.float32)
+
+
+class IVFIndex:
+    """
+    Inverted file index over the latent factors of the items, to get the items with the highest inner product
+    with a user without scoring the whole catalog.
+
+    The items are clustered into n_lists lists with a spherical k-means (after the MIPS reduction of
+    augment_item_factors). A query only scores the items of the n_probe lists whose centroids score the highest,
+    so it scores about n_probe / n_lists of the catalog; the candidates are then ranked by their exact scores,
+    so the approximation is only in the routing and n_probe = n_lists gives the exact top n.
+
+    The index only stores the lists of item positions, the item factors are passed to search, so they are not
+    copied.
+
+    Parameters:
+        - n_lists (int): The number of lists, by default the square root of the number of items.
+        - n_probe (int): The number of lists scored per query.
+        - max_iter (int): The maximum number of iterations of the k-means.
+        - training_size (int): The maximum number of items per list the k-means is trained on.
+        - seed (int): The seed of the k-means.
+    """
+
+    def __init__(self, n_lists=None, n_probe=8, max_iter=20, training_size=256, seed=0):
+        """
+        Initialize the IVFIndex object.
+
+        Parameters:
+            - n_lists (int): The number of lists, by default the square root of the number of items.
+            - n_probe (int): The number of lists scored per query.
+            - max_iter (int): The maximum number of iterations of the k-means.
+            - training_size (int): The maximum number of items per list the k-means is trained on.
+            - seed (int): The seed of the k-means.
+        """
+        self.n_lists = n_lists
+        self.n_probe = n_probe
+        self.max_iter = max_iter
+        self.training_size = training_size
+        self.seed = seed
+
+    def fit(self, item_factors):
+        """
+        Cluster the items into lists.
+
+        Parameters:
+            - item_factors (ndarray): The (items x rank) latent factors of the items.
+
+        Returns:
+            - self (IVFIndex): The fitted index.
+        """
+        rng = np.random.default_rng(self.seed)
+        number_of_items = len(item_factors)
+        number_of_lists = min(self.n_lists or max(1, int(round(np.sqrt(number_of_items)))), max(number_of_items, 1))
+
+        norms = np.linalg.norm(np.asarray(item_factors, dtype=np.float32), axis=1)
+        self.max_norm_ = max(float(norms.max(initial=0)), 1e-12)
+        augmented = augment_item_factors(item_factors, self.max_norm_)
+
+        # the k-means is trained on a sample, then every item is assigned to its nearest centroid
+        training_items = rng.choice(number_of_items, min(number_of_items, self.training_size * number_of_lists),
+                                    replace=False)
+        self.centroids_ = spherical_kmeans(augmented[training_items], number_of_lists, self.max_iter, rng)
+        self.build_lists(assign_to_centroids(augmented, self.centroids_))
+
+        return self
+
+    def build_lists(self, item_lists):
+        """
+        Group the item positions by list, from the list of each item.
+        """
+        self.item_lists_ = item_lists
+        self.list_items_ = np.argsort(item_lists, kind='stable').astype(np.int32)
+        self.list_offsets_ = np.concatenate([[0], np.cumsum(np.bincount(item_lists, minlength=len(self.centroids_)))])
+
+        # the position of each item inside its list
+        self.item_slots_ = np.empty(len(item_lists), dtype=np.int32)
+        self.item_slots_[self.list_items_] = np.arange(len(item_lists)) - self.list_offsets_[item_lists[self.list_items_]]
+
+    def update(self, items, item_factors):
+        """
+        Assign new or updated items to the lists, without moving the centroids.
+
+        Parameters:
+            - items (ndarray): The positions of the items, the new ones after the indexed ones.
+            - item_factors (ndarray): The latent factors of every item.
+        """
+        items = np.asarray(items, dtype=np.intp)
+        item_lists = np.zeros(len(item_factors), dtype=np.int32)
+        item_lists[:len(self.item_lists_)] = self.item_lists_
+        item_lists[items] = assign_to_centroids(augment_item_factors(item_factors[items], self.max_norm_),
+                                                self.centroids_)
+        self.build_lists(item_lists)
+
+    def search(self, user_factors, item_factors, n, exclude=None, n_probe=None):
+        """
+        Get the n items with the highest inner product with each user, among the items of the probed lists.
+
+        The users probing a list are scored against its items in one matrix product, and only the best n items
+        of each list are kept per user before the final exact ranking.
+
+        Parameters:
+            - user_factors (ndarray): A (users x rank) array with the latent factors of the users.
+            - item_factors (ndarray): The (items x rank) latent factors of the indexed items.
+            - n (int): The number of items to get per user.
+            - exclude (csr_matrix): An optional (users x items) matrix, whose non-zero entries are never recommended.
+            - n_probe (int): The number of lists to score per user, n_probe of the index by default.
+
+        Returns:
+            - indices (ndarray): A (users x n) array of item indices, from the best to the worst, padded with -1
+                                 when the probed lists have fewer than n items that are not excluded.
+        """
+        number_of_users = len(user_factors)
+        rank = user_factors.shape[1]
+        n_probe = min(n_probe or self.n_probe, len(self.centroids_))
+
+        # the lists of each user, and the users of each list
+        probes = top_n_indices(user_factors @ self.centroids_[:, :rank].T, n_probe)
+        probed_lists = probes.ravel()
+        order = np.argsort(probed_lists, kind='stable')
+        probed_lists = probed_lists[order]
+        probing_users, probe_ranks = np.divmod(order, n_probe)
+        list_starts = np.searchsorted(probed_lists, np.arange(len(self.centroids_) + 1))
+
+        # the excluded entries of the probed lists, grouped by list
+        if exclude is not None:
+            exclude = exclude.tocoo()
+            excluded_lists = self.item_lists_[exclude.col]
+            excluded_order = np.argsort(excluded_lists, kind='stable')
+            excluded_rows, excluded_columns = exclude.row[excluded_order], exclude.col[excluded_order]
+            excluded_starts = np.searchsorted(excluded_lists[excluded_order], np.arange(len(self.centroids_) + 1))
+
+        candidate_indices = np.full((number_of_users, n_probe * n), -1, dtype=np.intp)
+        candidate_scores = np.full((number_of_users, n_probe * n), -np.inf, dtype=np.float32)
+        local_rows = np.full(number_of_users, -1, dtype=np.intp)
+
+        for list_id in np.unique(probed_lists):
+            users = probing_users[list_starts[list_id]:list_starts[list_id + 1]]
+            items = self.list_items_[self.list_offsets_[list_id]:self.list_offsets_[list_id + 1]]
+            if len(items) == 0:
+                continue
+            scores = user_factors[users] @ item_factors[items].T
+
+            if exclude is not None:
+                rows = excluded_rows[excluded_starts[list_id]:excluded_starts[list_id + 1]]
+                columns = excluded_columns[excluded_starts[list_id]:excluded_starts[list_id + 1]]
+                local_rows[users] = np.arange(len(users))
+                probing = local_rows[rows] >= 0
+                scores[local_rows[rows[probing]], self.item_slots_[columns[probing]]] = -np.inf
+                local_rows[users] = -1
+
+            best = top_n_indices(scores, n)
+            slots = probe_ranks[list_starts[list_id]:list_starts[list_id + 1], None] * n + np.arange(best.shape[1])
+            candidate_indices[users[:, None], slots] = items[best]
+            candidate_scores[users[:, None], slots] = np.take_along_axis(scores, best, axis=1)
+
+        selected = top_n_indices(candidate_scores, n)
+        indices = np.take_along_axis(candidate_indices, selected, axis=1)
+        indices[np.take_along_axis(candidate_scores, selected, axis=1) == -np.inf] = -1
+        return indices
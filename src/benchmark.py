@@ -0,0 +1,712 @@
+import argparse
+import os
+import resource
+import tempfile
+import time
+import tracemalloc
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+
+import numpy as np
+import pandas as pd
+
+from scipy.sparse import csr_matrix, random as sparse_random
+from sklearn.decomposition import TruncatedSVD
+
+from als import ALS
+from ann_index import IVFIndex
+from category_index import CategoryIndex
+from category_profiles import is_relevant_to_categories
+from content_model import ContentModel
+from community_detection import communities_to_labels, conductance, label_propagation, louvain, modularity
+from data_sources import ParquetDataSource, PickleDataSource
+from instrumentation import instrumentation, timer
+from graph_analytics import degree_centrality, to_networkx, top_and_bottom_k
+from evaluation import recall_at_k, split_reviews
+from pagerank import pagerank
+from recommender_system import RecommenderSystem
+from ranking import blocked_top_n
+from recommendation_cache import RecommendationCache
+from sampling import build_friend_graph, sample_users
+from review_graph import ReviewGraph
+from user_item_matrix import build_user_item_matrix
+
+
+def make_synthetic_reviews(number_of_reviews, number_of_users, number_of_businesses, seed=0, with_text=False):
+    """
+    Make a synthetic review table with the columns used by the recommender system.
+
+    The businesses follow a Zipf-like popularity, so a few of them get most of the reviews as in the Yelp data.
+
+    Parameters:
+        - number_of_reviews (int): The number of reviews to generate.
+        - number_of_users (int): The number of different users.
+        - number_of_businesses (int): The number of different businesses.
+        - seed (int): The seed of the random generator.
+        - with_text (bool): Whether to add the 'text' and 'date' columns of the full review table.
+
+    Returns:
+        - reviews (DataFrame): A DataFrame with the 'user_id', 'business_id' and 'stars' columns.
+    """
+    rng = np.random.default_rng(seed)
+
+    user_codes = rng.integers(0, number_of_users, number_of_reviews)
+    business_codes = (rng.zipf(1.3, number_of_reviews) - 1) % number_of_businesses
+
+    reviews = pd.DataFrame({
+        'user_id': pd.Index(np.arange(number_of_users)).map('u{:021d}'.format)[user_codes],
+        'business_id': pd.Index(np.arange(number_of_businesses)).map('b{:021d}'.format)[business_codes],
+        'stars': rng.integers(1, 6, number_of_reviews)
+    })
+
+    if with_text:
+        words = np.array(['good', 'bad', 'great', 'service', 'food', 'friendly', 'slow', 'tasty', 'cheap', 'place'])
+        sentences = [' '.join(rng.choice(words, 100)) for _ in range(1000)]
+        reviews['text'] = np.array(sentences, dtype=object)[rng.integers(0, len(sentences), number_of_reviews)]
+        reviews['date'] = pd.Timestamp('2010-01-01') + pd.to_timedelta(rng.integers(0, 4000, number_of_reviews), 'D')
+
+    return reviews
+
+
+def measure(function, *args, **kwargs):
+    """
+    Run a function and measure its wall time and peak traced memory.
+
+    Returns:
+        - result: The value returned by the function.
+        - elapsed_time (float): The wall time in seconds.
+        - peak_memory (int): The peak memory allocated during the call, in bytes.
+    """
+    tracemalloc.start()
+    start_time = time.perf_counter()
+    result = function(*args, **kwargs)
+    elapsed_time = time.perf_counter() - start_time
+    _, peak_memory = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, elapsed_time, peak_memory
+
+
+def benchmark_user_item_matrix(number_of_reviews=1_000_000, number_of_users=100_000, number_of_businesses=50_000,
+                               max_dense_bytes=4 * 1024 ** 3):
+    """
+    Compare the sparse user-item matrix against the dense pivot table on synthetic reviews.
+
+    The pivot table is skipped (and its size only estimated) when the dense matrix would not fit in max_dense_bytes.
+    """
+    reviews = make_synthetic_reviews(number_of_reviews, number_of_users, number_of_businesses)
+    print('Reviews: {}, users: {}, businesses: {}'.format(
+        len(reviews), reviews['user_id'].nunique(), reviews['business_id'].nunique()))
+
+    (matrix, _, _), elapsed_time, peak_memory = measure(build_user_item_matrix, reviews)
+    matrix_bytes = matrix.data.nbytes + matrix.indices.nbytes + matrix.indptr.nbytes
+    print('Sparse CSR: {:.2f} s, peak {:.1f} MB, matrix {:.1f} MB, density {:.5%}'.format(
+        elapsed_time, peak_memory / 1024 ** 2, matrix_bytes / 1024 ** 2, matrix.nnz / np.prod(matrix.shape)))
+
+    dense_bytes = matrix.shape[0] * matrix.shape[1] * 8
+    if dense_bytes > max_dense_bytes:
+        print('Dense pivot: skipped, the matrix alone would take {:.1f} GB'.format(dense_bytes / 1024 ** 3))
+        return
+
+    pivot, elapsed_time, peak_memory = measure(
+        reviews.pivot_table, index='user_id', columns='business_id', values='stars', aggfunc='mean', fill_value=0)
+    print('Dense pivot: {:.2f} s, peak {:.1f} MB, matrix {:.1f} MB'.format(
+        elapsed_time, peak_memory / 1024 ** 2, pivot.memory_usage(deep=False).sum() / 1024 ** 2))
+
+
+def benchmark_svd_scoring(catalog_sizes=(10_000, 100_000, 1_000_000), rank=10, number_of_recommendations=10,
+                          number_of_users=100, batch_size=1024):
+    """
+    Measure the latency per user of the latent-factor scoring of every business, for several catalog sizes.
+
+    Each user has 50 rated businesses, which are masked out of the recommendations.
+    """
+    rng = np.random.default_rng(0)
+
+    for number_of_items in catalog_sizes:
+        item_factors = rng.standard_normal((number_of_items, rank), dtype=np.float32)
+        user_factors = rng.standard_normal((batch_size, rank), dtype=np.float32)
+        rated_items = sparse_random(batch_size, number_of_items, density=50 / number_of_items, format='csr', rng=rng)
+
+        start_time = time.perf_counter()
+        for user in range(number_of_users):
+            blocked_top_n(user_factors[[user]], item_factors, number_of_recommendations, exclude=rated_items[[user]])
+        single_latency = (time.perf_counter() - start_time) / number_of_users
+
+        start_time = time.perf_counter()
+        blocked_top_n(user_factors, item_factors, number_of_recommendations, exclude=rated_items)
+        batch_latency = (time.perf_counter() - start_time) / batch_size
+
+        print('{:>9} items: {:8.3f} ms per user one by one, {:8.3f} ms per user in batches of {}'.format(
+            number_of_items, single_latency * 1000, batch_latency * 1000, batch_size))
+
+
+def peak_rss():
+    """
+    Get the peak resident set size of the current process, in bytes.
+
+    On Linux it is read from /proc, because ru_maxrss survives exec and would report the parent's peak.
+    """
+    if os.path.exists('/proc/self/status'):
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) * 1024
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def measure_load(data_source, columns, filters):
+    """
+    Load the reviews from a data source, meant to run in a fresh process.
+
+    Returns:
+        - elapsed_time (float): The load time in seconds.
+        - peak_rss (int): The peak resident set size of the process, in bytes.
+        - number_of_rows (int): The number of loaded reviews.
+    """
+    start_time = time.perf_counter()
+    reviews = data_source.read('reviews', columns=columns, filters=filters)
+    elapsed_time = time.perf_counter() - start_time
+    return elapsed_time, peak_rss(), len(reviews)
+
+
+def benchmark_data_loading(number_of_reviews=1_000_000):
+    """
+    Compare the cold-start load time and peak RSS of the reviews for the pickle and Parquet data sources.
+
+    Every load runs in a new process, so nothing is cached between them.
+    """
+    with tempfile.TemporaryDirectory() as data_dir:
+        reviews = make_synthetic_reviews(number_of_reviews, 100_000, 50_000, with_text=True)
+        PickleDataSource(data_dir).write('reviews', reviews)
+        ParquetDataSource(data_dir).write('reviews', reviews)
+        del reviews
+
+        columns = ['user_id', 'business_id', 'stars']
+        cases = [
+            ('pickle, every column', PickleDataSource(data_dir), None, None),
+            ('pickle, projected', PickleDataSource(data_dir), columns, None),
+            ('parquet, every column', ParquetDataSource(data_dir), None, None),
+            ('parquet, projected', ParquetDataSource(data_dir), columns, None),
+            ('parquet, projected, stars >= 4', ParquetDataSource(data_dir), columns, [('stars', '>=', 4)])
+        ]
+
+        for name, data_source, columns, filters in cases:
+            with ProcessPoolExecutor(max_workers=1, mp_context=get_context('spawn')) as executor:
+                elapsed_time, peak_rss, number_of_rows = executor.submit(
+                    measure_load, data_source, columns, filters).result()
+            print('{:<32} {:6.2f} s, peak RSS {:7.1f} MB, {} rows'.format(
+                name, elapsed_time, peak_rss / 1024 ** 2, number_of_rows))
+
+        print('File sizes: pickle {:.1f} MB, parquet {:.1f} MB'.format(
+            os.path.getsize(PickleDataSource(data_dir).path('reviews')) / 1024 ** 2,
+            os.path.getsize(ParquetDataSource(data_dir).path('reviews')) / 1024 ** 2))
+
+
+def notebook_pagerank(adjacency, damping=0.85, iterations=100):
+    """
+    The PageRank of the sna.ipynb notebook: a dense transition matrix filled cell by cell, then 100 iterations.
+    """
+    A = adjacency.todense()
+    n = A.shape[0]
+    P = np.zeros((n, n))
+    for i in range(n):
+        for j in range(n):
+            if A[i, j] > 0:
+                P[i, j] = A[i, j] / A[i, :].sum()
+
+    r = np.ones((n, 1)) / n
+    for _ in range(iterations):
+        r = damping * P.T @ r + (1 - damping) / n
+    return np.asarray(r).ravel()
+
+
+def benchmark_pagerank(sizes=((2_000, 200, 100), (20_000, 1_000, 500), (1_000_000, 100_000, 50_000)),
+                       max_notebook_nodes=1_500):
+    """
+    Compare the sparse PageRank against the dense notebook version on synthetic review graphs.
+
+    The notebook version is quadratic in the number of nodes, so it only runs on the small graphs.
+    """
+    for number_of_reviews, number_of_users, number_of_businesses in sizes:
+        graph = ReviewGraph.from_reviews(
+            make_synthetic_reviews(number_of_reviews, number_of_users, number_of_businesses))
+        adjacency = graph.adjacency
+        print('{} nodes, {} edges:'.format(graph.number_of_nodes, graph.biadjacency.nnz))
+
+        ranks, elapsed_time, peak_memory = measure(pagerank, adjacency)
+        print('    sparse:   {:8.3f} s, peak {:8.1f} MB'.format(elapsed_time, peak_memory / 1024 ** 2))
+
+        if graph.number_of_nodes > max_notebook_nodes:
+            print('    notebook: skipped, the dense matrices alone would take {:.1f} GB'.format(
+                2 * 8 * graph.number_of_nodes ** 2 / 1024 ** 3))
+            continue
+
+        notebook_ranks, elapsed_time, peak_memory = measure(notebook_pagerank, adjacency)
+        print('    notebook: {:8.3f} s, peak {:8.1f} MB, max difference {:.2e}'.format(
+            elapsed_time, peak_memory / 1024 ** 2, np.abs(ranks - notebook_ranks).max()))
+
+
+def notebook_degree_centrality(B):
+    """
+    The degree centrality of the sna.ipynb notebook: nx.degree_centrality of the whole graph recomputed for every node.
+    """
+    import networkx as nx
+
+    degree_centrality = {}
+    for node in B.nodes():
+        degree_centrality[node] = nx.degree_centrality(B)[node]
+    return degree_centrality
+
+
+def sparse_degree_rankings(graph, k):
+    """
+    The degree centrality of every node, with the top and bottom k users and businesses.
+    """
+    centrality = degree_centrality(graph)
+    return centrality, top_and_bottom_k(graph, centrality, k)
+
+
+def benchmark_centrality(sizes=((2_000, 200, 100), (20_000, 1_000, 500), (1_000_000, 100_000, 50_000)),
+                         max_notebook_nodes=1_500, k=10):
+    """
+    Compare the sparse degree centrality and top/bottom k selection against the per-node notebook loop.
+
+    The notebook loop is quadratic in the number of nodes, so it only runs on the small graphs.
+    """
+    for number_of_reviews, number_of_users, number_of_businesses in sizes:
+        graph = ReviewGraph.from_reviews(
+            make_synthetic_reviews(number_of_reviews, number_of_users, number_of_businesses))
+        print('{} nodes, {} edges:'.format(graph.number_of_nodes, graph.biadjacency.nnz))
+
+        (centrality, _), elapsed_time, peak_memory = measure(sparse_degree_rankings, graph, k)
+        print('    sparse:   {:8.3f} s, peak {:8.1f} MB'.format(elapsed_time, peak_memory / 1024 ** 2))
+
+        if graph.number_of_nodes > max_notebook_nodes:
+            print('    notebook: skipped, quadratic in the number of nodes')
+            continue
+
+        B = to_networkx(graph)
+        notebook_centrality, elapsed_time, peak_memory = measure(notebook_degree_centrality, B)
+        print('    notebook: {:8.3f} s, peak {:8.1f} MB, max difference {:.2e}'.format(
+            elapsed_time, peak_memory / 1024 ** 2,
+            np.abs(centrality - np.array([notebook_centrality[node] for node in graph.node_ids])).max()))
+
+
+def benchmark_communities(sizes=((2_000, 200, 100), (30_000, 1_000, 3_000), (1_000_000, 100_000, 50_000)),
+                          max_notebook_nodes=5_000):
+    """
+    Compare the sparse label propagation and Louvain against the networkx community detection of the notebook,
+    by time and by the modularity and mean conductance of the communities.
+
+    The networkx greedy modularity is too slow for the large graph, so it only runs on the small ones.
+    """
+    from networkx.algorithms.community import asyn_lpa_communities, greedy_modularity_communities
+
+    for number_of_reviews, number_of_users, number_of_businesses in sizes:
+        graph = ReviewGraph.from_reviews(
+            make_synthetic_reviews(number_of_reviews, number_of_users, number_of_businesses))
+        print('{} nodes, {} edges:'.format(graph.number_of_nodes, graph.biadjacency.nnz))
+
+        methods = {'label propagation': lambda: label_propagation(graph), 'louvain': lambda: louvain(graph)}
+        if graph.number_of_nodes <= max_notebook_nodes:
+            B = to_networkx(graph)
+            methods['networkx lpa'] = lambda: communities_to_labels(list(asyn_lpa_communities(B, seed=0)),
+                                                                    graph.node_ids)
+            methods['networkx greedy'] = lambda: communities_to_labels(list(greedy_modularity_communities(B)),
+                                                                       graph.node_ids)
+
+        for name, detect in methods.items():
+            labels, elapsed_time, peak_memory = measure(detect)
+            # a single community holding every edge has no conductance
+            conductances = conductance(graph, labels)
+            conductances = conductances[~np.isnan(conductances)]
+            print('    {:18} {:8.3f} s, peak {:8.1f} MB, {:6} communities, modularity {:.4f}, '
+                  'mean conductance {:.4f}'.format(name + ':', elapsed_time, peak_memory / 1024 ** 2,
+                                                   labels.max() + 1, modularity(graph, labels),
+                                                   conductances.mean() if len(conductances) else np.nan))
+
+
+def make_synthetic_users(number_of_users, number_of_friends=20, seed=0):
+    """
+    Make a user table whose friends are comma separated strings of random user IDs, as in the raw dataset.
+    """
+    rng = np.random.default_rng(seed)
+    user_ids = np.array(['u{:021d}'.format(i) for i in range(number_of_users)], dtype=object)
+    friends = rng.integers(0, number_of_users, (number_of_users, number_of_friends))
+    return pd.DataFrame({'user_id': user_ids, 'friends': [', '.join(user_ids[row]) for row in friends]})
+
+
+def notebook_sample_users(users, initial_users, max_sample_size):
+    """
+    The snowball sample of the sna.ipynb notebook: a scan of the user table for every expanded user.
+    """
+    sample_users = users[users['user_id'].isin(initial_users)]
+    users_to_expand = set(initial_users)
+
+    while len(sample_users) < max_sample_size and len(users_to_expand) > 0:
+        user_to_expand = users_to_expand.pop()
+        friends = users[users['user_id'] == user_to_expand]['friends'].iloc[0]
+        if friends is not None:
+            friends = friends.split(', ')
+            sample_users = pd.concat([sample_users, users[users['user_id'].isin(friends)]])
+            users_to_expand.update(friends)
+
+    sample_users = sample_users.iloc[:max_sample_size]
+    sample_users['friends'] = sample_users['friends'].apply(
+        lambda x: [f for f in x.split(', ') if f in sample_users['user_id'].values])
+    return sample_users
+
+
+def benchmark_sampling(sizes=((100_000, 1_000), (1_000_000, 100_000)), max_notebook_sample=1_000):
+    """
+    Compare the sparse snowball samplers against the notebook sampling loop on synthetic friend lists.
+    """
+    for number_of_users, sample_size in sizes:
+        users = make_synthetic_users(number_of_users)
+        print('{} users, sample of {}:'.format(number_of_users, sample_size))
+
+        # timed without tracemalloc, which slows down the allocation of the parsed strings several times over
+        start_time = time.perf_counter()
+        adjacency, user_ids = build_friend_graph(users)
+        print('    parse friends: {:8.3f} s'.format(time.perf_counter() - start_time))
+
+        for method in ('bfs', 'random_walk'):
+            _, elapsed_time, peak_memory = measure(sample_users, adjacency, [0], sample_size, method)
+            print('    {:13}  {:8.3f} s, peak {:8.1f} MB'.format(method + ':', elapsed_time, peak_memory / 1024 ** 2))
+
+        if sample_size > max_notebook_sample:
+            continue
+
+        _, elapsed_time, peak_memory = measure(notebook_sample_users, users, [user_ids[0]], sample_size)
+        print('    notebook:      {:8.3f} s, peak {:8.1f} MB'.format(elapsed_time, peak_memory / 1024 ** 2))
+
+
+def make_recommender_system(model_type, reviews):
+    """
+    Make a recommender system over a review table, without loading any file.
+    """
+    rs = RecommenderSystem(model_type, load=False)
+    rs.reviews = reviews
+    rs.businesses = pd.DataFrame({'business_id': pd.unique(reviews['business_id']), 'categories': None})
+    rs.preprocess_data()
+    return rs
+
+
+def mean_recall(rs, relevant, user_ids, k=10):
+    """
+    The mean recall@k of the recommendations of some users, for their relevant held-out businesses.
+    """
+    recommendations = rs.make_recommendations_batch(user_ids, k).to_numpy()
+    return np.mean([recall_at_k(list(recommended), relevant[user_id], k)
+                    for user_id, recommended in zip(user_ids, recommendations)])
+
+
+def benchmark_incremental(number_of_reviews=1_000_000, number_of_users=100_000, number_of_businesses=50_000,
+                          initial_fraction=0.9, batch_size=1_000, number_of_evaluated_users=2_000, k=10):
+    """
+    Measure the latency of add_reviews per batch of reviews, and the quality of the incrementally updated models
+    against a full refit on the same reviews.
+
+    The models are fitted on the first reviews of a training split, the remaining training reviews are added
+    batch by batch, and both models are evaluated by their recall@k of the held-out reviews with 4 or 5 stars.
+    """
+    reviews = make_synthetic_reviews(number_of_reviews, number_of_users, number_of_businesses)
+    train_reviews, test_reviews = split_reviews(reviews, test_fraction=0.1)
+    train_reviews = train_reviews.sample(frac=1, random_state=0)
+    number_of_initial_reviews = int(initial_fraction * len(train_reviews))
+
+    positive_reviews = test_reviews[test_reviews['stars'] >= 4]
+    relevant = positive_reviews.groupby('user_id')['business_id'].agg(set).to_dict()
+    user_ids = list(pd.Series(sorted(relevant)).sample(min(number_of_evaluated_users, len(relevant)), random_state=0))
+
+    for model_type in ('svd', 'knn'):
+        rs = make_recommender_system(model_type, train_reviews.iloc[:number_of_initial_reviews])
+        rs.build_recommender_system()
+
+        latencies = []
+        for start in range(number_of_initial_reviews, len(train_reviews), batch_size):
+            start_time = time.perf_counter()
+            rs.add_reviews(train_reviews.iloc[start:start + batch_size], refit_threshold=None)
+            latencies.append(time.perf_counter() - start_time)
+        incremental_recall = mean_recall(rs, relevant, user_ids, k)
+
+        full = make_recommender_system(model_type, train_reviews)
+        start_time = time.perf_counter()
+        full.build_recommender_system()
+        refit_time = time.perf_counter() - start_time
+
+        print('{}: {} batches of {} reviews, latency p50 {:.1f} ms, p99 {:.1f} ms, full refit {:.1f} s'.format(
+            model_type, len(latencies), batch_size, 1000 * np.percentile(latencies, 50),
+            1000 * np.percentile(latencies, 99), refit_time))
+        print('    recall@{}: incremental {:.4f}, full refit {:.4f}'.format(
+            k, incremental_recall, mean_recall(full, relevant, user_ids, k)))
+
+
+def benchmark_recommendation_cache(number_of_reviews=1_000_000, number_of_users=100_000, number_of_businesses=50_000,
+                                   number_of_requests=20_000, cache_sizes=(0, 1_000, 10_000), ttl=None, seed=0):
+    """
+    Measure the latency of make_recommendations for a skewed stream of requests, with caches of several sizes.
+
+    The users are requested with Zipf-like frequencies, as a few active users make most of the requests,
+    and each request asks for 5, 10 or 20 recommendations, so the smaller ones can be served as prefixes.
+    """
+    reviews = make_synthetic_reviews(number_of_reviews, number_of_users, number_of_businesses)
+    rs = make_recommender_system('svd', reviews)
+    rs.build_recommender_system()
+
+    rng = np.random.default_rng(seed)
+    popularity = 1 / np.arange(1, len(rs.user_ids) + 1)
+    requested_users = rs.user_ids.to_numpy()[rng.choice(len(rs.user_ids), number_of_requests,
+                                                        p=popularity / popularity.sum())]
+    requested_sizes = rng.choice([5, 10, 20], number_of_requests)
+
+    for cache_size in cache_sizes:
+        rs.recommendation_cache = RecommendationCache(cache_size, ttl) if cache_size else None
+        latencies = np.empty(number_of_requests)
+        for i, (user_id, number_of_recommendations) in enumerate(zip(requested_users, requested_sizes)):
+            start_time = time.perf_counter()
+            rs.make_recommendations(user_id, number_of_recommendations)
+            latencies[i] = time.perf_counter() - start_time
+
+        stats = rs.get_cache_stats() or {'hit_rate': 0.0, 'evictions': 0}
+        print('cache size {}: {:.0f} requests/s, p50 {:.3f} ms, p99 {:.3f} ms, hit rate {:.3f}, {} evictions'.format(
+            cache_size, number_of_requests / latencies.sum(), 1000 * np.percentile(latencies, 50),
+            1000 * np.percentile(latencies, 99), stats['hit_rate'], stats['evictions']))
+
+
+def make_clustered_factors(number_of_items, rank=10, number_of_clusters=100, spread=0.3, seed=0):
+    """
+    Make latent factors grouped around random centers, as the factors of businesses of similar categories.
+    """
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(number_of_clusters, rank))
+    return (centers[rng.integers(0, number_of_clusters, number_of_items)] +
+            spread * rng.normal(size=(number_of_items, rank))).astype(np.float32)
+
+
+def benchmark_ann_index(catalog_sizes=(10_000, 100_000, 1_000_000), probes=(1, 4, 16, 64), rank=10,
+                        number_of_recommendations=10, batch_sizes=(1, 256), number_of_queries=256, seed=0):
+    """
+    Compare the recall@n and the latency of the IVF index with the exhaustive blocked_top_n scan of the svd mode,
+    for growing catalogs, batches of users and numbers of probed lists.
+    """
+    rng = np.random.default_rng(seed)
+    user_factors = rng.normal(size=(number_of_queries, rank)).astype(np.float32)
+
+    for number_of_items in catalog_sizes:
+        item_factors = make_clustered_factors(number_of_items, rank, seed=seed)
+        start_time = time.perf_counter()
+        index = IVFIndex(seed=seed).fit(item_factors)
+        print('{} items: index of {} lists built in {:.2f} s'.format(number_of_items, len(index.centroids_),
+                                                                    time.perf_counter() - start_time))
+
+        exact = blocked_top_n(user_factors, item_factors, number_of_recommendations)
+        for batch_size in batch_sizes:
+            def search_batches(search):
+                start_time = time.perf_counter()
+                results = [search(user_factors[start:start + batch_size])
+                           for start in range(0, number_of_queries, batch_size)]
+                return np.vstack(results), 1000 * (time.perf_counter() - start_time) * batch_size / number_of_queries
+
+            _, exhaustive_time = search_batches(
+                lambda users: blocked_top_n(users, item_factors, number_of_recommendations))
+            print('    batch of {}: exhaustive {:.2f} ms'.format(batch_size, exhaustive_time))
+
+            for n_probe in probes:
+                found, ann_time = search_batches(
+                    lambda users: index.search(users, item_factors, number_of_recommendations, n_probe=n_probe))
+                recall = np.mean([len(np.intersect1d(a, b)) for a, b in zip(found, exact)]) / number_of_recommendations
+                print('        {} probes: {:.2f} ms, recall@{} {:.3f}'.format(n_probe, ann_time,
+                                                                            number_of_recommendations, recall))
+
+
+def make_synthetic_businesses(number_of_businesses, number_of_categories=1_300, max_categories=6, seed=0):
+    """
+    Make a synthetic business table with comma separated categories, drawn from a vocabulary with Zipf-like
+    frequencies as the categories of Yelp.
+    """
+    rng = np.random.default_rng(seed)
+    vocabulary = np.array(['Category {}'.format(i) for i in range(number_of_categories)], dtype=object)
+    popularity = 1 / np.arange(1, number_of_categories + 1)
+    categories = [', '.join(pd.unique(rng.choice(vocabulary, rng.integers(1, max_categories + 1),
+                                                 p=popularity / popularity.sum())))
+                  for _ in range(number_of_businesses)]
+    return pd.DataFrame({'business_id': ['b{:021d}'.format(i) for i in range(number_of_businesses)],
+                         'categories': categories}), vocabulary
+
+
+def benchmark_categories(number_of_businesses=150_000, number_of_users=10_000, number_of_pairs=100_000,
+                         number_of_top_categories=10, seed=0):
+    """
+    Compare the category index with the loops it replaces: counting the categories, checking the relevance of
+    many (user, business) pairs from the top categories of the users and getting the businesses of some categories.
+    """
+    businesses, vocabulary = make_synthetic_businesses(number_of_businesses, seed=seed)
+    rng = np.random.default_rng(seed)
+
+    start_time = time.perf_counter()
+    index = CategoryIndex(businesses)
+    print('index of {} categories built in {:.2f} s'.format(len(index), time.perf_counter() - start_time))
+
+    start_time = time.perf_counter()
+    categories = set()
+    for _, business in businesses.iterrows():
+        categories.update(business['categories'].split(', '))
+    print('count: iterrows {:.3f} s ({} categories), index {} categories'.format(
+        time.perf_counter() - start_time, len(categories), index.count_categories()))
+
+    business_ids = businesses['business_id'].to_numpy()[rng.integers(0, number_of_businesses, number_of_pairs)]
+    owners = rng.integers(0, number_of_users, number_of_pairs)
+    top_categories = [list(rng.choice(vocabulary[:200], number_of_top_categories, replace=False))
+                      for _ in range(number_of_users)]
+    business_categories = dict(zip(businesses['business_id'], businesses['categories'].str.split(', ')))
+
+    start_time = time.perf_counter()
+    expected = [is_relevant_to_categories(business_categories[business_id], top_categories[owner])
+                for business_id, owner in zip(business_ids, owners)]
+    loop_time = time.perf_counter() - start_time
+    start_time = time.perf_counter()
+    is_relevant = index.are_relevant(business_ids, top_categories, owners)
+    index_time = time.perf_counter() - start_time
+    print('relevance of {} pairs: loops {:.3f} s, index {:.3f} s, same results: {}'.format(
+        number_of_pairs, loop_time, index_time, bool((is_relevant == np.array(expected)).all())))
+
+    start_time = time.perf_counter()
+    mask = index.get_business_mask(vocabulary[:2], index.business_ids)
+    print('mask of the businesses of 2 categories ({} businesses): {:.2f} ms'.format(
+        mask.sum(), 1000 * (time.perf_counter() - start_time)))
+
+
+def make_low_rank_ratings(number_of_ratings, number_of_users, number_of_businesses, rank=10, noise=0.5, seed=0):
+    """
+    Make a sparse matrix of ratings from 1 to 5 with a low-rank structure: the rating of a user for a business is
+    3 plus the dot product of random user and business factors plus noise, rounded and clipped. The businesses
+    follow the Zipf-like popularity of make_synthetic_reviews, and each pair is rated at most once.
+    """
+    rng = np.random.default_rng(seed)
+    user_factors = rng.normal(size=(number_of_users, rank)) / rank ** 0.25
+    business_factors = rng.normal(size=(number_of_businesses, rank)) / rank ** 0.25
+
+    pairs = np.unique(rng.integers(0, number_of_users, number_of_ratings) * number_of_businesses +
+                      (rng.zipf(1.3, number_of_ratings) - 1) % number_of_businesses)
+    rows, columns = np.divmod(pairs, number_of_businesses)
+    scores = 3 + np.einsum('ij,ij->i', user_factors[rows], business_factors[columns])
+    stars = np.clip(np.rint(scores + noise * rng.normal(size=len(pairs))), 1, 5)
+    return csr_matrix((stars, (rows, columns)), shape=(number_of_users, number_of_businesses))
+
+
+def benchmark_als(number_of_ratings=1_000_000, number_of_users=100_000, number_of_businesses=50_000, ranks=(10, 32),
+                  test_fraction=0.1, n_jobs=(1, -1), seed=0):
+    """
+    Compare the fit time and the RMSE of held-out ratings of the ALS model and of the TruncatedSVD baseline,
+    on low-rank synthetic ratings, with the ALS blocks solved by one thread and by every core.
+
+    TruncatedSVD fits the unrated pairs as zero ratings, so its predictions of the held-out ratings are shrunk
+    towards zero; ALS only fits the known ratings. The RMSE of the mean rating is printed for reference.
+    """
+    ratings = make_low_rank_ratings(number_of_ratings, number_of_users, number_of_businesses, seed=seed).tocoo()
+    held_out = np.random.default_rng(seed).random(ratings.nnz) < test_fraction
+    train = csr_matrix((ratings.data[~held_out], (ratings.row[~held_out], ratings.col[~held_out])),
+                       shape=ratings.shape)
+    rows, columns, stars = ratings.row[held_out], ratings.col[held_out], ratings.data[held_out]
+
+    def rmse(user_factors, business_factors, mean=0.0):
+        predictions = mean + np.einsum('ij,ij->i', user_factors[rows], business_factors[columns])
+        return np.sqrt(np.mean((stars - predictions) ** 2))
+
+    print('{} train ratings, {} held out, mean rating RMSE {:.4f}'.format(
+        train.nnz, len(stars), np.sqrt(np.mean((stars - train.data.mean()) ** 2))))
+    for rank in ranks:
+        start_time = time.perf_counter()
+        svd = TruncatedSVD(n_components=rank, random_state=seed).fit(train)
+        svd_time = time.perf_counter() - start_time
+        print('rank {}: TruncatedSVD {:8.2f} s, RMSE {:.4f}'.format(
+            rank, svd_time, rmse(svd.transform(train), svd.components_.T)))
+
+        for jobs in n_jobs:
+            start_time = time.perf_counter()
+            als = ALS(rank=rank, n_jobs=jobs, seed=seed).fit(train)
+            als_time = time.perf_counter() - start_time
+            print('        ALS n_jobs={:<3} {:8.2f} s, RMSE {:.4f}, {} iterations, validation RMSE {:.4f}'.format(
+                jobs, als_time, rmse(als.user_factors_, als.item_factors_, als.mean_), als.n_iter_, min(als.history_)))
+
+        start_time = time.perf_counter()
+        als = ALS(rank=rank, implicit=True, n_jobs=n_jobs[-1], seed=seed).fit(train)
+        print('        implicit ALS  {:8.2f} s, {} iterations'.format(time.perf_counter() - start_time, als.n_iter_))
+
+
+def benchmark_content(corpus_sizes=(100_000, 1_000_000), number_of_users=100_000, number_of_businesses=50_000,
+                      n_jobs=(1, -1), chunk_size=10_000, number_of_cold_businesses=1_000, number_of_users_scored=1_000):
+    """
+    Measure the fit time and peak memory of the content model on corpora of growing size, against the size of
+    the text of every review joined into one string as for the word cloud of the notebook, and the latency of
+    scoring the cold-start businesses (with at most 3 reviews) for a batch of users.
+
+    The peak memory is traced in this process, so it is measured with n_jobs=1.
+    """
+    for number_of_reviews in corpus_sizes:
+        reviews = make_synthetic_reviews(number_of_reviews, number_of_users, number_of_businesses, with_text=True)
+        user_ids = pd.Index(pd.unique(reviews['user_id']), name='user_id')
+        business_ids = pd.Index(pd.unique(reviews['business_id']), name='business_id')
+        print('{} reviews, joined text {:.1f} MB'.format(number_of_reviews, reviews['text'].str.len().sum() / 1024 ** 2))
+
+        for jobs in n_jobs:
+            chunks = (reviews.iloc[start:start + chunk_size] for start in range(0, len(reviews), chunk_size))
+            start_time = time.perf_counter()
+            model = ContentModel(chunk_size=chunk_size, n_jobs=jobs).fit(chunks, user_ids, business_ids)
+            print('    n_jobs={:<3} fit {:8.2f} s, profiles {:.1f} MB'.format(
+                jobs, time.perf_counter() - start_time,
+                (model.user_profiles_.data.nbytes + model.business_profiles_.data.nbytes) * 2 / 1024 ** 2))
+
+        # tracemalloc slows the vectorization down, so the peak memory is measured in a separate run
+        chunks = (reviews.iloc[start:start + chunk_size] for start in range(0, len(reviews), chunk_size))
+        _, _, peak_memory = measure(ContentModel(chunk_size=chunk_size).fit, chunks, user_ids, business_ids)
+        print('    peak memory of the fit {:.1f} MB'.format(peak_memory / 1024 ** 2))
+
+        review_counts = reviews['business_id'].value_counts()
+        cold_businesses = business_ids.get_indexer(review_counts[review_counts <= 3].index[:number_of_cold_businesses])
+        users = np.arange(min(number_of_users_scored, len(user_ids)))
+        start_time = time.perf_counter()
+        scores = model.score(users, cold_businesses)
+        print('    {} users x {} cold-start businesses scored in {:.1f} ms, {:.0%} non-zero'.format(
+            len(users), len(cold_businesses), 1000 * (time.perf_counter() - start_time),
+            scores.nnz / max(1, scores.shape[0] * scores.shape[1])))
+
+
+BENCHMARKS = {
+    'user_item_matrix': benchmark_user_item_matrix,
+    'svd_scoring': benchmark_svd_scoring,
+    'data_loading': benchmark_data_loading,
+    'pagerank': benchmark_pagerank,
+    'centrality': benchmark_centrality,
+    'communities': benchmark_communities,
+    'sampling': benchmark_sampling,
+    'incremental': benchmark_incremental,
+    'recommendation_cache': benchmark_recommendation_cache,
+    'ann_index': benchmark_ann_index,
+    'categories': benchmark_categories,
+    'als': benchmark_als,
+    'content': benchmark_content,
+}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Run the benchmarks of the recommender system.')
+    parser.add_argument('benchmarks', nargs='*', help='benchmarks to run: {} (default: all)'.format(', '.join(BENCHMARKS)))
+    parser.add_argument('--instrument', metavar='JSON', default=None,
+                        help='time the stages of the recommender system and write them to a JSON report')
+    parser.add_argument('--instrument-memory', action='store_true', help='also record the peak memory of the stages')
+    parser.add_argument('--profile', action='store_true', help='also profile the run with cProfile')
+    args = parser.parse_args()
+
+    if args.instrument:
+        instrumentation.configure(enabled=True, memory=args.instrument_memory, profile=args.profile)
+
+    for name in args.benchmarks or BENCHMARKS:
+        print('---------- {} ----------'.format(name))
+        with timer('benchmark.' + name):
+            BENCHMARKS[name]()
+
+    if args.instrument:
+        instrumentation.print_report()
+        instrumentation.export_json(args.instrument)
@@ -0,0 +1,147 @@
+import numpy as np
+import pandas as pd
+import scipy.sparse as sp
+
+
+class CategoryIndex:
+    """
+    Index of the categories of the businesses: a vocabulary of the distinct categories and a sparse
+    (businesses x categories) boolean matrix, built once from the comma separated 'categories' column.
+
+    The matrix answers the category questions of many businesses at once: the businesses of some categories
+    as a mask over the catalog, the number of businesses of each category, and the relevance of many
+    (business, top categories) pairs with the semantics of is_relevant_to_categories.
+
+    Parameters:
+        - businesses (DataFrame): The businesses, with the 'business_id' and 'categories' columns.
+    """
+
+    def __init__(self, businesses):
+        """
+        Initialize the CategoryIndex object.
+
+        Parameters:
+            - businesses (DataFrame): The businesses, with the 'business_id' and 'categories' columns.
+        """
+        self.table = businesses
+        self.business_ids = pd.Index(businesses['business_id'], name='business_id')
+
+        # the categories are comma separated strings, or lists in some samples
+        categories = businesses['categories'].reset_index(drop=True).dropna().astype(object)
+        split = categories.str.split(', ')
+        categories = split.where(split.notna(), categories).explode()
+        categories = categories[categories.notna() & (categories != '')]
+        category_codes, self.vocabulary = pd.factorize(categories, sort=True)
+        self.vocabulary = pd.Index(self.vocabulary, name='category')
+        self.category_names = self.vocabulary.tolist()
+
+        self.matrix = sp.csr_matrix(
+            (np.ones(len(category_codes), dtype=bool), (categories.index.to_numpy(), category_codes)),
+            shape=(len(businesses), len(self.vocabulary)))
+        self.category_counts = pd.Series(np.asarray(self.matrix.sum(axis=0)).ravel(), index=self.vocabulary)
+
+        # the rows of the matrix in the order of the columns of a user-item matrix, see align
+        self.aligned_ids = None
+        self.aligned_matrix = None
+
+        # the positions of the categories of the vocabulary that are substrings of a top category
+        self.contained_categories = {}
+
+    def __len__(self):
+        return len(self.vocabulary)
+
+    def count_categories(self):
+        """
+        Get the number of different categories.
+        """
+        return len(self.vocabulary)
+
+    def get_category_counts(self):
+        """
+        Get the number of businesses of each category.
+
+        Returns:
+            - category_counts (Series): The number of businesses of each category, indexed by category.
+        """
+        return self.category_counts
+
+    def align(self, business_ids):
+        """
+        Get the category matrix with one row per business of a user-item matrix; the businesses missing from
+        the business table have no category. The matrix is kept until the business IDs change.
+
+        Parameters:
+            - business_ids (Index): The business ID of each column of the user-item matrix.
+
+        Returns:
+            - matrix (csr_matrix): The (business_ids x categories) boolean matrix.
+        """
+        if self.aligned_ids is not business_ids:
+            positions = self.business_ids.get_indexer(business_ids)
+            rows = self.matrix[np.maximum(positions, 0)]
+            self.aligned_matrix = (sp.diags((positions >= 0).astype(np.float32)) @ rows).astype(bool).tocsr()
+            self.aligned_matrix.eliminate_zeros()
+            self.aligned_ids = business_ids
+        return self.aligned_matrix
+
+    def get_business_mask(self, categories, business_ids):
+        """
+        Get the businesses in at least one of some categories.
+
+        Parameters:
+            - categories (list): The categories; the ones not in the vocabulary match no business.
+            - business_ids (Index): The business ID of each column of the user-item matrix.
+
+        Returns:
+            - mask (ndarray): A boolean mask over business_ids.
+        """
+        category_positions = self.vocabulary.get_indexer(list(categories))
+        category_positions = category_positions[category_positions >= 0]
+        return np.asarray(self.align(business_ids)[:, category_positions].sum(axis=1)).ravel() > 0
+
+    def get_contained_categories(self, category):
+        """
+        Get the positions of the categories of the vocabulary that are substrings of a category.
+        """
+        if category not in self.contained_categories:
+            self.contained_categories[category] = np.array(
+                [position for position, name in enumerate(self.category_names) if name in category], dtype=np.intp)
+        return self.contained_categories[category]
+
+    def are_relevant(self, business_ids, top_categories, owners=None):
+        """
+        Check many (business, top categories) pairs at once, with the semantics of is_relevant_to_categories:
+        a business is relevant if one of its categories is a substring of one of the top categories.
+
+        Parameters:
+            - business_ids (list): The business of each pair.
+            - top_categories (list): Lists of top categories, e.g. of the users the businesses are recommended to.
+            - owners (ndarray): The position in top_categories of the list of each pair, by default one list per pair.
+
+        Returns:
+            - is_relevant (ndarray): A boolean array, True for the relevant pairs.
+        """
+        positions = self.business_ids.get_indexer(business_ids)
+        business_matrix = (sp.diags((positions >= 0).astype(np.float32)) @
+                           self.matrix[np.maximum(positions, 0)].astype(np.float32)).tocsr()
+
+        # the lists x distinct top categories one-hot matrix
+        list_lengths = [len(categories) for categories in top_categories]
+        flat_categories = [category for categories in top_categories for category in categories]
+        top_codes, distinct_categories = pd.factorize(pd.Series(flat_categories, dtype=object))
+        list_categories = sp.csr_matrix(
+            (np.ones(len(top_codes), dtype=np.float32), (np.repeat(np.arange(len(top_categories)), list_lengths),
+                                                         top_codes)),
+            shape=(len(top_categories), len(distinct_categories)))
+        pair_categories = list_categories[np.asarray(owners)] if owners is not None else list_categories
+
+        # the vocabulary x distinct top categories matrix of the categories contained in each top category
+        contained = [self.get_contained_categories(category) for category in distinct_categories]
+        containment = sp.csr_matrix(
+            (np.ones(sum(map(len, contained)), dtype=np.float32),
+             (np.concatenate(contained + [np.empty(0, dtype=np.intp)]),
+              np.repeat(np.arange(len(contained)), [len(positions) for positions in contained]))),
+            shape=(len(self.vocabulary), len(distinct_categories)))
+
+        matches = (business_matrix @ containment).multiply(pair_categories)
+        return np.asarray(matches.sum(axis=1)).ravel() > 0
@@ -0,0 +1,79 @@
+from collections import Counter
+
+
+class CategoryProfiles:
+    """
+    Per-user counts of the categories of the businesses each user reviewed positively.
+
+    The counts are built with one vectorized pass over the reviews (filter, join with the businesses,
+    explode the categories and group by user) and can be updated incrementally with new reviews.
+
+    Parameters:
+        - businesses (DataFrame): The businesses, with the 'business_id' and 'categories' columns.
+        - min_stars (int): The minimum number of stars of a positive review.
+    """
+
+    def __init__(self, businesses, min_stars=4):
+        """
+        Initialize the CategoryProfiles object.
+
+        Parameters:
+            - businesses (DataFrame): The businesses, with the 'business_id' and 'categories' columns.
+            - min_stars (int): The minimum number of stars of a positive review.
+        """
+        self.min_stars = min_stars
+        self.counts = {}
+
+        # one row per (business, category) pair, the categories are stored as a comma separated string
+        business_categories = businesses[['business_id', 'categories']].dropna(subset=['categories'])
+        business_categories = business_categories.assign(category=business_categories['categories'].str.split(', '))
+        self.business_categories = business_categories[['business_id', 'category']].explode('category')
+
+    def update(self, reviews):
+        """
+        Add the positive reviews of a review table to the category counts of their users.
+
+        Parameters:
+            - reviews (DataFrame): The new reviews, with the 'user_id', 'business_id' and 'stars' columns.
+        """
+        positive_reviews = reviews.loc[reviews['stars'] >= self.min_stars, ['user_id', 'business_id']]
+        user_categories = positive_reviews.merge(self.business_categories, on='business_id')
+        category_counts = user_categories.groupby(['user_id', 'category'], sort=False).size()
+
+        for (user_id, category), count in category_counts.items():
+            if user_id not in self.counts:
+                self.counts[user_id] = Counter()
+            self.counts[user_id][category] += count
+
+    def get_top_categories(self, user_id, x):
+        """
+        Get the x categories a given user reviewed positively the most.
+
+        Parameters:
+            - user_id (str): The ID of the user.
+            - x (int): The number of categories to retrieve.
+
+        Returns:
+            - top_x_categories (list): The top x categories, from the most to the least frequent.
+        """
+        if user_id not in self.counts:
+            return []
+        return [category for category, _ in self.counts[user_id].most_common(x)]
+
+
+def is_relevant_to_categories(business_categories, top_categories):
+    """
+    Check if a business is relevant to a user, i.e. if one of its categories is in the top categories of the user.
+
+    Parameters:
+        - business_categories (list): The categories of the business.
+        - top_categories (list): The top categories of the user.
+
+    Returns:
+        - is_relevant (bool): True if a category of the business matches a top category.
+    """
+    for category in top_categories:
+        for business_category in business_categories:
+            if business_category in category:
+                return True
+    return False
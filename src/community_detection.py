@@ -0,0 +1,383 @@
+import numpy as np
+import scipy.sparse as sp
+
+
+def edge_weights(graph, weighted=False):
+    """
+    Get the (users x businesses) edge weights of the review graph, or ones when the graph is taken as unweighted.
+    """
+    biadjacency = sp.csr_matrix(graph.biadjacency, dtype=np.float64)
+    if not weighted:
+        biadjacency.data[:] = 1.0
+    return biadjacency
+
+
+def one_hot(labels, number_of_labels):
+    """
+    Get the sparse (nodes x labels) indicator matrix of node labels.
+    """
+    return sp.csr_matrix((np.ones(len(labels)), (np.arange(len(labels)), labels)),
+                         shape=(len(labels), number_of_labels))
+
+
+def compact_labels(labels):
+    """
+    Renumber labels to 0..k-1, in the order of their first node.
+    """
+    _, first_nodes, inverse = np.unique(labels, return_index=True, return_inverse=True)
+    order = np.argsort(np.argsort(first_nodes, kind='stable'), kind='stable')
+    return order[inverse].astype(np.int32)
+
+
+def best_entry_per_row(matrix, keys):
+    """
+    Get, for every row of a csr matrix, the position in its data of the entry with the highest key.
+
+    Parameters:
+        - matrix (csr_matrix): The matrix, whose rows may be empty.
+        - keys (ndarray): One key per stored entry.
+
+    Returns:
+        - rows (ndarray): The rows with at least one entry.
+        - positions (ndarray): The position of the best entry of each of those rows.
+    """
+    lengths = np.diff(matrix.indptr)
+    rows = np.repeat(np.arange(matrix.shape[0]), lengths)
+
+    # sort by row then key, the best entry of a row is its last one
+    order = np.lexsort((keys, rows))
+    non_empty = np.flatnonzero(lengths)
+    return non_empty, order[matrix.indptr[non_empty + 1] - 1]
+
+
+def propagate_labels(adjacency, neighbor_labels, labels, number_of_labels, rng):
+    """
+    Give every node of one side the label with the highest total edge weight among its neighbors.
+
+    Ties are broken at random, except that a node keeps its label when it is one of the best.
+
+    Parameters:
+        - adjacency (csr_matrix): The (nodes x neighbors) edge weights.
+        - neighbor_labels (ndarray): The label of every neighbor.
+        - labels (ndarray): The current label of every node.
+        - number_of_labels (int): The number of possible labels.
+        - rng (Generator): The random generator of the ties.
+
+    Returns:
+        - new_labels (ndarray): The new label of every node; the nodes without neighbors keep theirs.
+    """
+    votes = (adjacency @ one_hot(neighbor_labels, number_of_labels)).tocsr()
+    votes.sum_duplicates()
+    rows = np.repeat(np.arange(votes.shape[0]), np.diff(votes.indptr))
+
+    row_max = votes.max(axis=1).toarray().ravel()
+    is_best = votes.data >= row_max[rows] * (1 - 1e-9)
+
+    keys = np.where(is_best, rng.random(votes.nnz), -1.0)
+    keys[is_best & (votes.indices == labels[rows])] = 2.0
+
+    new_labels = labels.copy()
+    non_empty, best = best_entry_per_row(votes, keys)
+    new_labels[non_empty] = votes.indices[best]
+    return new_labels
+
+
+def label_propagation(graph, weighted=False, max_iter=100, seed=0):
+    """
+    Detect communities by label propagation on the sparse bipartite review graph.
+
+    Every node starts in its own community, then the businesses and the users alternately take the most
+    frequent label of their neighbors. Updating one side at a time avoids the oscillation of synchronous
+    label propagation on bipartite graphs, where the two sides would keep swapping labels.
+
+    Parameters:
+        - graph (ReviewGraph): The review graph.
+        - weighted (bool): Whether the labels are weighted by the stars of the reviews.
+        - max_iter (int): The maximum number of iterations.
+        - seed (int): The seed of the tie breaking.
+
+    Returns:
+        - labels (ndarray): The int32 community of every node, users first, numbered from 0.
+    """
+    rng = np.random.default_rng(seed)
+    biadjacency = edge_weights(graph, weighted)
+    biadjacency_t = biadjacency.T.tocsr()
+
+    number_of_nodes = graph.number_of_nodes
+    user_labels = np.arange(graph.number_of_users)
+    business_labels = np.arange(graph.number_of_users, number_of_nodes)
+
+    for _ in range(max_iter):
+        new_business_labels = propagate_labels(biadjacency_t, user_labels, business_labels, number_of_nodes, rng)
+        new_user_labels = propagate_labels(biadjacency, new_business_labels, user_labels, number_of_nodes, rng)
+
+        converged = (new_business_labels == business_labels).all() and (new_user_labels == user_labels).all()
+        user_labels, business_labels = new_user_labels, new_business_labels
+        if converged:
+            break
+
+    return compact_labels(np.concatenate([user_labels, business_labels]))
+
+
+def node_degrees(biadjacency):
+    """
+    Get the weighted degree of every node, users first.
+    """
+    return np.concatenate([np.asarray(biadjacency.sum(axis=1)).ravel(), np.asarray(biadjacency.sum(axis=0)).ravel()])
+
+
+def community_weights(biadjacency, labels):
+    """
+    Get the internal edge weight and the total degree of every community.
+
+    Parameters:
+        - biadjacency (csr_matrix): The (users x businesses) edge weights.
+        - labels (ndarray): The community of every node, users first.
+
+    Returns:
+        - internal_weights (ndarray): The total weight of the edges inside each community.
+        - community_degrees (ndarray): The sum of the degrees of the nodes of each community.
+    """
+    number_of_users = biadjacency.shape[0]
+    number_of_communities = int(labels.max()) + 1 if len(labels) else 0
+
+    edges = biadjacency.tocoo()
+    user_labels = labels[edges.row]
+    internal = user_labels == labels[number_of_users + edges.col]
+
+    internal_weights = np.bincount(user_labels[internal], weights=edges.data[internal], minlength=number_of_communities)
+    community_degrees = np.bincount(labels, weights=node_degrees(biadjacency), minlength=number_of_communities)
+    return internal_weights, community_degrees
+
+
+def modularity(graph, labels, resolution=1.0, weighted=False):
+    """
+    Compute the modularity of a partition of the review graph, as networkx.algorithms.community.modularity.
+
+    Parameters:
+        - graph (ReviewGraph): The review graph.
+        - labels (ndarray): The community of every node, users first.
+        - resolution (float): The resolution; above 1 favors smaller communities.
+        - weighted (bool): Whether the edges are weighted by the stars of the reviews.
+
+    Returns:
+        - modularity (float): The modularity of the partition.
+    """
+    biadjacency = edge_weights(graph, weighted)
+    total_weight = biadjacency.sum()
+    internal_weights, community_degrees = community_weights(biadjacency, labels)
+
+    return internal_weights.sum() / total_weight - resolution * ((community_degrees / (2 * total_weight)) ** 2).sum()
+
+
+def conductance(graph, labels, weighted=False):
+    """
+    Compute the conductance of every community of a partition, as networkx.algorithms.cuts.conductance.
+
+    Parameters:
+        - graph (ReviewGraph): The review graph.
+        - labels (ndarray): The community of every node, users first.
+        - weighted (bool): Whether the edges are weighted by the stars of the reviews.
+
+    Returns:
+        - conductances (ndarray): The conductance of each community, NaN for a community holding every edge.
+    """
+    biadjacency = edge_weights(graph, weighted)
+    internal_weights, community_degrees = community_weights(biadjacency, labels)
+
+    # the cut of a community is the degree of its nodes not spent on its internal edges
+    cut_weights = community_degrees - 2 * internal_weights
+    volumes = np.minimum(community_degrees, 2 * biadjacency.sum() - community_degrees)
+    return np.divide(cut_weights, volumes, out=np.full_like(cut_weights, np.nan), where=volumes > 0)
+
+
+def adjacency_modularity(adjacency, labels, resolution=1.0):
+    """
+    Compute the modularity of a partition of the nodes of a symmetric adjacency matrix, which may have self-loops.
+    """
+    total_weight = adjacency.sum()
+    edges = adjacency.tocoo()
+    internal = labels[edges.row] == labels[edges.col]
+    community_degrees = np.bincount(labels, weights=np.asarray(adjacency.sum(axis=1)).ravel())
+    return edges.data[internal].sum() / total_weight - resolution * ((community_degrees / total_weight) ** 2).sum()
+
+
+def move_nodes(links, labels, degrees, community_degrees, total_weight, resolution, movable):
+    """
+    Move nodes to the neighboring community with the highest modularity gain.
+
+    Parameters:
+        - links (csr_matrix): The (nodes x communities) edge weight between every node and every community,
+                              without the self-loops.
+        - labels (ndarray): The current community of every node.
+        - degrees (ndarray): The degree of every node.
+        - community_degrees (ndarray): The total degree of every community.
+        - total_weight (float): The total weight of the adjacency matrix (twice the edge weight of the graph).
+        - resolution (float): The resolution of the modularity.
+        - movable (ndarray): A boolean mask of the nodes allowed to move.
+
+    Returns:
+        - new_labels (ndarray): The new community of every node.
+    """
+    rows = np.repeat(np.arange(links.shape[0]), np.diff(links.indptr))
+
+    # the gain of joining a community, up to a constant; the node leaves its own community first
+    in_own_community = links.indices == labels[rows]
+    other_degrees = community_degrees[links.indices] - np.where(in_own_community, degrees[rows], 0)
+    gains = links.data - resolution * degrees[rows] * other_degrees / total_weight
+
+    stay_gains = -resolution * degrees * (community_degrees[labels] - degrees) / total_weight
+    stay_gains += np.bincount(rows[in_own_community], weights=links.data[in_own_community], minlength=len(labels))
+
+    non_empty, best = best_entry_per_row(links, gains)
+    moves = movable[non_empty] & (gains[best] > stay_gains[non_empty] + 1e-12)
+
+    new_labels = labels.copy()
+    new_labels[non_empty[moves]] = links.indices[best[moves]]
+    return new_labels
+
+
+def local_moving(adjacency, resolution=1.0, max_iter=20, move_fraction=0.5, rng=None):
+    """
+    The local moving phase of the Louvain method: starting with every node in its own community, move the
+    nodes to the neighboring community that increases the modularity the most, until none does.
+
+    The moves are vectorized: a random fraction of the nodes moves at each step. As those nodes do not see
+    each other's moves, a step that does not increase the modularity is undone and the fraction is halved.
+
+    Parameters:
+        - adjacency (csr_matrix): The symmetric (nodes x nodes) edge weights, with the self-loops.
+        - resolution (float): The resolution of the modularity.
+        - max_iter (int): The maximum number of steps.
+        - move_fraction (float): The starting fraction of the nodes allowed to move at each step.
+        - rng (Generator): The random generator of the nodes allowed to move.
+
+    Returns:
+        - labels (ndarray): The community of every node.
+    """
+    rng = rng if rng is not None else np.random.default_rng()
+    number_of_nodes = adjacency.shape[0]
+    total_weight = adjacency.sum()
+    degrees = np.asarray(adjacency.sum(axis=1)).ravel()
+    neighbors = (adjacency - sp.diags(adjacency.diagonal())).tocsr()
+    neighbors.eliminate_zeros()
+
+    labels = np.arange(number_of_nodes)
+    best_modularity = adjacency_modularity(adjacency, labels, resolution)
+
+    for _ in range(max_iter):
+        links = (neighbors @ one_hot(labels, number_of_nodes)).tocsr()
+        links.sum_duplicates()
+        community_degrees = np.bincount(labels, weights=degrees, minlength=number_of_nodes)
+
+        movable = rng.random(number_of_nodes) < move_fraction
+        new_labels = move_nodes(links, labels, degrees, community_degrees, total_weight, resolution, movable)
+        if (new_labels == labels).all():
+            # no movable node gains anything, stop when every node was movable
+            if move_fraction >= 1:
+                break
+            move_fraction = min(1.0, 2 * move_fraction)
+            continue
+
+        new_modularity = adjacency_modularity(adjacency, new_labels, resolution)
+        if new_modularity > best_modularity:
+            labels, best_modularity = new_labels, new_modularity
+        else:
+            move_fraction /= 2
+            if move_fraction * number_of_nodes < 1:
+                break
+
+    return labels
+
+
+def aggregate(adjacency, labels):
+    """
+    Merge the nodes of each community into one node, whose self-loop holds the internal edges of the community.
+    """
+    membership = one_hot(labels, int(labels.max()) + 1)
+    return (membership.T @ adjacency @ membership).tocsr()
+
+
+def louvain(graph, labels=None, resolution=1.0, weighted=False, max_levels=10, max_iter=20, move_fraction=0.5,
+            seed=0):
+    """
+    Detect communities with the Louvain method on the sparse review graph.
+
+    The local moving phase groups the nodes into communities, then the communities are merged into single
+    nodes and the local moving is repeated on the graph of communities, until no community moves.
+
+    Parameters:
+        - graph (ReviewGraph): The review graph.
+        - labels (ndarray): An optional starting partition of every node, e.g. from label_propagation,
+                            by default every node in its own community.
+        - resolution (float): The resolution of the modularity; above 1 favors smaller communities.
+        - weighted (bool): Whether the edges are weighted by the stars of the reviews.
+        - max_levels (int): The maximum number of aggregation levels.
+        - max_iter (int): The maximum number of local moving steps per level.
+        - move_fraction (float): The starting fraction of the nodes allowed to move at each step.
+        - seed (int): The seed of the nodes allowed to move.
+
+    Returns:
+        - labels (ndarray): The int32 community of every node, users first, numbered from 0.
+    """
+    rng = np.random.default_rng(seed)
+    biadjacency = edge_weights(graph, weighted)
+    adjacency = sp.bmat([[None, biadjacency], [biadjacency.T, None]], format='csr')
+
+    labels = np.arange(graph.number_of_nodes) if labels is None else compact_labels(labels)
+
+    for _ in range(max_levels):
+        aggregated = aggregate(adjacency, labels)
+        community_labels = compact_labels(local_moving(aggregated, resolution, max_iter, move_fraction, rng))
+        if community_labels.max() + 1 == aggregated.shape[0]:
+            break
+        labels = community_labels[labels]
+
+    return compact_labels(labels)
+
+
+def communities_to_labels(communities, node_ids):
+    """
+    Convert a list of communities (sets of node IDs), as returned by networkx, into one label per node.
+
+    Parameters:
+        - communities (list): The communities, as sets of node IDs.
+        - node_ids (ndarray): The ID of every node.
+
+    Returns:
+        - labels (ndarray): The int32 community of every node, -1 for the nodes in no community.
+    """
+    positions = {node_id: position for position, node_id in enumerate(node_ids)}
+    labels = np.full(len(node_ids), -1, dtype=np.int32)
+    for label, community in enumerate(communities):
+        labels[[positions[node_id] for node_id in community]] = label
+    return labels
+
+
+def detect_communities(graph, method='louvain', seed=0):
+    """
+    Partition the review graph into communities.
+
+    'greedy_modularity' runs the networkx greedy modularity maximization of the sna.ipynb notebook. It is
+    kept for compatibility, but it is much slower than 'louvain', which finds partitions of similar modularity.
+
+    Parameters:
+        - graph (ReviewGraph): The review graph.
+        - method (str): 'louvain', 'label_propagation' or 'greedy_modularity'.
+        - seed (int): The seed of the detection.
+
+    Returns:
+        - labels (ndarray): The int32 community of every node, users first.
+    """
+    if method == 'label_propagation':
+        return label_propagation(graph, seed=seed)
+    elif method == 'louvain':
+        return louvain(graph, seed=seed)
+    elif method == 'greedy_modularity':
+        from networkx.algorithms.community import greedy_modularity_communities
+
+        from graph_analytics import to_networkx
+
+        return communities_to_labels(list(greedy_modularity_communities(to_networkx(graph))), graph.node_ids)
+    else:
+        raise ValueError('Invalid community detection method.')
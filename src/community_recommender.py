@@ -0,0 +1,182 @@
+import numpy as np
+import scipy.sparse as sp
+from joblib import Parallel, delayed
+
+from ranking import pad_columns
+
+
+def community_entries(ratings, user_labels, business_labels):
+    """
+    Group the entries of a user-item matrix by community.
+
+    As in the community reviews of the notebook, an entry belongs to the community of its user
+    and to the community of its business.
+
+    Parameters:
+        - ratings (coo_matrix): The (users x businesses) ratings.
+        - user_labels (ndarray): The community of every user.
+        - business_labels (ndarray): The community of every business.
+
+    Returns:
+        - entries (dict): The positions of the entries of each community in the data of the matrix.
+    """
+    entry_positions = np.arange(ratings.nnz)
+    row_labels = user_labels[ratings.row]
+    column_labels = business_labels[ratings.col]
+
+    # an entry is listed twice only when its user and business are in different communities
+    other = column_labels != row_labels
+    labels = np.concatenate([row_labels, column_labels[other]])
+    positions = np.concatenate([entry_positions, entry_positions[other]])
+
+    positions, labels = positions[labels >= 0], labels[labels >= 0]
+    order = np.argsort(labels, kind='stable')
+    labels, positions = labels[order], positions[order]
+
+    starts = np.flatnonzero(np.r_[True, labels[1:] != labels[:-1]]) if len(labels) else np.empty(0, dtype=np.intp)
+    return {int(label): group for label, group in zip(labels[starts], np.split(positions, starts[1:]))}
+
+
+def fit_community_model(model_type, rows, columns, data, entries, model_params=None):
+    """
+    Fit a model on the ratings of one community. Runs in the worker processes of CommunityModels.fit.
+
+    The rows, columns and data of the global matrix are memory-mapped by joblib and shared between
+    the workers, so each worker only copies the entries of its community.
+
+    Parameters:
+        - model_type (str): The type of model to fit.
+        - rows (ndarray): The user position of every entry of the global matrix.
+        - columns (ndarray): The business position of every entry of the global matrix.
+        - data (ndarray): The rating of every entry of the global matrix.
+        - entries (ndarray): The positions of the entries of the community.
+        - model_params (dict): Optional keyword arguments of the model, see RecommenderSystem.
+
+    Returns:
+        - recommender_system (RecommenderSystem): The recommender system of the community.
+        - user_positions (ndarray): The global position of each user of the community matrix.
+        - business_positions (ndarray): The global position of each business of the community matrix.
+    """
+    # imported here, as recommender_system imports this module
+    from recommender_system import RecommenderSystem
+
+    user_positions, local_rows = np.unique(rows[entries], return_inverse=True)
+    business_positions, local_columns = np.unique(columns[entries], return_inverse=True)
+
+    recommender_system = RecommenderSystem(model_type, load=False, model_params=model_params)
+    recommender_system.train_data = sp.csr_matrix(
+        (data[entries], (local_rows, local_columns)), shape=(len(user_positions), len(business_positions)))
+    recommender_system.fit_model()
+
+    return recommender_system, user_positions, business_positions
+
+
+class CommunityModels:
+    """
+    One model per community of the review graph, each fitted on the reviews of its community, as the
+    community reviews of the notebook: the reviews of its users and the reviews of its businesses.
+
+    The recommendations of a user are made by the model of their community, over the businesses of that
+    community. The users of the communities too small to get a model are not routed.
+
+    Parameters:
+        - model_type (str): The type of the models, see RecommenderSystem.
+        - min_size (int): The minimum number of users and of businesses of a community to fit its model.
+        - n_jobs (int): The number of processes that fit the models (None for one, -1 for every core).
+        - model_params (dict): Optional keyword arguments of the models, see RecommenderSystem.
+    """
+
+    def __init__(self, model_type, min_size=20, n_jobs=None, model_params=None):
+        """
+        Initialize the CommunityModels object.
+
+        Parameters:
+            - model_type (str): The type of the models, see RecommenderSystem.
+            - min_size (int): The minimum number of users and of businesses of a community to fit its model.
+            - n_jobs (int): The number of processes that fit the models (None for one, -1 for every core).
+            - model_params (dict): Optional keyword arguments of the models, see RecommenderSystem.
+        """
+        self.model_type = model_type
+        self.min_size = min_size
+        self.n_jobs = n_jobs
+        self.model_params = model_params
+
+    def fit(self, user_item_ratings, labels):
+        """
+        Fit the model of every community across a process pool.
+
+        Parameters:
+            - user_item_ratings (csr_matrix): The (users x businesses) ratings.
+            - labels (ndarray): The community of every node of the review graph, users first.
+
+        Returns:
+            - self (CommunityModels): The fitted models.
+        """
+        number_of_users = user_item_ratings.shape[0]
+        self.user_labels_ = np.asarray(labels[:number_of_users], dtype=np.int32)
+
+        business_labels = np.asarray(labels[number_of_users:], dtype=np.int32)
+        number_of_labels = int(max(self.user_labels_.max(initial=-1), business_labels.max(initial=-1))) + 1
+        user_counts = np.bincount(self.user_labels_[self.user_labels_ >= 0], minlength=number_of_labels)
+        business_counts = np.bincount(business_labels[business_labels >= 0], minlength=number_of_labels)
+
+        ratings = user_item_ratings.tocoo()
+        entries = community_entries(ratings, self.user_labels_, business_labels)
+        fitted_labels = [label for label in entries
+                         if user_counts[label] >= self.min_size and business_counts[label] >= self.min_size]
+
+        fitted = Parallel(n_jobs=self.n_jobs)(
+            delayed(fit_community_model)(self.model_type, ratings.row, ratings.col, ratings.data, entries[label],
+                                         self.model_params)
+            for label in fitted_labels
+        )
+        self.models_ = dict(zip(fitted_labels, fitted))
+        return self
+
+    def recommend_users(self, user_positions, number_of_recommendations, allowed=None):
+        """
+        Get the top recommended businesses for a chunk of users from the models of their communities.
+
+        Parameters:
+            - user_positions (ndarray): The rows of the users in the global user-item matrix.
+            - number_of_recommendations (int): The number of recommendations to make for each user.
+            - allowed (ndarray): An optional boolean mask of the global businesses that can be recommended.
+
+        Returns:
+            - recommended_indices (ndarray): The global column indices of the recommended businesses, one row
+                                             per user, padded with -1.
+            - routed (ndarray): A boolean mask of the users whose community model made a full recommendation list.
+        """
+        recommended_indices = np.full((len(user_positions), number_of_recommendations), -1, dtype=np.intp)
+        routed = np.zeros(len(user_positions), dtype=bool)
+
+        user_labels = self.user_labels_[user_positions]
+        for label in np.unique(user_labels):
+            if label not in self.models_:
+                continue
+
+            recommender_system, community_users, community_businesses = self.models_[label]
+            chunk = np.flatnonzero(user_labels == label)
+            local_indices = recommender_system.recommend_users(
+                np.searchsorted(community_users, user_positions[chunk]), number_of_recommendations,
+                allowed[community_businesses] if allowed is not None else None)
+
+            # a community with fewer than number_of_recommendations businesses gives a shorter list
+            local_indices = pad_columns(local_indices, number_of_recommendations)
+            recommended_indices[chunk] = np.where(local_indices >= 0, community_businesses[local_indices], -1)
+            routed[chunk] = (local_indices >= 0).all(axis=1)
+
+        return recommended_indices, routed
+
+    def add_users(self, number_of_users):
+        """
+        Grow the community labels to new users, who are in no community until the models are refitted.
+        """
+        self.user_labels_ = np.pad(self.user_labels_, (0, number_of_users - len(self.user_labels_)),
+                                   constant_values=-1)
+
+    def get_community(self, user_position):
+        """
+        Get the community of a user, -1 if they are in none.
+        """
+        return int(self.user_labels_[user_position])
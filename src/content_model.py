@@ -0,0 +1,287 @@
+import numpy as np
+import scipy.sparse as sp
+from joblib import Parallel, delayed
+from sklearn.feature_extraction.text import HashingVectorizer
+from sklearn.preprocessing import normalize
+
+from ranking import blocked_sparse_top_n, truncate_rows
+from user_item_matrix import grow_matrix
+
+
+def sum_rows(vectors, positions):
+    """
+    Sum the vectors of the reviews of each user or business of a chunk.
+
+    Parameters:
+        - vectors (csr_matrix): The (reviews x features) vectors of the reviews.
+        - positions (ndarray): The row of the profile of each review.
+
+    Returns:
+        - rows (ndarray): The distinct rows of the chunk.
+        - sums (csr_matrix): The (rows x features) sum of the vectors of each row.
+    """
+    rows, inverse = np.unique(positions, return_inverse=True)
+    membership = sp.csr_matrix((np.ones(len(positions), dtype=np.float32), (inverse, np.arange(len(positions)))),
+                               shape=(len(rows), len(positions)))
+    return rows, (membership @ vectors).tocsr()
+
+
+def vectorize_chunk(texts, user_positions, business_positions, n_features, stop_words):
+    """
+    Hash the texts of a chunk of reviews and sum them per user and per business. Runs in the worker processes
+    of ContentModel.partial_fit.
+
+    The hashing vectorizer is stateless, so the chunks are vectorized independently, and only the sums of the
+    chunk are sent back, not the vectors of its reviews.
+
+    Parameters:
+        - texts (list): The text of each review.
+        - user_positions (ndarray): The row of the user of each review.
+        - business_positions (ndarray): The row of the business of each review.
+        - n_features (int): The number of hashed features.
+        - stop_words (str): The stop words of the vectorizer, e.g. 'english', or None.
+
+    Returns:
+        - user_sums (tuple): The distinct users of the chunk and the sum of their L2 normalized review vectors.
+        - business_sums (tuple): The same for the businesses.
+    """
+    vectorizer = HashingVectorizer(n_features=n_features, alternate_sign=False, norm='l2', stop_words=stop_words,
+                                   dtype=np.float32)
+    vectors = vectorizer.transform(texts)
+    return sum_rows(vectors, user_positions), sum_rows(vectors, business_positions)
+
+
+class ProfileSums:
+    """
+    Sparse (rows x features) sums of review vectors, accumulated chunk by chunk.
+
+    The sums of the chunks are buffered as coordinates and merged into the matrix when the buffer reaches
+    buffer_size entries, so merging does not copy the matrix after every chunk. After a merge, each row only
+    keeps its max_terms highest features, which bounds the matrix to rows x max_terms entries whatever the
+    number of reviews.
+
+    Parameters:
+        - number_of_rows (int): The number of rows.
+        - n_features (int): The number of features.
+        - max_terms (int): The maximum number of features kept per row, or None to keep every feature.
+        - buffer_size (int): The number of buffered entries that triggers a merge.
+    """
+
+    def __init__(self, number_of_rows, n_features, max_terms=256, buffer_size=4_000_000):
+        """
+        Initialize the ProfileSums object, with empty rows.
+
+        Parameters:
+            - number_of_rows (int): The number of rows.
+            - n_features (int): The number of features.
+            - max_terms (int): The maximum number of features kept per row, or None to keep every feature.
+            - buffer_size (int): The number of buffered entries that triggers a merge.
+        """
+        self.matrix = sp.csr_matrix((number_of_rows, n_features), dtype=np.float32)
+        self.max_terms = max_terms
+        self.buffer_size = buffer_size
+        self.buffer = []
+        self.buffered_entries = 0
+
+    def grow(self, number_of_rows):
+        """
+        Add empty rows after the existing ones.
+        """
+        if number_of_rows > self.matrix.shape[0]:
+            self.matrix = grow_matrix(self.matrix, (number_of_rows, self.matrix.shape[1]))
+
+    def add(self, rows, sums):
+        """
+        Add the sums of some rows, e.g. the sums of the reviews of a chunk.
+
+        Parameters:
+            - rows (ndarray): The rows of the sums.
+            - sums (csr_matrix): The (len(rows) x features) sums to add.
+        """
+        sums = sums.tocoo()
+        self.buffer.append((rows[sums.row], sums.col, sums.data))
+        self.buffered_entries += sums.nnz
+        if self.buffered_entries >= self.buffer_size:
+            self.merge()
+
+    def merge(self):
+        """
+        Merge the buffered sums into the matrix, then keep the max_terms highest features of each row.
+        """
+        if not self.buffer:
+            return
+
+        rows, columns, data = (np.concatenate(parts) for parts in zip(*self.buffer))
+        self.buffer = []
+        self.buffered_entries = 0
+
+        self.matrix = (self.matrix + sp.csr_matrix((data, (rows, columns)), shape=self.matrix.shape)).tocsr()
+        if self.max_terms is not None:
+            self.matrix = truncate_rows(self.matrix, self.max_terms).astype(np.float32)
+
+
+class ContentModel:
+    """
+    Content-based model over the text of the reviews, for the businesses with too few reviews for the
+    collaborative models.
+
+    The texts are streamed in chunks through a stateless hashing vectorizer, so there is no vocabulary to
+    fit or to hold in memory, and the chunks are vectorized in parallel. The L2 normalized vector of each
+    review is added to the profile of its user and to the profile of its business; the profiles are
+    L2 normalized sums, pruned to their max_terms highest features. A user scores a business by the cosine
+    similarity of their profiles, a sparse dot product, so a business is scored as soon as one review
+    describes it.
+
+    The memory depends on the number of users and businesses, not on the number of reviews: the chunks in
+    flight, the buffer of ProfileSums and the pruned profiles are all bounded.
+
+    Parameters:
+        - n_features (int): The number of hashed features.
+        - max_terms (int): The maximum number of features of a profile, or None to keep every feature.
+        - stop_words (str): The stop words of the vectorizer, e.g. 'english', or None.
+        - chunk_size (int): The number of reviews vectorized per job.
+        - n_jobs (int): The number of processes vectorizing the chunks (None for one, -1 for every core).
+    """
+
+    def __init__(self, n_features=2 ** 18, max_terms=256, stop_words='english', chunk_size=10_000, n_jobs=None):
+        """
+        Initialize the ContentModel object.
+
+        Parameters:
+            - n_features (int): The number of hashed features.
+            - max_terms (int): The maximum number of features of a profile, or None to keep every feature.
+            - stop_words (str): The stop words of the vectorizer, e.g. 'english', or None.
+            - chunk_size (int): The number of reviews vectorized per job.
+            - n_jobs (int): The number of processes vectorizing the chunks (None for one, -1 for every core).
+        """
+        self.n_features = n_features
+        self.max_terms = max_terms
+        self.stop_words = stop_words
+        self.chunk_size = chunk_size
+        self.n_jobs = n_jobs
+
+    def fit(self, chunks, user_ids, business_ids):
+        """
+        Build the profiles of the users and businesses from the texts of their reviews.
+
+        Parameters:
+            - chunks (iterable): DataFrames of reviews with the 'user_id', 'business_id' and 'text' columns.
+            - user_ids (Index): The user ID of each profile row.
+            - business_ids (Index): The business ID of each profile row.
+
+        Returns:
+            - self (ContentModel): The fitted model, with the user_profiles_ and business_profiles_.
+        """
+        self.user_sums = ProfileSums(len(user_ids), self.n_features, self.max_terms)
+        self.business_sums = ProfileSums(len(business_ids), self.n_features, self.max_terms)
+        return self.partial_fit(chunks, user_ids, business_ids)
+
+    def iter_jobs(self, chunks, user_ids, business_ids):
+        """
+        Split the chunks of reviews into the vectorization jobs, skipping the reviews without text or whose user
+        or business has no profile row.
+        """
+        for chunk in chunks:
+            for start in range(0, len(chunk), self.chunk_size):
+                reviews = chunk.iloc[start:start + self.chunk_size]
+                user_positions = user_ids.get_indexer(reviews['user_id'])
+                business_positions = business_ids.get_indexer(reviews['business_id'])
+                texts = reviews['text'].to_numpy()
+                kept = (user_positions >= 0) & (business_positions >= 0) & reviews['text'].notna().to_numpy()
+                if kept.any():
+                    yield delayed(vectorize_chunk)(list(texts[kept]), user_positions[kept],
+                                                   business_positions[kept], self.n_features, self.stop_words)
+
+    def partial_fit(self, chunks, user_ids, business_ids):
+        """
+        Add the texts of new reviews to the profiles, growing them to new users and businesses.
+
+        The chunks are consumed as the jobs complete, with a bounded number of jobs dispatched ahead, so the
+        chunks can be a generator over a larger-than-memory review table.
+
+        Parameters:
+            - chunks (iterable): DataFrames of reviews with the 'user_id', 'business_id' and 'text' columns.
+            - user_ids (Index): The user ID of each profile row, the new users after the existing ones.
+            - business_ids (Index): The business ID of each profile row, the new businesses after the existing ones.
+
+        Returns:
+            - self (ContentModel): The updated model.
+        """
+        self.user_sums.grow(len(user_ids))
+        self.business_sums.grow(len(business_ids))
+
+        parallel = Parallel(n_jobs=self.n_jobs, return_as='generator_unordered', pre_dispatch='2*n_jobs')
+        for (users, user_sums), (businesses, business_sums) in parallel(self.iter_jobs(chunks, user_ids,
+                                                                                       business_ids)):
+            self.user_sums.add(users, user_sums)
+            self.business_sums.add(businesses, business_sums)
+
+        self.user_sums.merge()
+        self.business_sums.merge()
+        self.normalize_profiles()
+        return self
+
+    def normalize_profiles(self):
+        """
+        Compute the L2 normalized profiles from the sums, and the (features x businesses) transposed business
+        profiles the users are scored against.
+        """
+        self.user_profiles_ = normalize(self.user_sums.matrix, norm='l2', axis=1).astype(np.float32)
+        self.business_profiles_ = normalize(self.business_sums.matrix, norm='l2', axis=1).astype(np.float32)
+        self.business_features_ = self.business_profiles_.T.tocsr()
+
+    def set_sums(self, user_sums, business_sums):
+        """
+        Restore the profiles from the sums saved with a model, see RecommenderSystem.save_model.
+        """
+        self.user_sums = ProfileSums(user_sums.shape[0], self.n_features, self.max_terms)
+        self.business_sums = ProfileSums(business_sums.shape[0], self.n_features, self.max_terms)
+        self.user_sums.matrix = sp.csr_matrix(user_sums, dtype=np.float32)
+        self.business_sums.matrix = sp.csr_matrix(business_sums, dtype=np.float32)
+        self.normalize_profiles()
+
+    def score(self, user_positions, business_positions=None):
+        """
+        Score the businesses for some users by the cosine similarity of their profiles.
+
+        Parameters:
+            - user_positions (ndarray): The profile rows of the users.
+            - business_positions (ndarray): The profile rows of the businesses to score, e.g. cold-start
+                                            businesses, or None for every business.
+
+        Returns:
+            - scores (csr_matrix): A sparse (users x businesses) matrix of similarities; the businesses sharing
+                                   no feature with a user have no entry.
+        """
+        business_features = self.business_features_ if business_positions is None else \
+            self.business_features_[:, business_positions]
+        return (self.user_profiles_[user_positions] @ business_features).tocsr()
+
+    def recommend(self, user_positions, n, exclude=None, allowed=None, block_size=65536):
+        """
+        Get the n businesses most similar to some users, scoring the businesses by blocks of block_size,
+        see ranking.blocked_sparse_top_n, instead of building the scores of every business at once.
+
+        Parameters:
+            - user_positions (ndarray): The profile rows of the users.
+            - n (int): The number of businesses to get per user.
+            - exclude (csr_matrix): An optional (users x businesses) matrix, whose non-zero entries are never
+                                    selected.
+            - allowed (ndarray): An optional boolean mask of the businesses that can be selected.
+            - block_size (int): The number of businesses scored at a time.
+
+        Returns:
+            - indices (ndarray): A (users x min(n, businesses)) array of business indices, from the best to the
+                                 worst, padded with -1 when a user shares no feature with enough businesses.
+        """
+        if allowed is None:
+            return blocked_sparse_top_n(self.user_profiles_[user_positions], self.business_profiles_, n,
+                                        exclude=exclude, block_size=block_size)
+
+        # only the allowed businesses are scored
+        candidates = np.flatnonzero(allowed)
+        candidate_indices = blocked_sparse_top_n(self.user_profiles_[user_positions],
+                                                 self.business_profiles_[candidates], n,
+                                                 exclude=exclude[:, candidates] if exclude is not None else None,
+                                                 block_size=block_size)
+        return np.where(candidate_indices >= 0, candidates[candidate_indices], -1)
@@ -0,0 +1,229 @@
+import os
+
+import pandas as pd
+
+# the data directory of the repository, so the data loads from any working directory
+DEFAULT_DATA_DIR = os.path.normpath(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'data'))
+
+# name of the file (without extension) of each table
+TABLE_FILES = {
+    'users': 'sample_users',
+    'businesses': 'sample_business',
+    'reviews': 'sample_reviews'
+}
+
+FILTER_OPERATORS = {
+    '==': lambda column, value: column == value,
+    '=': lambda column, value: column == value,
+    '!=': lambda column, value: column != value,
+    '<': lambda column, value: column < value,
+    '<=': lambda column, value: column <= value,
+    '>': lambda column, value: column > value,
+    '>=': lambda column, value: column >= value,
+    'in': lambda column, value: column.isin(value),
+    'not in': lambda column, value: ~column.isin(value)
+}
+
+
+def apply_filters(data, filters):
+    """
+    Keep the rows of a DataFrame that match every filter.
+
+    Parameters:
+        - data (DataFrame): The table to filter.
+        - filters (list): A list of (column, operator, value) tuples, as the filters of pyarrow.parquet,
+                          e.g. [('stars', '>=', 4), ('date', '>=', pd.Timestamp('2018-01-01'))].
+
+    Returns:
+        - filtered (DataFrame): The rows of the table that match every filter.
+    """
+    if not filters:
+        return data
+
+    mask = pd.Series(True, index=data.index)
+    for column, operator, value in filters:
+        if operator not in FILTER_OPERATORS:
+            raise ValueError('Invalid filter operator: {}'.format(operator))
+        mask &= FILTER_OPERATORS[operator](data[column], value)
+
+    return data[mask]
+
+
+class PickleDataSource:
+    """
+    Data source that reads the tables from pickled DataFrames.
+
+    Pickles have to be read whole, so the projection and the filters are applied after loading.
+
+    Parameters:
+        - data_dir (str): The directory of the pickle files.
+    """
+
+    extension = '.pickle'
+
+    def __init__(self, data_dir=DEFAULT_DATA_DIR):
+        """
+        Initialize the PickleDataSource object.
+
+        Parameters:
+            - data_dir (str): The directory of the pickle files.
+        """
+        self.data_dir = data_dir
+
+    def path(self, table):
+        """
+        Get the path of the file of a given table.
+
+        Parameters:
+            - table (str): The name of the table: 'users', 'businesses' or 'reviews'.
+
+        Returns:
+            - path (str): The path of the file of the table.
+        """
+        return os.path.join(self.data_dir, TABLE_FILES.get(table, table) + self.extension)
+
+    def read(self, table, columns=None, filters=None):
+        """
+        Read a table.
+
+        Parameters:
+            - table (str): The name of the table: 'users', 'businesses' or 'reviews'.
+            - columns (list): The columns to keep, or None for every column.
+            - filters (list): A list of (column, operator, value) tuples the rows must match.
+
+        Returns:
+            - data (DataFrame): The table.
+        """
+        data = apply_filters(pd.read_pickle(self.path(table)), filters)
+        return data if columns is None else data[list(columns)]
+
+    def columns(self, table):
+        """
+        Get the column names of a table. A pickle has to be read whole, even for its columns.
+        """
+        return list(pd.read_pickle(self.path(table)).columns)
+
+    def iter_chunks(self, table, columns=None, filters=None, chunk_size=100_000):
+        """
+        Read a table in chunks of rows. A pickle has to be read whole, so the chunks are slices of the table.
+
+        Parameters:
+            - table (str): The name of the table: 'users', 'businesses' or 'reviews'.
+            - columns (list): The columns to keep, or None for every column.
+            - filters (list): A list of (column, operator, value) tuples the rows must match.
+            - chunk_size (int): The number of rows per chunk.
+
+        Yields:
+            - chunk (DataFrame): The rows of the next chunk.
+        """
+        data = self.read(table, columns, filters)
+        for start in range(0, len(data), chunk_size):
+            yield data.iloc[start:start + chunk_size]
+
+    def write(self, table, data):
+        """
+        Write a table.
+
+        Parameters:
+            - table (str): The name of the table: 'users', 'businesses' or 'reviews'.
+            - data (DataFrame): The table to write.
+        """
+        os.makedirs(self.data_dir, exist_ok=True)
+        data.to_pickle(self.path(table))
+
+
+class ParquetDataSource(PickleDataSource):
+    """
+    Data source that reads the tables from Parquet files (or directories of Parquet files) with pyarrow.
+
+    Only the requested columns are read, and the filters are pushed down to skip the row groups
+    that cannot match them.
+
+    Parameters:
+        - data_dir (str): The directory of the Parquet files.
+    """
+
+    extension = '.parquet'
+
+    def read(self, table, columns=None, filters=None):
+        """
+        Read a table.
+
+        Parameters:
+            - table (str): The name of the table: 'users', 'businesses' or 'reviews'.
+            - columns (list): The columns to read, or None for every column.
+            - filters (list): A list of (column, operator, value) tuples the rows must match.
+
+        Returns:
+            - data (DataFrame): The table.
+        """
+        import pyarrow.parquet as pq
+
+        data = pq.read_table(self.path(table), columns=None if columns is None else list(columns),
+                             filters=filters or None)
+        return data.to_pandas()
+
+    def columns(self, table):
+        """
+        Get the column names of a table from the schema of its Parquet files, without reading any row.
+        """
+        import pyarrow.dataset as ds
+
+        return ds.dataset(self.path(table), format='parquet').schema.names
+
+    def iter_chunks(self, table, columns=None, filters=None, chunk_size=100_000):
+        """
+        Read a table in chunks of rows, streaming the record batches of the Parquet files, so only one chunk
+        is held in memory.
+
+        Parameters:
+            - table (str): The name of the table: 'users', 'businesses' or 'reviews'.
+            - columns (list): The columns to read, or None for every column.
+            - filters (list): A list of (column, operator, value) tuples the rows must match.
+            - chunk_size (int): The maximum number of rows per chunk.
+
+        Yields:
+            - chunk (DataFrame): The rows of the next chunk.
+        """
+        import pyarrow.dataset as ds
+        import pyarrow.parquet as pq
+
+        dataset = ds.dataset(self.path(table), format='parquet')
+        batches = dataset.to_batches(columns=None if columns is None else list(columns),
+                                     filter=pq.filters_to_expression(filters) if filters else None,
+                                     batch_size=chunk_size)
+        for batch in batches:
+            if batch.num_rows:
+                yield batch.to_pandas()
+
+    def write(self, table, data):
+        """
+        Write a table.
+
+        Parameters:
+            - table (str): The name of the table: 'users', 'businesses' or 'reviews'.
+            - data (DataFrame): The table to write.
+        """
+        os.makedirs(self.data_dir, exist_ok=True)
+        data.to_parquet(self.path(table), index=False)
+
+
+def convert_pickles_to_parquet(data_dir=DEFAULT_DATA_DIR, output_dir=None):
+    """
+    Convert the pickled tables of a data directory to Parquet files.
+
+    Parameters:
+        - data_dir (str): The directory of the pickle files.
+        - output_dir (str): The directory to write the Parquet files to, by default the same directory.
+    """
+    pickles = PickleDataSource(data_dir)
+    parquets = ParquetDataSource(output_dir or data_dir)
+
+    for table in TABLE_FILES:
+        if os.path.exists(pickles.path(table)):
+            parquets.write(table, pickles.read(table))
+            print('File converted: ', parquets.path(table))
+
+
+if __name__ == '__main__':
+    convert_pickles_to_parquet()
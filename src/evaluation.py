@@ -0,0 +1,252 @@
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+# the recommender system of the evaluation in progress, inherited by the forked worker processes of
+# Evaluator.evaluate instead of being pickled for every batch
+evaluated_system = None
+
+
+def split_reviews(reviews, test_fraction=0.2, seed=0):
+    """
+    Split the reviews into a training and a held-out set, holding out a fraction of the reviews of each user.
+
+    Users with a single review keep it in the training set, so every evaluated user has a history.
+
+    Parameters:
+        - reviews (DataFrame): The reviews, with at least the 'user_id' column.
+        - test_fraction (float): The fraction of the reviews of each user to hold out (at least one).
+        - seed (int): The seed of the random split.
+
+    Returns:
+        - train_reviews (DataFrame): The reviews to fit the models on.
+        - test_reviews (DataFrame): The held-out reviews.
+    """
+    rng = np.random.default_rng(seed)
+    shuffled = reviews.iloc[rng.permutation(len(reviews))]
+
+    rank = shuffled.groupby('user_id', sort=False).cumcount().to_numpy()
+    counts = shuffled.groupby('user_id', sort=False)['user_id'].transform('size').to_numpy()
+    is_test = (counts >= 2) & (rank < np.maximum(1, np.floor(counts * test_fraction)))
+
+    return shuffled[~is_test].sort_index(), shuffled[is_test].sort_index()
+
+
+def precision_at_k(recommended, relevant, k):
+    """
+    Get the fraction of the top k recommendations that are relevant.
+    """
+    return sum(1 for item in recommended[:k] if item in relevant) / k
+
+
+def recall_at_k(recommended, relevant, k):
+    """
+    Get the fraction of the relevant items that are in the top k recommendations.
+    """
+    return sum(1 for item in recommended[:k] if item in relevant) / len(relevant) if relevant else 0.0
+
+
+def ndcg_at_k(recommended, relevant, k):
+    """
+    Get the normalized discounted cumulative gain of the top k recommendations, with binary relevance.
+    """
+    dcg = sum(1 / np.log2(rank + 2) for rank, item in enumerate(recommended[:k]) if item in relevant)
+    ideal_dcg = sum(1 / np.log2(rank + 2) for rank in range(min(len(relevant), k)))
+    return dcg / ideal_dcg if ideal_dcg > 0 else 0.0
+
+
+def evaluate_users(users, k):
+    """
+    Compute the metrics of some users from their recommendations.
+
+    Parameters:
+        - users (list): One (recommended, relevant, number of recommendations relevant to the top categories) tuple
+                        per user.
+        - k (int): The number of recommendations evaluated per user.
+
+    Returns:
+        - metrics (list): One (precision, recall, ndcg, category_precision) tuple per user.
+    """
+    metrics = []
+    for recommended, relevant, category_hits in users:
+        metrics.append((
+            precision_at_k(recommended, relevant, k),
+            recall_at_k(recommended, relevant, k),
+            ndcg_at_k(recommended, relevant, k),
+            category_hits / k
+        ))
+    return metrics
+
+
+def evaluate_batch(user_ids, relevant, k, number_of_top_categories, recommender_system=None):
+    """
+    Recommend a batch of users and compute their metrics. Runs in the worker processes of Evaluator.evaluate,
+    on the recommender system they inherit (evaluated_system), or in the calling process.
+
+    The recommendations of the batch are made in one call, and the category relevance of every recommendation
+    is checked at once with the category index.
+
+    Parameters:
+        - user_ids (list): The IDs of the users of the batch.
+        - relevant (list): The set of relevant businesses of each user.
+        - k (int): The number of recommendations per user.
+        - number_of_top_categories (int): The number of top categories of each user for the category precision.
+        - recommender_system (RecommenderSystem): The recommender system, by default evaluated_system.
+
+    Returns:
+        - metrics (list): One (precision, recall, ndcg, category_precision) tuple per user.
+        - recommended_businesses (set): The businesses recommended to at least one user of the batch.
+    """
+    rs = recommender_system if recommender_system is not None else evaluated_system
+    recommendations = rs.make_recommendations_batch(user_ids, k)
+
+    recommended_lists = [[business for business in recommended if pd.notna(business)]
+                         for recommended in recommendations.to_numpy()]
+    pair_owners = np.repeat(np.arange(len(recommended_lists)), [len(recommended) for recommended in recommended_lists])
+    pair_businesses = [business for recommended in recommended_lists for business in recommended]
+    is_relevant = rs.check_if_businesses_are_relevant_to_users([user_ids[owner] for owner in pair_owners],
+                                                               pair_businesses, number_of_top_categories)
+    category_hits = np.bincount(pair_owners, weights=is_relevant, minlength=len(recommended_lists))
+
+    metrics = evaluate_users(list(zip(recommended_lists, relevant, category_hits)), k)
+    return metrics, set(pair_businesses)
+
+
+class Evaluator:
+    """
+    Evaluator of the models of a RecommenderSystem over a seeded sample of users and a held-out split of their reviews.
+
+    The models are fitted on the training reviews, then the sampled users are split into one batch per process:
+    each process recommends its batch in one call, checks the category relevance of the recommendations at once
+    with the category index and computes the metrics of its users (see evaluate_batch):
+        - precision@k, recall@k and NDCG@k of the held-out reviews with 4 or 5 stars,
+        - coverage: the fraction of the businesses recommended to at least one user,
+        - category precision: the fraction of recommendations in the top categories of the user
+          (see RecommenderSystem.check_if_a_certain_business_is_relevant_to_user).
+
+    Parameters:
+        - recommender_system (RecommenderSystem): The recommender system, with its data loaded.
+        - number_of_users (int): The number of users to evaluate.
+        - k (int): The number of recommendations per user.
+        - test_fraction (float): The fraction of the reviews of each user to hold out.
+        - number_of_top_categories (int): The number of top categories of each user for the category precision.
+        - seed (int): The seed of the split and of the user sample.
+        - n_jobs (int): The number of processes evaluating the users. The processes are forked, so they share the
+                        fitted model instead of receiving a copy; where fork is not available the users are
+                        evaluated in the calling process.
+    """
+
+    def __init__(self, recommender_system, number_of_users=100, k=10, test_fraction=0.2, number_of_top_categories=5,
+                 seed=0, n_jobs=1):
+        """
+        Initialize the Evaluator object, splitting the reviews and sampling the users.
+        """
+        self.recommender_system = recommender_system
+        self.k = k
+        self.number_of_top_categories = number_of_top_categories
+        self.n_jobs = n_jobs
+
+        self.all_reviews = recommender_system.reviews
+        self.train_reviews, self.test_reviews = split_reviews(self.all_reviews, test_fraction, seed)
+
+        # the relevant businesses of a user are the held-out ones they rated with 4 or 5 stars
+        positive_reviews = self.test_reviews[self.test_reviews['stars'] >= 4]
+        self.relevant = positive_reviews.groupby('user_id', sort=True)['business_id'].agg(set).to_dict()
+
+        eligible_users = np.array(sorted(set(self.relevant) & set(self.train_reviews['user_id'])), dtype=object)
+        rng = np.random.default_rng(seed)
+        self.user_ids = list(rng.choice(eligible_users, min(number_of_users, len(eligible_users)), replace=False))
+
+    def evaluate(self, model_type):
+        """
+        Fit a model on the training reviews and evaluate it.
+
+        Parameters:
+            - model_type (str): The type of model to evaluate.
+
+        Returns:
+            - results (dict): The mean of every metric, with the wall time and the throughput in users per second.
+        """
+        rs = self.recommender_system
+        start_time = time.perf_counter()
+
+        rs.set_model_type(model_type)
+        rs.build_recommender_system()
+        relevant = [self.relevant[user_id] for user_id in self.user_ids]
+
+        if self.n_jobs == 1 or len(self.user_ids) < 2 or 'fork' not in multiprocessing.get_all_start_methods():
+            batches = [evaluate_batch(self.user_ids, relevant, self.k, self.number_of_top_categories, rs)]
+        else:
+            batches = self.evaluate_in_processes(relevant)
+        metrics = [user_metrics for batch_metrics, _ in batches for user_metrics in batch_metrics]
+        recommended_businesses = set().union(*(businesses for _, businesses in batches))
+
+        wall_time = time.perf_counter() - start_time
+        precision, recall, ndcg, category_precision = np.mean(metrics, axis=0) if metrics else (0.0,) * 4
+
+        return {
+            'model_type': model_type,
+            'users': len(metrics),
+            'precision@k': precision,
+            'recall@k': recall,
+            'ndcg@k': ndcg,
+            'coverage': len(recommended_businesses) / len(rs.business_ids),
+            'category_precision': category_precision,
+            'wall_time': wall_time,
+            'users_per_second': len(metrics) / wall_time
+        }
+
+    def evaluate_in_processes(self, relevant):
+        """
+        Evaluate the sampled users across forked processes, one contiguous batch of users per process, so each
+        process only pays its start-up once and shares the fitted model with the calling process.
+
+        Parameters:
+            - relevant (list): The set of relevant businesses of each sampled user.
+
+        Returns:
+            - batches (list): The metrics and the recommended businesses of each batch, see evaluate_batch.
+        """
+        global evaluated_system
+
+        number_of_batches = min(self.n_jobs, len(self.user_ids))
+        bounds = np.linspace(0, len(self.user_ids), number_of_batches + 1).astype(int)
+        evaluated_system = self.recommender_system
+        try:
+            with ProcessPoolExecutor(max_workers=number_of_batches,
+                                     mp_context=multiprocessing.get_context('fork')) as executor:
+                return list(executor.map(evaluate_batch,
+                                         [self.user_ids[start:stop] for start, stop in zip(bounds, bounds[1:])],
+                                         [relevant[start:stop] for start, stop in zip(bounds, bounds[1:])],
+                                         [self.k] * number_of_batches,
+                                         [self.number_of_top_categories] * number_of_batches))
+        finally:
+            evaluated_system = None
+
+    def evaluate_models(self, model_types):
+        """
+        Evaluate several models over the same users and split, then restore the full reviews and refit the model.
+
+        Parameters:
+            - model_types (list): The types of models to evaluate.
+
+        Returns:
+            - results (DataFrame): One row of metrics per model type.
+        """
+        rs = self.recommender_system
+        original_model_type = rs.model_type
+
+        rs.reviews = self.train_reviews
+        rs.preprocess_data()
+        try:
+            results = [self.evaluate(model_type) for model_type in model_types]
+        finally:
+            rs.reviews = self.all_reviews
+            rs.preprocess_data()
+            rs.set_model_type(original_model_type)
+            rs.build_recommender_system()
+
+        return pd.DataFrame(results).set_index('model_type')
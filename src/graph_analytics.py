@@ -0,0 +1,156 @@
+import numpy as np
+import pandas as pd
+from scipy.sparse.linalg import eigsh, svds
+
+from review_graph import ReviewGraph
+
+
+def degree_centrality(graph):
+    """
+    Compute the degree centrality of every node: its number of neighbors divided by the number of other nodes.
+
+    Parameters:
+        - graph (ReviewGraph): The review graph.
+
+    Returns:
+        - centrality (ndarray): The degree centrality of every node, users first.
+    """
+    biadjacency = graph.biadjacency
+    degrees = np.concatenate([np.diff(biadjacency.indptr), np.bincount(biadjacency.indices,
+                                                                       minlength=graph.number_of_businesses)])
+    return degrees / max(graph.number_of_nodes - 1, 1)
+
+
+def eigenvector_centrality(graph, tol=1e-8):
+    """
+    Compute the eigenvector centrality of every node from the leading eigenvector of the weighted adjacency matrix.
+
+    Parameters:
+        - graph (ReviewGraph): The review graph.
+        - tol (float): The tolerance of the eigensolver.
+
+    Returns:
+        - centrality (ndarray): The eigenvector centrality of every node (unit Euclidean norm), users first.
+    """
+    _, eigenvectors = eigsh(graph.adjacency.astype(np.float64), k=1, which='LA', tol=tol)
+    centrality = np.abs(eigenvectors[:, 0])
+    return centrality / np.linalg.norm(centrality)
+
+
+def hits(graph, tol=1e-8):
+    """
+    Compute the HITS hub scores of the users and authority scores of the businesses.
+
+    With the reviews as edges from users to businesses, the hubs and authorities are the leading left and
+    right singular vectors of the weighted (users x businesses) matrix.
+
+    Parameters:
+        - graph (ReviewGraph): The review graph.
+        - tol (float): The tolerance of the solver.
+
+    Returns:
+        - hubs (ndarray): The hub score of every user, summing to 1.
+        - authorities (ndarray): The authority score of every business, summing to 1.
+    """
+    left_vectors, _, right_vectors = svds(graph.biadjacency.astype(np.float64), k=1, tol=tol)
+    hubs = np.abs(left_vectors[:, 0])
+    authorities = np.abs(right_vectors[0])
+    return hubs / hubs.sum(), authorities / authorities.sum()
+
+
+def top_k(scores, ids, k, largest=True):
+    """
+    Get the k highest (or lowest) scores, selected with argpartition instead of sorting every score.
+
+    Parameters:
+        - scores (ndarray): The scores.
+        - ids (Index): The ID of each score.
+        - k (int): The number of scores to get.
+        - largest (bool): Whether to get the highest scores, or the lowest.
+
+    Returns:
+        - top (Series): The k selected scores indexed by ID, from the best to the worst.
+    """
+    scores = np.asarray(scores)
+    k = min(k, len(scores))
+    keys = -scores if largest else scores
+
+    selected = np.argpartition(keys, k - 1)[:k] if 0 < k < len(scores) else np.arange(k)
+    selected = selected[np.argsort(keys[selected], kind='stable')]
+
+    return pd.Series(scores[selected], index=np.asarray(ids, dtype=object)[selected])
+
+
+def top_and_bottom_k(graph, scores, k=10):
+    """
+    Get the top and bottom k users and businesses of node scores, as in the centrality tables of the notebook.
+
+    Parameters:
+        - graph (ReviewGraph): The review graph.
+        - scores (ndarray): A score for every node, users first.
+        - k (int): The number of users and businesses to get.
+
+    Returns:
+        - rankings (dict): The 'top_users', 'bottom_users', 'top_businesses' and 'bottom_businesses' Series.
+    """
+    user_scores = scores[:graph.number_of_users]
+    business_scores = scores[graph.number_of_users:]
+
+    return {
+        'top_users': top_k(user_scores, graph.user_ids, k),
+        'bottom_users': top_k(user_scores, graph.user_ids, k, largest=False),
+        'top_businesses': top_k(business_scores, graph.business_ids, k),
+        'bottom_businesses': top_k(business_scores, graph.business_ids, k, largest=False)
+    }
+
+
+def to_networkx(graph):
+    """
+    Convert the review graph to a networkx Graph, with the 'bipartite' node and the 'weight' edge attributes.
+
+    Parameters:
+        - graph (ReviewGraph): The review graph.
+
+    Returns:
+        - B (networkx.Graph): The bipartite graph, as built in the notebook.
+    """
+    import networkx as nx
+
+    B = nx.Graph()
+    B.add_nodes_from(graph.user_ids, bipartite=0)
+    B.add_nodes_from(graph.business_ids, bipartite=1)
+
+    edges = graph.biadjacency.tocoo()
+    B.add_weighted_edges_from(zip(np.asarray(graph.user_ids, dtype=object)[edges.row],
+                                  np.asarray(graph.business_ids, dtype=object)[edges.col],
+                                  edges.data.tolist()))
+    return B
+
+
+def review_graph_analytics(reviews, k=10):
+    """
+    Build the review graph of a review table and rank its users and businesses by every centrality.
+
+    Parameters:
+        - reviews (DataFrame): The reviews, with the 'user_id', 'business_id' and 'stars' columns.
+        - k (int): The number of top and bottom users and businesses to get.
+
+    Returns:
+        - rankings (dict): For 'degree' and 'eigenvector', the rankings of top_and_bottom_k, and for 'hits',
+                           the top hubs ('top_users') and authorities ('top_businesses').
+    """
+    user_codes, user_ids = pd.factorize(reviews['user_id'], sort=True)
+    business_codes, business_ids = pd.factorize(reviews['business_id'], sort=True)
+    graph = ReviewGraph.from_codes(user_codes, business_codes, reviews['stars'].to_numpy(),
+                                   pd.Index(user_ids, name='user_id'), pd.Index(business_ids, name='business_id'))
+
+    hubs, authorities = hits(graph)
+
+    return {
+        'degree': top_and_bottom_k(graph, degree_centrality(graph), k),
+        'eigenvector': top_and_bottom_k(graph, eigenvector_centrality(graph), k),
+        'hits': {
+            'top_users': top_k(hubs, graph.user_ids, k),
+            'top_businesses': top_k(authorities, graph.business_ids, k)
+        }
+    }
@@ -0,0 +1,179 @@
+import argparse
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+
+import pandas as pd
+
+from data_sources import ParquetDataSource
+
+# file of each table in the raw Yelp dataset
+DATASET_FILES = {
+    'users': 'yelp_academic_dataset_user.json',
+    'businesses': 'yelp_academic_dataset_business.json',
+    'reviews': 'yelp_academic_dataset_review.json'
+}
+
+# compact dtype of each field that can be kept, the optional counts are nullable integers
+FIELD_DTYPES = {
+    'users': {
+        'user_id': 'string', 'name': 'string', 'review_count': 'Int32', 'yelping_since': 'datetime64[ns]',
+        'useful': 'Int32', 'funny': 'Int32', 'cool': 'Int32', 'elite': 'string', 'friends': 'string',
+        'fans': 'Int32', 'average_stars': 'float32'
+    },
+    'businesses': {
+        'business_id': 'string', 'name': 'string', 'city': 'category', 'state': 'category',
+        'latitude': 'float32', 'longitude': 'float32', 'stars': 'float32', 'review_count': 'Int32',
+        'is_open': 'Int8', 'categories': 'string'
+    },
+    'reviews': {
+        'review_id': 'string', 'user_id': 'category', 'business_id': 'category', 'stars': 'int8',
+        'useful': 'Int32', 'funny': 'Int32', 'cool': 'Int32', 'text': 'string', 'date': 'datetime64[ns]'
+    }
+}
+
+# fields kept by default, the review text is only kept when asked for
+DEFAULT_FIELDS = {
+    'users': list(FIELD_DTYPES['users']),
+    'businesses': list(FIELD_DTYPES['businesses']),
+    'reviews': ['review_id', 'user_id', 'business_id', 'stars', 'date']
+}
+
+
+def iter_line_chunks(path, chunk_size):
+    """
+    Read a JSON-lines file in chunks of lines, without holding more than one chunk in memory.
+
+    Parameters:
+        - path (str): The path of the JSON-lines file.
+        - chunk_size (int): The number of lines per chunk.
+
+    Yields:
+        - lines (list): The raw lines of the next chunk.
+    """
+    with open(path, 'r', encoding='utf8') as f:
+        while True:
+            lines = list(islice(f, chunk_size))
+            if not lines:
+                return
+            yield lines
+
+
+def parse_chunk(lines, table, fields):
+    """
+    Parse a chunk of JSON lines into a DataFrame with only the given fields, in compact dtypes.
+
+    Parameters:
+        - lines (list): The raw JSON lines.
+        - table (str): The name of the table: 'users', 'businesses' or 'reviews'.
+        - fields (list): The fields to keep.
+
+    Returns:
+        - chunk (DataFrame): One row per line, one column per field.
+    """
+    rows = []
+    for line in lines:
+        record = json.loads(line)
+        rows.append([record.get(field) for field in fields])
+
+    chunk = pd.DataFrame(rows, columns=fields)
+    return chunk.astype({field: FIELD_DTYPES[table].get(field, 'object') for field in fields})
+
+
+def write_chunk(lines, table, fields, path):
+    """
+    Parse a chunk of JSON lines and write it as one Parquet file of a partitioned table.
+
+    Returns:
+        - number_of_rows (int): The number of rows written.
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    chunk = parse_chunk(lines, table, fields)
+
+    # the categories of each chunk are encoded with the smallest integers that fit them, so the dictionary
+    # columns get one index width in every part of the table, or the parts could not be read together
+    schema = pa.Schema.from_pandas(chunk, preserve_index=False)
+    for position, field in enumerate(schema):
+        if pa.types.is_dictionary(field.type):
+            schema = schema.set(position, field.with_type(pa.dictionary(pa.int32(), field.type.value_type)))
+
+    pq.write_table(pa.Table.from_pandas(chunk, schema=schema, preserve_index=False), path)
+    return len(chunk)
+
+
+def ingest_json_lines(path, output_dir, table, fields=None, chunk_size=100_000, n_jobs=1):
+    """
+    Convert a raw Yelp JSON-lines file into a directory of Parquet files, one per chunk of lines.
+
+    The file is streamed, so the memory used is bounded by the chunk size (times the number of jobs)
+    and not by the size of the file. With several jobs the chunks are parsed in a process pool, with
+    at most two chunks waiting per process.
+
+    Parameters:
+        - path (str): The path of the JSON-lines file.
+        - output_dir (str): The directory to write the Parquet files to.
+        - table (str): The name of the table: 'users', 'businesses' or 'reviews'.
+        - fields (list): The fields to keep, by default DEFAULT_FIELDS[table].
+        - chunk_size (int): The number of lines per chunk.
+        - n_jobs (int): The number of processes that parse the chunks.
+
+    Returns:
+        - number_of_rows (int): The number of rows written.
+    """
+    fields = list(fields or DEFAULT_FIELDS[table])
+    os.makedirs(output_dir, exist_ok=True)
+    chunks = iter_line_chunks(path, chunk_size)
+    part_template = os.path.join(output_dir, 'part-{:05d}.parquet')
+
+    if n_jobs == 1:
+        return sum(write_chunk(lines, table, fields, part_template.format(part)) for part, lines in enumerate(chunks))
+
+    number_of_rows = 0
+    with ProcessPoolExecutor(max_workers=n_jobs) as executor:
+        pending = []
+        for part, lines in enumerate(chunks):
+            pending.append(executor.submit(write_chunk, lines, table, fields, part_template.format(part)))
+
+            # wait for the oldest chunk before reading too far ahead
+            if len(pending) >= 2 * n_jobs:
+                number_of_rows += pending.pop(0).result()
+
+        number_of_rows += sum(future.result() for future in pending)
+
+    return number_of_rows
+
+
+def ingest_yelp_dataset(dataset_dir, data_dir, tables=tuple(DATASET_FILES), fields=None, chunk_size=100_000, n_jobs=1):
+    """
+    Convert the raw Yelp dataset files into the Parquet tables read by ParquetDataSource.
+
+    Parameters:
+        - dataset_dir (str): The directory of the yelp_academic_dataset_*.json files.
+        - data_dir (str): The data directory to write the tables to.
+        - tables (list): The tables to convert.
+        - fields (dict): Optional fields to keep per table, by default DEFAULT_FIELDS.
+        - chunk_size (int): The number of lines per chunk.
+        - n_jobs (int): The number of processes that parse the chunks.
+    """
+    data_source = ParquetDataSource(data_dir)
+
+    for table in tables:
+        number_of_rows = ingest_json_lines(os.path.join(dataset_dir, DATASET_FILES[table]), data_source.path(table),
+                                           table, fields=(fields or {}).get(table), chunk_size=chunk_size,
+                                           n_jobs=n_jobs)
+        print('Number of {}: {}'.format(table, number_of_rows))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Convert the raw Yelp JSON-lines dataset to Parquet tables.')
+    parser.add_argument('dataset_dir', help='directory of the yelp_academic_dataset_*.json files')
+    parser.add_argument('data_dir', help='directory to write the Parquet tables to')
+    parser.add_argument('--tables', nargs='+', default=list(DATASET_FILES), choices=list(DATASET_FILES))
+    parser.add_argument('--chunk-size', type=int, default=100_000)
+    parser.add_argument('--jobs', type=int, default=1)
+    args = parser.parse_args()
+
+    ingest_yelp_dataset(args.dataset_dir, args.data_dir, args.tables, chunk_size=args.chunk_size, n_jobs=args.jobs)
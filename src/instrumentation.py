@@ -0,0 +1,315 @@
+import argparse
+import cProfile
+import functools
+import io
+import json
+import os
+import platform
+import pstats
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+# the environment variable that enables the instrumentation when the module is imported, e.g.
+# RECOMMENDER_INSTRUMENTATION=1 for the timers and counters, or a comma separated list of modes among
+# 'timers', 'memory' (peak memory of each stage with tracemalloc) and 'profile' (cProfile of the whole run)
+ENVIRONMENT_VARIABLE = 'RECOMMENDER_INSTRUMENTATION'
+
+MODES = ('timers', 'memory', 'profile')
+
+
+class Instrumentation:
+    """
+    Timers, call counters and peak-memory snapshots of the stages of the pipeline.
+
+    A stage is a decorated function (see instrumented) or a block of code (see timer). When the instrumentation
+    is disabled, an instrumented call only checks one attribute before calling the function.
+
+    With memory tracking, tracemalloc traces the allocations and each stage records the peak memory it allocated
+    above the memory allocated when it started; nested stages are accounted to their parents too. With profiling,
+    a cProfile profiler runs while the instrumentation is enabled.
+    """
+
+    def __init__(self):
+        """
+        Initialize the Instrumentation object, disabled.
+        """
+        self.enabled = False
+        self.track_memory = False
+        self.started_tracing = False
+        self.profiling = False
+        self.profiler = None
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.reset()
+
+    def configure(self, enabled=True, memory=False, profile=False):
+        """
+        Enable or disable the instrumentation.
+
+        Parameters:
+            - enabled (bool): Whether to time and count the stages.
+            - memory (bool): Whether to record the peak memory of each stage with tracemalloc (slows the allocations).
+            - profile (bool): Whether to run a cProfile profiler while enabled.
+        """
+        self.enabled = enabled
+        memory, profile = enabled and memory, enabled and profile
+
+        # tracemalloc is only stopped if it was started here
+        if memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self.started_tracing = True
+        elif not memory and self.started_tracing:
+            tracemalloc.stop()
+            self.started_tracing = False
+        self.track_memory = memory
+
+        # the profile of a disabled profiler is kept until reset
+        if profile and not self.profiling:
+            self.profiler = self.profiler or cProfile.Profile()
+            self.profiler.enable()
+        elif not profile and self.profiling:
+            self.profiler.disable()
+        self.profiling = profile
+
+    def configure_from_environment(self):
+        """
+        Enable the instrumentation from the RECOMMENDER_INSTRUMENTATION environment variable, if it is set.
+        """
+        value = os.environ.get(ENVIRONMENT_VARIABLE, '').strip().lower()
+        if value in ('', '0', 'false', 'off'):
+            return
+
+        modes = set(MODES[:1]) if value in ('1', 'true', 'on') else {mode.strip() for mode in value.split(',')}
+        unknown = modes - set(MODES)
+        if unknown:
+            raise ValueError('Invalid instrumentation mode: {}'.format(', '.join(sorted(unknown))))
+        self.configure(enabled=True, memory='memory' in modes, profile='profile' in modes)
+
+    def reset(self):
+        """
+        Clear the recorded stages and counters, and the profile.
+        """
+        with self.lock:
+            self.stages = {}
+            self.counters = {}
+        if self.profiling:
+            self.profiler.disable()
+            self.profiler = cProfile.Profile()
+            self.profiler.enable()
+        else:
+            self.profiler = None
+
+    def get_stack(self):
+        """
+        Get the memory frames of the stages running in the current thread.
+        """
+        if not hasattr(self.local, 'stack'):
+            self.local.stack = []
+        return self.local.stack
+
+    def start_stage(self):
+        """
+        Start a stage, returning its start time and memory frame.
+        """
+        frame = None
+        if self.track_memory:
+            current, peak = tracemalloc.get_traced_memory()
+            stack = self.get_stack()
+            # the peak is reset for the stage, so the peak so far is kept by the running parent
+            if stack:
+                stack[-1][1] = max(stack[-1][1], peak)
+            tracemalloc.reset_peak()
+            frame = [current, current]
+            stack.append(frame)
+        return time.perf_counter(), frame
+
+    def stop_stage(self, name, start_time, frame):
+        """
+        Stop a stage started with start_stage, and record its time and peak memory.
+        """
+        elapsed = time.perf_counter() - start_time
+        peak_memory = None
+        if frame is not None:
+            frame[1] = max(frame[1], tracemalloc.get_traced_memory()[1])
+            stack = self.get_stack()
+            stack.pop()
+            if stack:
+                stack[-1][1] = max(stack[-1][1], frame[1])
+            peak_memory = frame[1] - frame[0]
+
+        with self.lock:
+            stage = self.stages.get(name)
+            if stage is None:
+                stage = self.stages[name] = {'calls': 0, 'total_time': 0.0, 'min_time': float('inf'),
+                                             'max_time': 0.0, 'peak_memory': None}
+            stage['calls'] += 1
+            stage['total_time'] += elapsed
+            stage['min_time'] = min(stage['min_time'], elapsed)
+            stage['max_time'] = max(stage['max_time'], elapsed)
+            if peak_memory is not None:
+                stage['peak_memory'] = max(stage['peak_memory'] or 0, peak_memory)
+
+    def increment(self, name, value=1):
+        """
+        Increase a counter, e.g. the number of users scored, if the instrumentation is enabled.
+        """
+        if not self.enabled:
+            return
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def get_profile(self, number_of_functions=30, sort='cumulative'):
+        """
+        Get the report of the cProfile profiler, or None if it does not run.
+
+        Parameters:
+            - number_of_functions (int): The number of functions of the report.
+            - sort (str): The sort key of the report, see pstats.Stats.sort_stats.
+
+        Returns:
+            - report (str): The report of the most expensive functions.
+        """
+        if self.profiler is None:
+            return None
+        output = io.StringIO()
+        pstats.Stats(self.profiler, stream=output).sort_stats(sort).print_stats(number_of_functions)
+        return output.getvalue()
+
+    def to_dict(self):
+        """
+        Get the recorded stages and counters, with the mean time of each stage.
+
+        Returns:
+            - report (dict): The 'stages', by name, with their calls, total, mean, min and max times in seconds and
+                             their peak memory in bytes (None without memory tracking), the 'counters' and a
+                             description of the 'environment' of the run.
+        """
+        with self.lock:
+            stages = {name: dict(stage, mean_time=stage['total_time'] / stage['calls'])
+                      for name, stage in sorted(self.stages.items())}
+            counters = dict(sorted(self.counters.items()))
+
+        return {
+            'stages': stages,
+            'counters': counters,
+            'environment': {
+                'python': platform.python_version(),
+                'platform': platform.platform(),
+                'memory_tracking': self.track_memory,
+                'time': time.strftime('%Y-%m-%dT%H:%M:%S')
+            }
+        }
+
+    def export_json(self, path):
+        """
+        Write the recorded stages and counters to a JSON file, see to_dict. A .prof file of the cProfile
+        profiler is written next to it when profiling.
+
+        Parameters:
+            - path (str): The path of the JSON file.
+        """
+        with open(path, 'w') as f:
+            json.dump(self.to_dict(), f, indent=2)
+        if self.profiler is not None:
+            self.profiler.dump_stats(os.path.splitext(path)[0] + '.prof')
+
+    def print_report(self):
+        """
+        Print the recorded stages, from the most to the least expensive, and the counters.
+        """
+        report = self.to_dict()
+        print('{:<55} {:>8} {:>11} {:>11} {:>11}'.format('stage', 'calls', 'total (s)', 'mean (ms)', 'peak (MB)'))
+        for name, stage in sorted(report['stages'].items(), key=lambda item: -item[1]['total_time']):
+            peak = '{:.1f}'.format(stage['peak_memory'] / 2 ** 20) if stage['peak_memory'] is not None else '-'
+            print('{:<55} {:>8} {:>11.3f} {:>11.3f} {:>11}'.format(name, stage['calls'], stage['total_time'],
+                                                                   1000 * stage['mean_time'], peak))
+        for name, value in report['counters'].items():
+            print('{:<55} {:>8}'.format(name, value))
+
+
+# the instrumentation of the process, shared by every module
+instrumentation = Instrumentation()
+instrumentation.configure_from_environment()
+
+
+def instrumented(name=None):
+    """
+    Decorate a function to time, count and measure the memory of its calls when the instrumentation is enabled.
+
+    Parameters:
+        - name (str): The name of the stage, by default the qualified name of the function.
+    """
+    def decorator(function):
+        stage_name = name or function.__qualname__
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if not instrumentation.enabled:
+                return function(*args, **kwargs)
+
+            start_time, frame = instrumentation.start_stage()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                instrumentation.stop_stage(stage_name, start_time, frame)
+
+        return wrapper
+
+    return decorator
+
+
+@contextmanager
+def timer(name):
+    """
+    Time, count and measure the memory of a block of code as a stage, when the instrumentation is enabled.
+
+    Parameters:
+        - name (str): The name of the stage.
+    """
+    if not instrumentation.enabled:
+        yield
+        return
+
+    start_time, frame = instrumentation.start_stage()
+    try:
+        yield
+    finally:
+        instrumentation.stop_stage(name, start_time, frame)
+
+
+def compare_reports(before, after):
+    """
+    Compare the stages of two JSON reports written by export_json, e.g. of the same benchmark on two versions.
+
+    Parameters:
+        - before (dict): The report of the reference run.
+        - after (dict): The report of the new run.
+
+    Returns:
+        - comparison (list): One (stage, mean time before, mean time after, ratio) tuple per stage of both reports,
+                             from the largest slowdown to the largest speedup.
+    """
+    comparison = []
+    for name in sorted(set(before['stages']) & set(after['stages'])):
+        mean_before = before['stages'][name]['mean_time']
+        mean_after = after['stages'][name]['mean_time']
+        comparison.append((name, mean_before, mean_after, mean_after / mean_before if mean_before else float('inf')))
+    return sorted(comparison, key=lambda row: -row[3])
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Compare two instrumentation reports written by export_json.')
+    parser.add_argument('before', help='JSON report of the reference run')
+    parser.add_argument('after', help='JSON report of the new run')
+    args = parser.parse_args()
+
+    with open(args.before) as f:
+        before = json.load(f)
+    with open(args.after) as f:
+        after = json.load(f)
+
+    print('{:<55} {:>12} {:>12} {:>8}'.format('stage', 'before (ms)', 'after (ms)', 'ratio'))
+    for name, mean_before, mean_after, ratio in compare_reports(before, after):
+        print('{:<55} {:>12.3f} {:>12.3f} {:>8.2f}'.format(name, 1000 * mean_before, 1000 * mean_after, ratio))
@@ -0,0 +1,138 @@
+import numpy as np
+import scipy.sparse as sp
+from joblib import Parallel, delayed
+from sklearn.preprocessing import normalize
+
+from ranking import truncate_rows
+from user_item_matrix import grow_matrix
+
+
+def compute_item_neighbors(item_vectors, items, n_neighbors):
+    """
+    Compute the top-k cosine neighbors of some items.
+
+    Parameters:
+        - item_vectors (csr_matrix): The L2 normalized (items x users) rating vectors of every item.
+        - items (ndarray): The items whose neighbors are computed.
+        - n_neighbors (int): The number of neighbors to keep per item.
+
+    Returns:
+        - neighbors (csr_matrix): A (len(items) x items) matrix with the similarity to the neighbors of each item.
+    """
+    similarities = item_vectors[items] @ item_vectors.T
+
+    # an item is not its own neighbor
+    itself = sp.csr_matrix((np.ones(len(items)), (np.arange(len(items)), items)), shape=similarities.shape)
+
+    return truncate_rows(similarities, n_neighbors, exclude=itself)
+
+
+def compute_block_neighbors(item_vectors, start, stop, n_neighbors):
+    """
+    Compute the top-k cosine neighbors of a block of items.
+
+    Parameters:
+        - item_vectors (csr_matrix): The L2 normalized (items x users) rating vectors of every item.
+        - start (int): The first item of the block.
+        - stop (int): The item after the last item of the block.
+        - n_neighbors (int): The number of neighbors to keep per item.
+
+    Returns:
+        - neighbors (csr_matrix): A (block items x items) matrix with the similarity to the neighbors of each item.
+    """
+    return compute_item_neighbors(item_vectors, np.arange(start, stop), n_neighbors)
+
+
+class ItemKNN:
+    """
+    Item-based KNN model with a precomputed, sparse top-k cosine neighbor graph over the businesses.
+
+    The graph is built once, by blocks of items that can run in parallel. A user is scored by
+    aggregating the neighbors of the items they rated, weighted by their ratings, so the cost of a
+    query depends on the number of ratings of the user and not on the number of users.
+
+    Parameters:
+        - n_neighbors (int): The number of neighbors kept per item.
+        - block_size (int): The number of items whose neighbors are computed together.
+        - n_jobs (int): The number of parallel jobs used to build the graph (-1 for all the cores).
+    """
+
+    def __init__(self, n_neighbors=20, block_size=1024, n_jobs=None):
+        """
+        Initialize the ItemKNN object.
+
+        Parameters:
+            - n_neighbors (int): The number of neighbors kept per item.
+            - block_size (int): The number of items whose neighbors are computed together.
+            - n_jobs (int): The number of parallel jobs used to build the graph (-1 for all the cores).
+        """
+        self.n_neighbors = n_neighbors
+        self.block_size = block_size
+        self.n_jobs = n_jobs
+
+    def fit(self, user_item_ratings):
+        """
+        Build the neighbor graph of the items from a user-item matrix.
+
+        Parameters:
+            - user_item_ratings (csr_matrix): The (users x items) ratings.
+
+        Returns:
+            - self (ItemKNN): The fitted model, with the (items x items) graph in neighbors_.
+        """
+        item_vectors = normalize(sp.csr_matrix(user_item_ratings.T, dtype=np.float32), norm='l2', axis=1)
+        number_of_items = item_vectors.shape[0]
+
+        blocks = Parallel(n_jobs=self.n_jobs)(
+            delayed(compute_block_neighbors)(item_vectors, start, min(start + self.block_size, number_of_items),
+                                             self.n_neighbors)
+            for start in range(0, number_of_items, self.block_size)
+        )
+
+        self.neighbors_ = sp.vstack(blocks, format='csr', dtype=np.float32) if blocks else \
+            sp.csr_matrix((number_of_items, number_of_items), dtype=np.float32)
+
+        return self
+
+    def refresh(self, user_item_ratings, items):
+        """
+        Recompute the neighbors of some items after their ratings changed, and add the new items to the graph.
+
+        The other items keep their neighbors, with the similarities of the last fit or refresh.
+
+        Parameters:
+            - user_item_ratings (csr_matrix): The updated (users x items) ratings, with the new items as last columns.
+            - items (ndarray): The items whose ratings changed, including the new ones.
+
+        Returns:
+            - self (ItemKNN): The updated model.
+        """
+        number_of_items = user_item_ratings.shape[1]
+        items = np.unique(np.asarray(items, dtype=np.intp))
+
+        # grow the graph with the new items, which have no neighbors yet
+        neighbors = grow_matrix(self.neighbors_, (number_of_items, number_of_items))
+
+        item_vectors = normalize(sp.csr_matrix(user_item_ratings.T, dtype=np.float32), norm='l2', axis=1)
+        refreshed = compute_item_neighbors(item_vectors, items, self.n_neighbors).tocoo()
+
+        # replace the rows of the refreshed items
+        kept = np.ones(number_of_items, dtype=np.float32)
+        kept[items] = 0
+        self.neighbors_ = (sp.diags(kept) @ neighbors + sp.csr_matrix(
+            (refreshed.data, (items[refreshed.row], refreshed.col)), shape=neighbors.shape)).astype(np.float32).tocsr()
+        self.neighbors_.eliminate_zeros()
+
+        return self
+
+    def score(self, user_ratings):
+        """
+        Score every item for some users by aggregating the neighbors of the items they rated.
+
+        Parameters:
+            - user_ratings (csr_matrix): The (users x items) ratings of the users to score.
+
+        Returns:
+            - scores (csr_matrix): The (users x items) scores; items that are no neighbor of a rated item are missing.
+        """
+        return sp.csr_matrix(user_ratings, dtype=np.float32) @ self.neighbors_
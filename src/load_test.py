@@ -0,0 +1,100 @@
+import argparse
+import asyncio
+import time
+from urllib.parse import quote
+
+import numpy as np
+
+import model_store
+
+
+async def send_requests(host, port, requests, latencies, errors):
+    """
+    Send requests one after the other over a kept-alive connection, recording the latency of each.
+
+    Parameters:
+        - host (str): The address of the service.
+        - port (int): The port of the service.
+        - requests (iterator): The (user ID, number of recommendations) of the requests, shared by the connections.
+        - latencies (list): The list the latencies in seconds are appended to.
+        - errors (list): The list the statuses of the failed requests are appended to.
+    """
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        for user_id, number_of_recommendations in requests:
+            start_time = time.perf_counter()
+            writer.write('GET /recommendations?user_id={}&n={} HTTP/1.1\r\nHost: {}\r\n\r\n'.format(
+                quote(user_id), number_of_recommendations, host).encode())
+            await writer.drain()
+
+            status = int((await reader.readline()).split()[1])
+            content_length = 0
+            while True:
+                line = await reader.readline()
+                if line in (b'\r\n', b''):
+                    break
+                name, _, value = line.decode('latin-1').partition(':')
+                if name.strip().lower() == 'content-length':
+                    content_length = int(value)
+            await reader.readexactly(content_length)
+
+            latencies.append(time.perf_counter() - start_time)
+            if status != 200:
+                errors.append(status)
+    finally:
+        writer.close()
+
+
+async def run_load_test(host, port, user_ids, number_of_requests=10_000, concurrency=64, number_of_recommendations=10,
+                        seed=0):
+    """
+    Send recommendation requests for random users from concurrent clients and measure the latencies.
+
+    Parameters:
+        - host (str): The address of the service.
+        - port (int): The port of the service.
+        - user_ids (ndarray): The IDs of the users to request recommendations for.
+        - number_of_requests (int): The total number of requests.
+        - concurrency (int): The number of connections sending requests at the same time.
+        - number_of_recommendations (int): The number of recommendations of each request.
+        - seed (int): The seed of the random users.
+
+    Returns:
+        - results (dict): The number of requests and errors, the throughput and the latency percentiles.
+    """
+    rng = np.random.default_rng(seed)
+    requests = iter([(user_id, number_of_recommendations)
+                     for user_id in rng.choice(np.asarray(user_ids, dtype=object), number_of_requests)])
+    latencies, errors = [], []
+
+    start_time = time.perf_counter()
+    await asyncio.gather(*(send_requests(host, port, requests, latencies, errors) for _ in range(concurrency)))
+    wall_time = time.perf_counter() - start_time
+
+    latencies = np.array(latencies)
+    return {
+        'requests': len(latencies),
+        'errors': len(errors),
+        'requests_per_second': len(latencies) / wall_time,
+        'p50_ms': 1000 * np.percentile(latencies, 50),
+        'p99_ms': 1000 * np.percentile(latencies, 99),
+        'mean_ms': 1000 * latencies.mean()
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Load test a running recommendation service (see service.py).')
+    parser.add_argument('model_dir', help='directory of the served model, to draw the user IDs from')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--requests', type=int, default=10_000, help='total number of requests')
+    parser.add_argument('--concurrency', type=int, default=64, help='number of concurrent connections')
+    parser.add_argument('--n', type=int, default=10, help='number of recommendations per request')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    user_ids = model_store.load_ids(args.model_dir, 'user_ids', 'user_id')
+    results = asyncio.run(run_load_test(args.host, args.port, user_ids, args.requests, args.concurrency, args.n,
+                                        args.seed))
+    print('{requests} requests, {errors} errors, {requests_per_second:.0f} requests/s, '
+          'latency p50 {p50_ms:.2f} ms, p99 {p99_ms:.2f} ms, mean {mean_ms:.2f} ms'.format(**results))
@@ -0,0 +1,140 @@
+import hashlib
+import json
+import os
+
+import numpy as np
+import pandas as pd
+import scipy.sparse as sp
+
+# version of the on-disk layout, increased whenever the files of a model change
+FORMAT_VERSION = 1
+
+MANIFEST_FILE = 'manifest.json'
+
+
+def data_fingerprint(reviews):
+    """
+    Compute a fingerprint of the review data a model is fitted on.
+
+    Parameters:
+        - reviews (DataFrame): The reviews, with the 'user_id', 'business_id' and 'stars' columns.
+
+    Returns:
+        - fingerprint (str): A hexadecimal SHA-256 digest of the (user, business, stars) triples.
+    """
+    hashes = pd.util.hash_pandas_object(reviews[['user_id', 'business_id', 'stars']], index=False)
+    return hashlib.sha256(hashes.to_numpy().tobytes()).hexdigest()
+
+
+def save_array(path, name, array):
+    """
+    Save an array as a .npy file that can be memory-mapped.
+
+    The array is written to a temporary file that then replaces the previous file, so the arrays still
+    memory-mapped from the previous file, e.g. of a model saved back to the directory it was restored from,
+    keep reading it instead of a file truncated under them.
+
+    Parameters:
+        - path (str): The directory of the model.
+        - name (str): The name of the array.
+        - array (ndarray): The array to save.
+    """
+    file_path = os.path.join(path, name + '.npy')
+    with open(file_path + '.tmp', 'wb') as f:
+        np.save(f, np.ascontiguousarray(array), allow_pickle=False)
+    os.replace(file_path + '.tmp', file_path)
+
+
+def load_array(path, name, mmap=True):
+    """
+    Load an array saved with save_array.
+
+    Parameters:
+        - path (str): The directory of the model.
+        - name (str): The name of the array.
+        - mmap (bool): Whether to memory-map the file instead of reading it.
+
+    Returns:
+        - array (ndarray): The loaded array, read-only when memory-mapped.
+    """
+    return np.load(os.path.join(path, name + '.npy'), mmap_mode='r' if mmap else None, allow_pickle=False)
+
+
+def save_sparse(path, name, matrix):
+    """
+    Save a CSR matrix as three .npy files (data, indices and indptr) that can be memory-mapped.
+
+    Parameters:
+        - path (str): The directory of the model.
+        - name (str): The name of the matrix.
+        - matrix (csr_matrix): The matrix to save.
+    """
+    matrix = sp.csr_matrix(matrix)
+    save_array(path, name + '.data', matrix.data)
+    save_array(path, name + '.indices', matrix.indices)
+    save_array(path, name + '.indptr', matrix.indptr)
+
+
+def load_sparse(path, name, shape, mmap=True):
+    """
+    Load a CSR matrix saved with save_sparse.
+
+    Parameters:
+        - path (str): The directory of the model.
+        - name (str): The name of the matrix.
+        - shape (tuple): The shape of the matrix.
+        - mmap (bool): Whether to memory-map the files instead of reading them.
+
+    Returns:
+        - matrix (csr_matrix): The loaded matrix.
+    """
+    return sp.csr_matrix((load_array(path, name + '.data', mmap),
+                          load_array(path, name + '.indices', mmap),
+                          load_array(path, name + '.indptr', mmap)), shape=tuple(shape), copy=False)
+
+
+def save_ids(path, name, ids):
+    """
+    Save an index of string IDs as a fixed-width unicode array, so it can be memory-mapped.
+    """
+    save_array(path, name, np.asarray(ids, dtype=str))
+
+
+def load_ids(path, name, index_name, mmap=True):
+    """
+    Load an index of IDs saved with save_ids.
+    """
+    return pd.Index(load_array(path, name, mmap).astype(object), name=index_name)
+
+
+def write_manifest(path, manifest):
+    """
+    Write the manifest of a model, after all its arrays have been saved.
+    """
+    manifest = dict(manifest, format_version=FORMAT_VERSION)
+    with open(os.path.join(path, MANIFEST_FILE), 'w') as f:
+        json.dump(manifest, f, indent=2)
+
+
+def read_manifest(path):
+    """
+    Read and validate the manifest of a saved model.
+
+    Parameters:
+        - path (str): The directory of the model.
+
+    Returns:
+        - manifest (dict): The manifest, or None if there is no model saved in the directory.
+    """
+    manifest_path = os.path.join(path, MANIFEST_FILE)
+    if not os.path.exists(manifest_path):
+        return None
+
+    with open(manifest_path) as f:
+        manifest = json.load(f)
+
+    if manifest.get('format_version') != FORMAT_VERSION:
+        raise ValueError('Unsupported model format version {} in {}, expected {}.'.format(
+            manifest.get('format_version'), path, FORMAT_VERSION))
+
+    return manifest
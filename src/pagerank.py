@@ -0,0 +1,214 @@
+import numpy as np
+import pandas as pd
+import scipy.sparse as sp
+
+from ranking import masked_top_n
+from review_graph import ReviewGraph
+
+
+def transition_matrix(adjacency):
+    """
+    Row-normalize a weighted adjacency matrix into a sparse transition matrix.
+
+    Parameters:
+        - adjacency (csr_matrix): The (nodes x nodes) matrix of edge weights.
+
+    Returns:
+        - transitions (csr_matrix): The matrix of transition probabilities; the rows of dangling nodes are empty.
+        - dangling (ndarray): A boolean mask of the nodes without outgoing edges.
+    """
+    adjacency = sp.csr_matrix(adjacency, dtype=np.float64)
+    out_weights = np.asarray(adjacency.sum(axis=1)).ravel()
+    dangling = out_weights == 0
+
+    inverse_weights = np.divide(1.0, out_weights, out=np.zeros_like(out_weights), where=~dangling)
+    return sp.diags(inverse_weights) @ adjacency, dangling
+
+
+def power_iteration(transitions_t, dangling, teleport, damping=0.85, tol=1e-8, max_iter=100):
+    """
+    Iterate the PageRank equation for one or several teleport distributions at once.
+
+    Parameters:
+        - transitions_t (csr_matrix): The transposed transition matrix, see transition_matrix.
+        - dangling (ndarray): The boolean mask of the nodes without outgoing edges.
+        - teleport (ndarray): A (nodes x k) array whose columns are teleport distributions summing to 1;
+                              the ranks are computed in its dtype.
+        - damping (float): The probability of following an edge.
+        - tol (float): The L1 change of the ranks under which the iteration stops.
+        - max_iter (int): The maximum number of iterations.
+
+    Returns:
+        - ranks (ndarray): The (nodes x k) ranks, one column per teleport distribution.
+    """
+    ranks = teleport.copy()
+    for _ in range(max_iter):
+        # the rank of the dangling nodes teleports, as it has no edge to follow
+        dangling_ranks = ranks[dangling].sum(axis=0)
+        new_ranks = damping * (transitions_t @ ranks + dangling_ranks * teleport) + (1 - damping) * teleport
+        change = np.abs(new_ranks - ranks).sum(axis=0).max()
+        ranks = new_ranks
+        if change < tol:
+            break
+
+    return ranks
+
+
+def teleport_distribution(personalization, number_of_nodes, dtype=np.float64):
+    """
+    Normalize teleport weights into (nodes x k) distributions of a dtype; columns without weight become uniform.
+    """
+    teleport = personalization.toarray() if sp.issparse(personalization) else np.array(personalization, dtype=float)
+    teleport = teleport.reshape(number_of_nodes, -1).astype(dtype, copy=False)
+    totals = teleport.sum(axis=0)
+    return np.divide(teleport, totals, out=np.full_like(teleport, 1.0 / number_of_nodes), where=totals > 0)
+
+
+def pagerank(adjacency, damping=0.85, personalization=None, tol=1e-8, max_iter=100):
+    """
+    Compute the (personalized) PageRank of the nodes of a weighted graph by power iteration.
+
+    The random surfer follows an edge with a probability proportional to its weight, or teleports to a node
+    drawn from the personalization with probability 1 - damping. The rank of the dangling nodes is
+    redistributed as a teleport. Several personalizations can be given as columns and are iterated together.
+
+    Parameters:
+        - adjacency (csr_matrix): The (nodes x nodes) matrix of edge weights.
+        - damping (float): The probability of following an edge.
+        - personalization (ndarray or sparse matrix): Optional (nodes,) or (nodes x k) teleport weights,
+                                                      by default uniform over every node.
+        - tol (float): The L1 change of the ranks under which the iteration stops.
+        - max_iter (int): The maximum number of iterations.
+
+    Returns:
+        - ranks (ndarray): The PageRank of every node, of the shape of the personalization; each column sums to 1.
+    """
+    transitions, dangling = transition_matrix(adjacency)
+    number_of_nodes = transitions.shape[0]
+
+    if personalization is None:
+        teleport = np.full((number_of_nodes, 1), 1.0 / number_of_nodes)
+    else:
+        teleport = teleport_distribution(personalization, number_of_nodes)
+
+    ranks = power_iteration(transitions.T.tocsr(), dangling, teleport, damping, tol, max_iter)
+
+    return ranks.ravel() if personalization is None or np.ndim(personalization) == 1 else ranks
+
+
+class PersonalizedPageRank:
+    """
+    Recommender that ranks the businesses by their personalized PageRank on the user-business review graph.
+
+    The random walk teleports back to the businesses the user reviewed, weighted by their stars, and
+    follows the star-weighted review edges, so it reaches the businesses reviewed by similar users.
+
+    Every personalization needs a dense rank vector over all the nodes of the graph, so the users are solved
+    block_size at a time in float32, and only the top recommendations of each block are kept.
+
+    Parameters:
+        - damping (float): The probability of following an edge instead of teleporting.
+        - tol (float): The L1 change of the ranks under which the iteration stops.
+        - max_iter (int): The maximum number of iterations.
+        - block_size (int): The number of personalizations iterated together.
+    """
+
+    def __init__(self, damping=0.85, tol=1e-6, max_iter=50, block_size=32):
+        """
+        Initialize the PersonalizedPageRank object.
+
+        Parameters:
+            - damping (float): The probability of following an edge instead of teleporting.
+            - tol (float): The L1 change of the ranks under which the iteration stops.
+            - max_iter (int): The maximum number of iterations.
+            - block_size (int): The number of personalizations iterated together.
+        """
+        self.damping = damping
+        self.tol = tol
+        self.max_iter = max_iter
+        self.block_size = block_size
+
+    def fit(self, user_item_ratings):
+        """
+        Build the transition matrix of the review graph of a user-item matrix.
+
+        Parameters:
+            - user_item_ratings (csr_matrix): The (users x businesses) ratings, used as edge weights.
+
+        Returns:
+            - self (PersonalizedPageRank): The fitted model.
+        """
+        graph = ReviewGraph(user_item_ratings, user_ids=None, business_ids=None)
+        self.number_of_users = graph.number_of_users
+
+        transitions, self.dangling_ = transition_matrix(graph.adjacency)
+        self.transitions_t_ = transitions.T.tocsr().astype(np.float32)
+        return self
+
+    def score(self, user_ratings):
+        """
+        Score every business for a block of users by a personalized PageRank seeded from the businesses they rated.
+
+        The ranks take (nodes x users) float32 values, so the users should come by blocks of block_size,
+        see recommend.
+
+        Parameters:
+            - user_ratings (csr_matrix): The (users x businesses) ratings of the users to score.
+
+        Returns:
+            - scores (ndarray): The dense (users x businesses) float32 PageRank of the businesses.
+        """
+        # teleport only to the business nodes, weighted by the stars of the user
+        seeds = sp.hstack([sp.csr_matrix((user_ratings.shape[0], self.number_of_users)), user_ratings], format='csr')
+        teleport = teleport_distribution(seeds.T, self.transitions_t_.shape[0], dtype=np.float32)
+
+        ranks = power_iteration(self.transitions_t_, self.dangling_, teleport, self.damping, self.tol, self.max_iter)
+        return ranks[self.number_of_users:].T
+
+    def recommend(self, user_ratings, n, exclude=None, allowed=None):
+        """
+        Get the n businesses with the highest personalized PageRank for some users, block_size users at a time,
+        without keeping the scores of more than one block.
+
+        Parameters:
+            - user_ratings (csr_matrix): The (users x businesses) ratings of the users to score.
+            - n (int): The number of businesses to get per user.
+            - exclude (csr_matrix): An optional (users x businesses) matrix, whose non-zero entries are never selected.
+            - allowed (ndarray): An optional boolean mask of the businesses that can be selected.
+
+        Returns:
+            - indices (ndarray): A (users x min(n, businesses)) array of business indices, from the best to the worst,
+                                 padded with -1 when a user has fewer than n selectable businesses.
+        """
+        user_ratings = sp.csr_matrix(user_ratings)
+        blocks = []
+        for start in range(0, user_ratings.shape[0], self.block_size):
+            stop = min(start + self.block_size, user_ratings.shape[0])
+            scores = self.score(user_ratings[start:stop])
+            if allowed is not None:
+                scores[:, ~allowed] = -np.inf
+            blocks.append(masked_top_n(scores, n, exclude=exclude[start:stop] if exclude is not None else None))
+
+        return np.vstack(blocks) if blocks else \
+            np.empty((0, min(n, user_ratings.shape[1])), dtype=np.intp)
+
+
+def review_pagerank(reviews, damping=0.85, tol=1e-8, max_iter=100):
+    """
+    Compute the PageRank of the users and businesses of a review table, on the star-weighted review graph.
+
+    Parameters:
+        - reviews (DataFrame): The reviews, with the 'user_id', 'business_id' and 'stars' columns.
+        - damping (float): The probability of following an edge.
+        - tol (float): The L1 change of the ranks under which the iteration stops.
+        - max_iter (int): The maximum number of iterations.
+
+    Returns:
+        - user_ranks (Series): The PageRank of each user, indexed by user ID.
+        - business_ranks (Series): The PageRank of each business, indexed by business ID.
+    """
+    graph = ReviewGraph.from_reviews(reviews)
+    ranks = pagerank(graph.adjacency, damping, tol=tol, max_iter=max_iter)
+
+    return (pd.Series(ranks[:graph.number_of_users], index=graph.user_ids, name='pagerank'),
+            pd.Series(ranks[graph.number_of_users:], index=graph.business_ids, name='pagerank'))
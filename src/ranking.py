@@ -0,0 +1,230 @@
+import numpy as np
+from scipy.sparse import csr_matrix
+
+
+def top_n_indices(scores, n):
+    """
+    Get the column indices of the n highest scores of each row, from the highest to the lowest.
+
+    Only the n best columns are sorted: they are first selected with argpartition in linear time.
+
+    Parameters:
+        - scores (ndarray): A 2-d array of scores, one row per user.
+        - n (int): The number of indices to get per row.
+
+    Returns:
+        - indices (ndarray): A (rows x min(n, columns)) array of column indices.
+    """
+    n = min(n, scores.shape[1])
+    if n <= 0:
+        return np.empty((scores.shape[0], 0), dtype=np.intp)
+
+    if n < scores.shape[1]:
+        indices = np.argpartition(-scores, n - 1, axis=1)[:, :n]
+    else:
+        indices = np.broadcast_to(np.arange(n), scores.shape).copy()
+
+    order = np.argsort(-np.take_along_axis(scores, indices, axis=1), axis=1, kind='stable')
+    return np.take_along_axis(indices, order, axis=1)
+
+
+def pad_columns(indices, n):
+    """
+    Pad an array of indices with -1 columns up to n columns, e.g. when the catalog has fewer than n items.
+    """
+    if indices.shape[1] >= n:
+        return indices
+    return np.pad(indices, ((0, 0), (0, n - indices.shape[1])), constant_values=-1)
+
+
+def masked_top_n(scores, n, exclude=None):
+    """
+    Get the column indices of the n highest scores of each row, never selecting the excluded entries.
+
+    Parameters:
+        - scores (ndarray): A 2-d array of scores, one row per user. It is modified in place.
+        - n (int): The number of indices to get per row.
+        - exclude (csr_matrix): An optional matrix of the same shape, whose non-zero entries are never selected.
+
+    Returns:
+        - indices (ndarray): A (rows x min(n, columns)) array of column indices, from the best to the worst,
+                             padded with -1 when a row has fewer than n selectable columns.
+    """
+    if exclude is not None:
+        exclude = exclude.tocoo()
+        scores[exclude.row, exclude.col] = -np.inf
+
+    indices = top_n_indices(scores, n)
+    indices[np.take_along_axis(scores, indices, axis=1) == -np.inf] = -1
+    return indices
+
+
+def blocked_top_n(user_factors, item_factors, n, exclude=None, block_size=65536):
+    """
+    Get the n items with the highest latent-factor scores for each user, scoring the catalog by blocks.
+
+    The scores of each user are the dot products user_factors @ item_factors.T, but only a block of
+    block_size items is scored at a time and merged into the running top-n, so the memory used does
+    not grow with the number of items.
+
+    Parameters:
+        - user_factors (ndarray): A (users x rank) array with the latent factors of the users.
+        - item_factors (ndarray): An (items x rank) array with the latent factors of the items.
+        - n (int): The number of items to get per user.
+        - exclude (csr_matrix): An optional (users x items) matrix, whose non-zero entries are never recommended.
+        - block_size (int): The number of items scored at a time.
+
+    Returns:
+        - indices (ndarray): A (users x min(n, items)) array of item indices, from the best to the worst.
+                             Users with fewer than n items that are not excluded are padded with -1.
+    """
+    number_of_users = user_factors.shape[0]
+    best_indices = np.empty((number_of_users, 0), dtype=np.intp)
+    best_scores = np.empty((number_of_users, 0), dtype=item_factors.dtype)
+
+    if exclude is not None:
+        exclude = exclude.tocoo()
+
+    for start in range(0, item_factors.shape[0], block_size):
+        stop = min(start + block_size, item_factors.shape[0])
+        scores = user_factors @ item_factors[start:stop].T
+
+        # the already rated items of the block get the lowest possible score
+        if exclude is not None:
+            in_block = (exclude.col >= start) & (exclude.col < stop)
+            scores[exclude.row[in_block], exclude.col[in_block] - start] = -np.inf
+
+        block_indices = top_n_indices(scores, n)
+        block_scores = np.take_along_axis(scores, block_indices, axis=1)
+
+        # merge the best items of the block with the best items so far
+        candidate_indices = np.hstack([best_indices, block_indices + start])
+        candidate_scores = np.hstack([best_scores, block_scores])
+        selected = top_n_indices(candidate_scores, n)
+        best_indices = np.take_along_axis(candidate_indices, selected, axis=1)
+        best_scores = np.take_along_axis(candidate_scores, selected, axis=1)
+
+    best_indices[best_scores == -np.inf] = -1
+    return best_indices
+
+
+def blocked_sparse_top_n(user_profiles, item_profiles, n, exclude=None, block_size=65536):
+    """
+    Get the n items with the highest sparse dot products for each user, scoring the catalog by blocks.
+
+    The sparse equivalent of blocked_top_n: the scores of each user are user_profiles @ item_profiles.T,
+    computed for a block of block_size items at a time and merged into a running sparse top-n, so the memory
+    used is bounded by the scores of a block instead of growing with the number of items.
+
+    Parameters:
+        - user_profiles (csr_matrix): A (users x features) matrix with the profiles of the users.
+        - item_profiles (csr_matrix): An (items x features) matrix with the profiles of the items.
+        - n (int): The number of items to get per user.
+        - exclude (csr_matrix): An optional (users x items) matrix, whose non-zero entries are never recommended.
+        - block_size (int): The number of items scored at a time.
+
+    Returns:
+        - indices (ndarray): A (users x min(n, items)) array of item indices, from the best to the worst,
+                             padded with -1 when a user has fewer than n scored items.
+    """
+    user_profiles = csr_matrix(user_profiles)
+    item_profiles = csr_matrix(item_profiles)
+    number_of_users, number_of_items = user_profiles.shape[0], item_profiles.shape[0]
+    best = csr_matrix((number_of_users, number_of_items), dtype=np.float32)
+
+    if exclude is not None:
+        exclude = csr_matrix(exclude).tocsc()
+
+    for start in range(0, number_of_items, block_size):
+        stop = min(start + block_size, number_of_items)
+        scores = user_profiles @ item_profiles[start:stop].T
+        block_exclude = exclude[:, start:stop] if exclude is not None else None
+        rows, columns, values = top_n_entries(scores, n, exclude=block_exclude)
+
+        # merge the best items of the block with the best items so far
+        best = best.tocoo()
+        merged = csr_matrix((np.concatenate([best.data, values]),
+                             (np.concatenate([best.row, rows]), np.concatenate([best.col, columns + start]))),
+                            shape=best.shape)
+        best = truncate_rows(merged, n)
+
+    return sparse_top_n(best, n)
+
+
+def top_n_entries(matrix, n, exclude=None):
+    """
+    Get the n highest non-zero entries of each row of a sparse matrix, without densifying it.
+
+    The entries of all rows are ordered at once with a lexsort on (row, -value), and the rank of each
+    entry inside its row decides if it is kept.
+
+    Parameters:
+        - matrix (csr_matrix): The sparse matrix of scores.
+        - n (int): The maximum number of entries to keep per row.
+        - exclude (csr_matrix): An optional matrix of the same shape, whose non-zero entries are dropped.
+
+    Returns:
+        - rows (ndarray): The row of each kept entry, sorted.
+        - columns (ndarray): The column of each kept entry.
+        - values (ndarray): The value of each kept entry, from the highest to the lowest inside each row.
+    """
+    matrix = csr_matrix(matrix)
+    matrix.eliminate_zeros()
+    rows = np.repeat(np.arange(matrix.shape[0]), np.diff(matrix.indptr))
+    columns = matrix.indices
+    values = matrix.data
+
+    if exclude is not None:
+        exclude = csr_matrix(exclude)
+        excluded_rows = np.repeat(np.arange(exclude.shape[0]), np.diff(exclude.indptr))
+        keep = ~np.isin(rows.astype(np.int64) * matrix.shape[1] + columns,
+                        excluded_rows.astype(np.int64) * matrix.shape[1] + exclude.indices)
+        rows, columns, values = rows[keep], columns[keep], values[keep]
+
+    order = np.lexsort((-values, rows))
+    rows, columns, values = rows[order], columns[order], values[order]
+
+    # rank of each entry inside its row
+    row_starts = np.searchsorted(rows, np.arange(matrix.shape[0]))
+    ranks = np.arange(len(rows)) - row_starts[rows]
+    keep = ranks < n
+
+    return rows[keep], columns[keep], values[keep]
+
+
+def truncate_rows(matrix, n, exclude=None):
+    """
+    Keep only the n highest non-zero entries of each row of a sparse matrix.
+
+    Parameters:
+        - matrix (csr_matrix): The sparse matrix to truncate.
+        - n (int): The maximum number of entries to keep per row.
+        - exclude (csr_matrix): An optional matrix of the same shape, whose non-zero entries are dropped.
+
+    Returns:
+        - truncated (csr_matrix): A matrix of the same shape with at most n entries per row.
+    """
+    rows, columns, values = top_n_entries(matrix, n, exclude=exclude)
+    return csr_matrix((values, (rows, columns)), shape=matrix.shape)
+
+
+def sparse_top_n(scores, n, exclude=None):
+    """
+    Get the column indices of the n highest scores of each row of a sparse score matrix.
+
+    Parameters:
+        - scores (csr_matrix): A sparse (users x items) matrix of scores; missing entries are never selected.
+        - n (int): The number of indices to get per row.
+        - exclude (csr_matrix): An optional matrix of the same shape, whose non-zero entries are never selected.
+
+    Returns:
+        - indices (ndarray): A (rows x n) array of column indices, from the best to the worst,
+                             padded with -1 when a row has fewer than n scored columns.
+    """
+    rows, columns, _ = top_n_entries(scores, n, exclude=exclude)
+
+    indices = np.full((scores.shape[0], min(n, scores.shape[1])), -1, dtype=np.intp)
+    row_starts = np.searchsorted(rows, np.arange(scores.shape[0]))
+    indices[rows, np.arange(len(rows)) - row_starts[rows]] = columns
+
+    return indices
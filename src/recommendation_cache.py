@@ -0,0 +1,154 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class RecommendationCache:
+    """
+    Bounded cache of recommendation lists, keyed by user, model type and model version.
+
+    The least recently used entries are evicted when the cache is full, and the entries older than the
+    optional time to live expire. The longest list computed for a key is kept, and the shorter requests
+    are served as its prefixes: the top n recommendations are the first n of the top m for any m >= n.
+
+    The model version is increased by the recommender system whenever its recommendations may change
+    (a fit, a data reload, new reviews...), so the entries of the previous versions are never served;
+    invalidate drops them at once to free their space.
+
+    Parameters:
+        - max_size (int): The maximum number of cached lists.
+        - ttl (float): The number of seconds an entry is served for, or None for no expiry.
+        - clock (callable): The time function of the expiry, time.monotonic by default.
+    """
+
+    def __init__(self, max_size=10_000, ttl=None, clock=time.monotonic):
+        """
+        Initialize the RecommendationCache object.
+
+        Parameters:
+            - max_size (int): The maximum number of cached lists.
+            - ttl (float): The number of seconds an entry is served for, or None for no expiry.
+            - clock (callable): The time function of the expiry, time.monotonic by default.
+        """
+        self.max_size = max_size
+        self.ttl = ttl
+        self.clock = clock
+
+        # key -> (recommendations, number requested, expiry time), from the least to the most recently used
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, user_id, model_type, model_version, number_of_recommendations):
+        """
+        Get the cached recommendations of a user.
+
+        Parameters:
+            - user_id (str): The ID of the user.
+            - model_type (str): The type of model that made the recommendations.
+            - model_version (int): The version of the model that made the recommendations.
+            - number_of_recommendations (int): The number of recommendations requested.
+
+        Returns:
+            - recommendations: The first number_of_recommendations cached recommendations,
+                               or None if no cached list of the key is long enough.
+        """
+        key = (user_id, model_type, model_version)
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and entry[2] is not None and self.clock() >= entry[2]:
+                del self.entries[key]
+                self.expirations += 1
+                entry = None
+
+            # a list shorter than requested holds every business there was to recommend
+            recommendations, number_requested, _ = entry if entry is not None else (None, 0, None)
+            if entry is None or (number_requested < number_of_recommendations and
+                                 len(recommendations) >= number_requested):
+                self.misses += 1
+                return None
+
+            self.entries.move_to_end(key)
+            self.hits += 1
+
+        return recommendations[:number_of_recommendations]
+
+    def put(self, user_id, model_type, model_version, number_of_recommendations, recommendations):
+        """
+        Cache the recommendations of a user, unless a longer list of the same key is already cached.
+
+        Parameters:
+            - user_id (str): The ID of the user.
+            - model_type (str): The type of model that made the recommendations.
+            - model_version (int): The version of the model that made the recommendations.
+            - number_of_recommendations (int): The number of recommendations requested.
+            - recommendations: The recommendations, a sliceable sequence such as an Index of business IDs.
+        """
+        if self.max_size <= 0:
+            return
+
+        key = (user_id, model_type, model_version)
+        expiry = self.clock() + self.ttl if self.ttl is not None else None
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None or entry[1] <= number_of_recommendations:
+                self.entries[key] = (recommendations, number_of_recommendations, expiry)
+            self.entries.move_to_end(key)
+
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, model_version=None):
+        """
+        Drop the entries of the previous model versions, or every entry.
+
+        Parameters:
+            - model_version (int): The current model version, whose entries are kept; None drops every entry.
+        """
+        with self.lock:
+            stale = [key for key in self.entries if key[2] != model_version] if model_version is not None \
+                else list(self.entries)
+            for key in stale:
+                del self.entries[key]
+            self.invalidations += len(stale)
+
+    def get_stats(self):
+        """
+        Get the counters of the cache.
+
+        Returns:
+            - stats (dict): The size of the cache, the number of hits, misses, evictions, expirations and
+                            invalidated entries, and the hit rate.
+        """
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self.entries),
+                'max_size': self.max_size,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+                'invalidations': self.invalidations,
+                'hit_rate': self.hits / lookups if lookups else 0.0
+            }
+
+    def __getstate__(self):
+        # the lock cannot be pickled, and the cached lists are only valid in this process
+        state = self.__dict__.copy()
+        del state['lock']
+        state['entries'] = OrderedDict()
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.lock = threading.Lock()
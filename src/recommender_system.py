@@ -1,10 +1,45 @@
-from collections import Counter
+import os
+import threading
+
+import numpy as np
 import pandas as pd
-from sklearn.model_selection import train_test_split
+import scipy.sparse as sp
 from sklearn.decomposition import TruncatedSVD
-from sklearn.neighbors import NearestNeighbors
 import matplotlib.pyplot as plt
 
+from als import ALS
+from ann_index import IVFIndex
+from category_index import CategoryIndex
+from category_profiles import CategoryProfiles, is_relevant_to_categories
+from community_detection import detect_communities
+from community_recommender import CommunityModels
+from content_model import ContentModel
+from data_sources import PickleDataSource
+from instrumentation import instrumentation, instrumented
+from item_knn import ItemKNN
+import model_store
+from pagerank import PersonalizedPageRank
+from ranking import blocked_top_n, pad_columns, sparse_top_n
+from recommendation_cache import RecommendationCache
+from record_index import RecordIndex
+from review_graph import ReviewGraph
+from user_item_matrix import add_to_user_item_matrix, build_user_item_matrix
+
+# the model types that score the businesses by the dot product of user and business latent factors
+FACTOR_MODELS = ('svd', 'als')
+
+
+def grow_rows(array, number_of_rows):
+    """
+    Grow a 2D array to a number of rows with zero rows, always returning a writable copy of a read-only array.
+    """
+    if len(array) == number_of_rows and array.flags.writeable:
+        return array
+
+    grown = np.zeros((number_of_rows,) + array.shape[1:], dtype=array.dtype)
+    grown[:len(array)] = array
+    return grown
+
 
 class RecommenderSystem:
     """
@@ -12,20 +47,64 @@ class RecommenderSystem:
 
     Parameters:
         - model_type (str): The type of model to use for recommendations.
-                            Supported options: 'svd', 'knn'
+                            Supported options: 'svd', 'als', 'knn', 'ppr', 'content'
+        - data_source (PickleDataSource): Where to load the data from, by default the pickles of the data directory.
+        - review_columns (list): The columns of the reviews to load.
+        - review_filters (list): Optional (column, operator, value) filters on the reviews, e.g. [('stars', '>=', 4)].
+        - cache_size (int): The number of recommendation lists cached by make_recommendations (0 for no cache).
+        - cache_ttl (float): The number of seconds a cached recommendation list is served for, or None for no expiry.
+        - model_params (dict): Optional keyword arguments of the model, e.g. {'rank': 64, 'implicit': True} for 'als'
+                               or {'n_components': 20} for 'svd'.
     """
 
-    def __init__(self, model_type):
+    # the review columns the models need
+    REVIEW_COLUMNS = ('user_id', 'business_id', 'stars')
+
+    def __init__(self, model_type, data_source=None, review_columns=REVIEW_COLUMNS, review_filters=None, load=True,
+                 cache_size=10_000, cache_ttl=None, model_params=None):
         """
         Initialize the RecommenderSystem object.
 
         Parameters:
             - model_type (str): The type of model to use for recommendations.
-                                Supported options: 'svd', 'knn'
+                                Supported options: 'svd', 'als', 'knn', 'ppr', 'content'
+            - data_source (PickleDataSource): Where to load the data from, by default the pickles of the data directory.
+            - review_columns (list): The columns of the reviews to load.
+            - review_filters (list): Optional (column, operator, value) filters on the reviews, e.g. [('stars', '>=', 4)].
+            - load (bool): Whether to load and preprocess the data. Models restored with load_model skip it.
+            - cache_size (int): The number of recommendation lists cached by make_recommendations (0 for no cache).
+            - cache_ttl (float): The number of seconds a cached recommendation list is served for, or None for no expiry.
+            - model_params (dict): Optional keyword arguments of the model, e.g. {'rank': 64, 'implicit': True}
+                                   for 'als' or {'n_components': 20} for 'svd'.
         """
         self.model_type = model_type
-        self.load_data()
-        self.preprocess_data()
+        self.model_params = model_params
+        self.data_source = data_source if data_source is not None else PickleDataSource()
+        self.review_columns = review_columns
+        self.review_filters = review_filters
+        self.reviews = None
+        self.fingerprint = None
+        self.category_profiles = None
+        self.category_index = None
+        self.community_models = None
+        self.ann_index = None
+
+        # the cached recommendations are those of the current model version, increased on every change
+        self.model_version = 0
+        self.recommendation_cache = RecommendationCache(cache_size, cache_ttl) if cache_size else None
+
+        # the state of the incremental updates, see add_reviews
+        self.update_lock = threading.Lock()
+        self.ratings_at_fit = None
+        self.reviews_since_fit = 0
+        self.refit_thread = None
+        self.refit_snapshot = None
+        self.pending_users = []
+        self.pending_businesses = []
+
+        if load:
+            self.load_data()
+            self.preprocess_data()
 
     def set_model_type(self, model_type):
         """
@@ -33,7 +112,7 @@ class RecommenderSystem:
 
         Parameters:
             - model_type (str): The type of model to use for recommendations.
-                                Supported options: 'svd', 'knn'
+                                Supported options: 'svd', 'als', 'knn', 'ppr', 'content'
         """
         self.model_type = model_type
 
@@ -64,74 +143,745 @@ class RecommenderSystem:
         with open(filename, 'wb') as f:
             pd.to_pickle(var, f)
 
+    @instrumented()
     def load_data(self):
         """
-        Load the user, business, and review data from pickle files.
+        Load the user, business, and review data from the data source.
         """
         # load user data
-        self.users = self.read_file('../data/sample_users.pickle')
+        self.users = self.data_source.read('users')
 
         # load business data
-        self.businesses = self.read_file('../data/sample_business.pickle')
+        self.businesses = self.data_source.read('businesses')
 
-        # load review data
-        self.reviews = self.read_file('../data/sample_reviews.pickle')
+        # load review data, only the needed columns and rows
+        self.reviews = self.data_source.read('reviews', columns=self.review_columns, filters=self.review_filters)
 
+        # index the users and businesses by ID for constant-time lookups
+        self.user_records = RecordIndex(self.users, 'user_id')
+        self.business_records = RecordIndex(self.businesses, 'business_id')
+
+    @instrumented()
     def preprocess_data(self):
         """
-            Preprocess the data by pivoting the review data to create a user-item matrix.
+            Preprocess the data by encoding the user and business IDs and building a sparse user-item matrix.
         """
         review_data = pd.DataFrame(self.reviews)
 
-        self.user_item_ratings = review_data.pivot_table(index='user_id', columns='business_id', values='stars', aggfunc='mean', fill_value=0)
+        # rows and columns of the matrix are indexed by self.user_ids and self.business_ids
+        self.user_item_ratings, self.user_ids, self.business_ids, self.review_counts = \
+            build_user_item_matrix(review_data, return_counts=True)
+
+        # the models are trained with every user, so they can all be given recommendations
+        self.train_data = self.user_item_ratings
+
+        # count the categories of the businesses each user reviewed with 4 or 5 stars
+        self.category_profiles = CategoryProfiles(self.businesses)
+        self.category_profiles.update(review_data)
 
-        # split the data into training and testing sets
-        self.train_data, self.test_data = train_test_split(self.user_item_ratings, test_size=0.000000001)
+        # the category index only depends on the business table
+        if self.category_index is None or self.category_index.table is not self.businesses:
+            self.category_index = CategoryIndex(self.businesses)
 
-    def build_recommender_system(self):
+        # the community models and a running background refit index the previous matrix
+        self.community_models = None
+        self.refit_snapshot = None
+        self.update_model_version()
+
+    @instrumented()
+    def build_recommender_system(self, model_dir=None):
         """
-        Build the recommender system by preprocessing the data, splitting into training and testing sets,
-        and training the chosen model based on the specified algorithm.
+        Build the recommender system by training the chosen model based on the specified algorithm.
+
+        Parameters:
+            - model_dir (str): An optional directory to cache the fitted model in. If it holds a model of the
+                               same type fitted on the same reviews, that model is loaded instead of refitting,
+                               otherwise the new model is saved there.
         """
+        if model_dir is not None:
+            manifest = model_store.read_manifest(model_dir)
+            if manifest is not None and manifest['model_type'] == self.model_type and \
+                    manifest.get('model_params') == self.model_params and \
+                    manifest['fingerprint'] == model_store.data_fingerprint(self.reviews):
+                self.restore_model(model_dir, manifest)
+                return
+
+        self.fit_model()
+
+        self.fingerprint = model_store.data_fingerprint(self.reviews)
+
+        if model_dir is not None:
+            self.save_model(model_dir)
+
+    @instrumented()
+    def fit_model(self):
+        """
+        Fit the chosen model on the training data.
+        """
+        params = self.model_params or {}
         if self.model_type == 'svd':
-            self.model = TruncatedSVD(n_components=10)
+            self.model = TruncatedSVD(**{'n_components': 10, **params})
+            self.model.fit(self.train_data)
+
+            # keep the latent factors contiguous in float32 for fast scoring of every business
+            self.item_factors = np.ascontiguousarray(self.model.components_.T, dtype=np.float32)
+            self.user_factors = np.ascontiguousarray(self.model.transform(self.train_data), dtype=np.float32)
+            self.singular_values = self.model.singular_values_.astype(np.float32)
+        elif self.model_type == 'als':
+            self.model = ALS(**params)
+            self.model.fit(self.train_data)
+
+            self.item_factors = np.ascontiguousarray(self.model.item_factors_, dtype=np.float32)
+            self.user_factors = np.ascontiguousarray(self.model.user_factors_, dtype=np.float32)
+            self.singular_values = None
+        elif self.model_type == 'knn':
+            self.model = ItemKNN(**{'n_neighbors': 20, **params})
             self.model.fit(self.train_data)
+        elif self.model_type == 'ppr':
+            self.model = PersonalizedPageRank(**params)
+            self.model.fit(self.train_data)
+        elif self.model_type == 'content':
+            self.model = ContentModel(**params)
+            self.model.fit(self.iter_review_texts(), self.user_ids, self.business_ids)
+        else:
+            raise ValueError('Invalid model type.')
+
+        if self.model_type in FACTOR_MODELS and self.ann_index is not None:
+            self.ann_index.fit(self.item_factors)
+
+        # a full fit supersedes the incremental updates and a running background refit
+        self.ratings_at_fit = self.train_data.nnz
+        self.reviews_since_fit = 0
+        self.refit_snapshot = None
+        self.update_model_version()
+
+    def iter_review_texts(self, chunk_size=100_000):
+        """
+        Get the reviews with their text in chunks, from the loaded reviews if they have a 'text' column,
+        otherwise streamed from the data source with the review filters, without keeping the texts.
+
+        The reviews are checked for a 'text' column before any chunk is read, as the default ingestion
+        (ingestion.DEFAULT_FIELDS) does not keep the texts.
+
+        Returns:
+            - chunks (iterator): The 'user_id', 'business_id' and 'text' columns of the reviews, by chunks.
+        """
+        columns = ['user_id', 'business_id', 'text']
+        if self.reviews is not None and 'text' in self.reviews:
+            return (self.reviews.iloc[start:start + chunk_size][columns]
+                    for start in range(0, len(self.reviews), chunk_size))
+
+        if 'text' not in self.data_source.columns('reviews'):
+            raise ValueError("The reviews have no 'text' column, which the content model needs: ingest them with "
+                             "the 'text' field, e.g. ingest_yelp_dataset(..., fields={'reviews': "
+                             "DEFAULT_FIELDS['reviews'] + ['text']}).")
+        return self.data_source.iter_chunks('reviews', columns=columns, filters=self.review_filters,
+                                            chunk_size=chunk_size)
+
+    def update_model_version(self):
+        """
+        Increase the model version after a change of the model or of its data, dropping the cached recommendations.
+        """
+        self.model_version += 1
+        if self.recommendation_cache is not None:
+            self.recommendation_cache.invalidate(self.model_version)
+
+    def get_cache_stats(self):
+        """
+        Get the counters of the recommendation cache.
+
+        Returns:
+            - stats (dict): The size, hits, misses, evictions, expirations and invalidations of the cache,
+                            see RecommendationCache.get_stats, or None without a cache.
+        """
+        return self.recommendation_cache.get_stats() if self.recommendation_cache is not None else None
+
+    @instrumented()
+    def build_ann_index(self, n_lists=None, n_probe=8, seed=0):
+        """
+        Index the business latent factors of the svd or als model, to recommend from the businesses of a few clusters
+        instead of scoring the whole catalog (see IVFIndex). The index is refitted with the model.
+
+        Parameters:
+            - n_lists (int): The number of clusters of businesses, by default the square root of their number.
+            - n_probe (int): The number of clusters scored per user; more is slower but closer to the exact top n.
+            - seed (int): The seed of the clustering.
+        """
+        if self.model_type not in FACTOR_MODELS:
+            raise ValueError('The ANN index needs the latent factors of the svd or als model.')
+
+        self.ann_index = IVFIndex(n_lists=n_lists, n_probe=n_probe, seed=seed).fit(self.item_factors)
+        self.update_model_version()
+
+    @instrumented()
+    def build_community_models(self, labels=None, method='louvain', min_size=20, n_jobs=None, seed=0):
+        """
+        Fit one model per community of the review graph, to recommend each user the businesses of their community.
+
+        The users of the communities too small to get a model, and the users their community model cannot
+        give enough recommendations, fall back to the global model of build_recommender_system.
+
+        Parameters:
+            - labels (ndarray): An optional community of every node of the review graph, users first (in the order
+                                of user_ids, then business_ids). By default the graph is partitioned with method.
+            - method (str): The community detection method, 'louvain', 'label_propagation' or 'greedy_modularity'
+                            (slower, see detect_communities).
+            - min_size (int): The minimum number of users and of businesses of a community to fit its model.
+            - n_jobs (int): The number of processes that fit the models (None for one, -1 for every core).
+            - seed (int): The seed of the community detection.
+        """
+        if self.model_type == 'content':
+            raise ValueError('The community models need a model fitted on the ratings.')
+
+        if labels is None:
+            labels = detect_communities(ReviewGraph(self.train_data, self.user_ids, self.business_ids), method, seed)
+
+        self.community_models = CommunityModels(self.model_type, min_size=min_size, n_jobs=n_jobs,
+                                                model_params=self.model_params)
+        self.community_models.fit(self.train_data, labels)
+        self.update_model_version()
+
+    def get_user_community(self, user_id):
+        """
+        Get the community of a given user, -1 if they are in none.
+
+        Parameters:
+            - user_id (str): The ID of the user.
+
+        Returns:
+            - community (int): The label of the community of the user.
+        """
+        return self.community_models.get_community(self.user_ids.get_loc(user_id))
+
+    @instrumented()
+    def save_model(self, path):
+        """
+        Save the fitted model, with the ID maps and the user-item matrix, to a directory of .npy files.
+
+        The manifest is written last, so a directory whose save was interrupted is never loaded.
+
+        Parameters:
+            - path (str): The directory to save the model in.
+        """
+        os.makedirs(path, exist_ok=True)
+        if os.path.exists(os.path.join(path, model_store.MANIFEST_FILE)):
+            os.remove(os.path.join(path, model_store.MANIFEST_FILE))
+
+        model_store.save_ids(path, 'user_ids', self.user_ids)
+        model_store.save_ids(path, 'business_ids', self.business_ids)
+        model_store.save_sparse(path, 'ratings', self.train_data)
+
+        if self.model_type in FACTOR_MODELS:
+            model_store.save_array(path, 'user_factors', self.user_factors)
+            model_store.save_array(path, 'item_factors', self.item_factors)
+            if self.model_type == 'svd':
+                model_store.save_array(path, 'singular_values', self.singular_values)
+            else:
+                model_store.save_array(path, 'rating_mean', np.array([self.model.mean_], dtype=np.float32))
         elif self.model_type == 'knn':
-            self.model = NearestNeighbors(n_neighbors=5, algorithm='brute', metric='cosine')
-            self.model.fit(self.train_data.values)
+            model_store.save_sparse(path, 'neighbors', self.model.neighbors_)
+        elif self.model_type == 'ppr':
+            # the review graph is rebuilt from the saved ratings
+            pass
+        elif self.model_type == 'content':
+            # the profiles are saved as sums, so that new reviews can still be added
+            model_store.save_sparse(path, 'user_profile_sums', self.model.user_sums.matrix)
+            model_store.save_sparse(path, 'business_profile_sums', self.model.business_sums.matrix)
         else:
             raise ValueError('Invalid model type.')
 
-    def make_recommendations(self, user_id, number_of_recommendations):
+        # the fingerprint of reviews added incrementally is computed when saving
+        if self.fingerprint is None and self.reviews is not None:
+            self.fingerprint = model_store.data_fingerprint(self.reviews)
+
+        model_store.write_manifest(path, {
+            'model_type': self.model_type,
+            'model_params': self.model_params,
+            'fingerprint': self.fingerprint,
+            'shape': list(self.train_data.shape)
+        })
+
+    @classmethod
+    def load_model(cls, path, mmap=True, fingerprint=None, data_source=None):
+        """
+        Load a model saved with save_model, without loading nor preprocessing the data.
+
+        Parameters:
+            - path (str): The directory the model was saved in.
+            - mmap (bool): Whether to memory-map the arrays instead of reading them into memory.
+            - fingerprint (str): An optional fingerprint of the expected review data (see model_store.data_fingerprint).
+            - data_source (PickleDataSource): The data source used if the data is loaded later.
+
+        Returns:
+            - recommender_system (RecommenderSystem): A recommender system ready to make recommendations.
+        """
+        manifest = model_store.read_manifest(path)
+        if manifest is None:
+            raise FileNotFoundError('No model saved in {}.'.format(path))
+        if fingerprint is not None and manifest['fingerprint'] != fingerprint:
+            raise ValueError('The model saved in {} was fitted on different data.'.format(path))
+
+        recommender_system = cls(manifest['model_type'], data_source=data_source, load=False,
+                                 model_params=manifest.get('model_params'))
+        recommender_system.restore_model(path, manifest, mmap=mmap)
+        return recommender_system
+
+    @instrumented()
+    def restore_model(self, path, manifest, mmap=True):
+        """
+        Restore the arrays of a saved model into this object.
+
+        Parameters:
+            - path (str): The directory the model was saved in.
+            - manifest (dict): The manifest of the saved model.
+            - mmap (bool): Whether to memory-map the arrays instead of reading them into memory.
+        """
+        self.model_type = manifest['model_type']
+        self.model_params = manifest.get('model_params')
+        self.fingerprint = manifest['fingerprint']
+        self.community_models = None
+
+        self.user_ids = model_store.load_ids(path, 'user_ids', 'user_id', mmap=mmap)
+        self.business_ids = model_store.load_ids(path, 'business_ids', 'business_id', mmap=mmap)
+        self.user_item_ratings = model_store.load_sparse(path, 'ratings', manifest['shape'], mmap=mmap)
+        self.train_data = self.user_item_ratings
+
+        # the review counts are not saved, every pair is taken as reviewed once
+        self.review_counts = self.train_data.copy()
+        self.review_counts.data = np.ones_like(self.review_counts.data)
+        self.ratings_at_fit = self.train_data.nnz
+        self.reviews_since_fit = 0
+        self.refit_snapshot = None
+        self.update_model_version()
+
+        if self.model_type in FACTOR_MODELS:
+            # the factors are all the factor models need to score, the sklearn object is not persisted and the
+            # ALS object only holds what is needed to fold in new ratings
+            self.model = None
+            if self.model_type == 'als':
+                self.model = ALS(**(self.model_params or {}))
+                self.model.mean_ = float(model_store.load_array(path, 'rating_mean', mmap=False)[0])
+            self.user_factors = model_store.load_array(path, 'user_factors', mmap=mmap)
+            self.item_factors = model_store.load_array(path, 'item_factors', mmap=mmap)
+            self.singular_values = model_store.load_array(path, 'singular_values', mmap=mmap) \
+                if self.model_type == 'svd' else None
+            if self.ann_index is not None:
+                self.ann_index.fit(self.item_factors)
+        elif self.model_type == 'knn':
+            self.model = ItemKNN()
+            self.model.neighbors_ = model_store.load_sparse(path, 'neighbors', (len(self.business_ids),) * 2, mmap=mmap)
+        elif self.model_type == 'ppr':
+            self.model = PersonalizedPageRank()
+            self.model.fit(self.train_data)
+        elif self.model_type == 'content':
+            self.model = ContentModel(**(self.model_params or {}))
+            self.model.set_sums(
+                model_store.load_sparse(path, 'user_profile_sums', (len(self.user_ids), self.model.n_features),
+                                        mmap=mmap),
+                model_store.load_sparse(path, 'business_profile_sums', (len(self.business_ids),
+                                                                        self.model.n_features), mmap=mmap))
+        else:
+            raise ValueError('Invalid model type.')
+
+    def __getstate__(self):
+        # the lock and the thread of the background refit cannot be pickled
+        state = self.__dict__.copy()
+        del state['update_lock']
+        state['refit_thread'] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.update_lock = threading.Lock()
+
+    @instrumented()
+    def add_reviews(self, reviews, refit_threshold=0.2):
+        """
+        Add new reviews to the recommender system without a full refit.
+
+        The reviews are added to the user-item matrix, growing the ID maps with the new users and businesses,
+        and the model is updated incrementally:
+            - 'svd': the new businesses are folded into the latent space from the factors of the users who rated
+              them, then the users who wrote the reviews are folded in from their updated ratings,
+            - 'als': the same, each fold-in solving the regularized least squares of an ALS step,
+            - 'knn': the neighbors of the reviewed businesses are recomputed,
+            - 'ppr': the transition matrix of the review graph is rebuilt,
+            - 'content': the texts of the reviews, if they have a 'text' column, are added to the profiles of
+              their users and businesses; the profiles are sums, so they are never refitted.
+        When the reviews added since the last fit reach refit_threshold times the number of ratings of that fit,
+        the model is refitted in a background thread and swapped in when ready; the recommendations are made
+        with the incrementally updated model in the meantime.
+
+        Parameters:
+            - reviews (DataFrame): The new reviews, with at least the 'user_id', 'business_id' and 'stars' columns.
+            - refit_threshold (float): The fraction of new reviews that triggers a background refit,
+                                       or None to never refit.
+        """
+        with self.update_lock:
+            if self.reviews is not None:
+                self.reviews = pd.concat([self.reviews, reviews[self.reviews.columns.intersection(reviews.columns)]],
+                                         ignore_index=True)
+            self.fingerprint = None
+
+            previous_shape = self.train_data.shape
+            user_positions, business_positions = self.update_user_item_matrix(reviews)
+            affected_users = np.unique(user_positions)
+            new_businesses = np.arange(previous_shape[1], self.train_data.shape[1])
+
+            if self.ratings_at_fit is not None:
+                if self.model_type in FACTOR_MODELS:
+                    self.fold_in(affected_users, new_businesses)
+                elif self.model_type == 'knn':
+                    self.model.refresh(self.train_data, np.unique(business_positions))
+                elif self.model_type == 'ppr':
+                    self.model.fit(self.train_data)
+                elif self.model_type == 'content':
+                    self.model.partial_fit([reviews] if 'text' in reviews else [], self.user_ids, self.business_ids)
+
+                # the background refit catches up with the users reviewing while it runs
+                if self.refit_snapshot is not None:
+                    self.pending_users.append(affected_users)
+                    self.pending_businesses.append(np.unique(business_positions))
+
+            if self.category_profiles is not None:
+                self.category_profiles.update(reviews)
+            if self.community_models is not None:
+                self.community_models.add_users(len(self.user_ids))
+
+            self.update_model_version()
+
+            self.reviews_since_fit += len(reviews)
+            if refit_threshold is not None and self.ratings_at_fit is not None and self.refit_snapshot is None and \
+                    self.model_type != 'content' and self.reviews_since_fit >= refit_threshold * self.ratings_at_fit:
+                self.start_background_refit()
+
+    @instrumented()
+    def update_user_item_matrix(self, reviews):
+        """
+        Add reviews to the user-item matrix, appending the new users and businesses to the ID maps.
+
+        Parameters:
+            - reviews (DataFrame): The new reviews, with the 'user_id', 'business_id' and 'stars' columns.
+
+        Returns:
+            - user_positions (ndarray): The row of the user of each review.
+            - business_positions (ndarray): The column of the business of each review.
+        """
+        user_positions = self.user_ids.get_indexer(reviews['user_id'])
+        new_users = pd.unique(reviews['user_id'].to_numpy()[user_positions < 0])
+        if len(new_users):
+            self.user_ids = self.user_ids.append(pd.Index(new_users, name='user_id'))
+            user_positions = self.user_ids.get_indexer(reviews['user_id'])
+
+        business_positions = self.business_ids.get_indexer(reviews['business_id'])
+        new_businesses = pd.unique(reviews['business_id'].to_numpy()[business_positions < 0])
+        if len(new_businesses):
+            self.business_ids = self.business_ids.append(pd.Index(new_businesses, name='business_id'))
+            business_positions = self.business_ids.get_indexer(reviews['business_id'])
+
+        self.user_item_ratings, self.review_counts = add_to_user_item_matrix(
+            self.train_data, self.review_counts, user_positions, business_positions, reviews['stars'].to_numpy(),
+            (len(self.user_ids), len(self.business_ids)))
+        self.train_data = self.user_item_ratings
+
+        return user_positions, business_positions
+
+    @instrumented()
+    def fold_in(self, user_positions, business_positions):
+        """
+        Compute the latent factors of some users and businesses from their ratings, with the factor model fixed.
+
+        The users and businesses added to the matrix since the fit get factors, zero until they are folded in.
+
+        Parameters:
+            - user_positions (ndarray): The rows of the users to fold in, from their ratings and the business factors.
+            - business_positions (ndarray): The columns of the businesses to fold in, from their ratings and the
+                                            user factors (folded in first).
+        """
+        number_of_users, number_of_businesses = self.train_data.shape
+        self.user_factors = grow_rows(self.user_factors, number_of_users)
+        self.item_factors = grow_rows(self.item_factors, number_of_businesses)
+
+        # the new users get factors first, so that the businesses they reviewed fold in from them too
+        if len(user_positions) and len(business_positions):
+            self.user_factors[user_positions] = self.fold_in_users(user_positions)
+
+        if len(business_positions):
+            self.item_factors[business_positions] = self.fold_in_businesses(business_positions)
+            if self.ann_index is not None:
+                self.ann_index.update(business_positions, self.item_factors)
+        if len(user_positions):
+            self.user_factors[user_positions] = self.fold_in_users(user_positions)
+
+    def fold_in_users(self, user_positions):
+        """
+        Get the latent factors of some users from their ratings, with the business factors fixed.
+        """
+        if self.model_type == 'als':
+            return self.model.fold_in_users(self.train_data[user_positions], self.item_factors)
+        # the projection of TruncatedSVD.transform
+        return self.train_data[user_positions] @ self.item_factors
+
+    def fold_in_businesses(self, business_positions):
+        """
+        Get the latent factors of some businesses from their ratings, with the user factors fixed.
+        """
+        if self.model_type == 'als':
+            return self.model.fold_in_items(self.train_data[:, business_positions].T, self.user_factors)
+        # the inverse of the projection of TruncatedSVD.transform, X = U S V^T gives V = X^T (U S) S^-2
+        return (self.train_data[:, business_positions].T @ self.user_factors) / self.singular_values ** 2
+
+    def start_background_refit(self):
+        """
+        Refit the model on a snapshot of the user-item matrix in a background thread, then swap it in.
+        """
+        self.refit_snapshot = self.train_data
+        self.reviews_at_snapshot = self.reviews_since_fit
+        self.pending_users = []
+        self.pending_businesses = []
+
+        self.refit_thread = threading.Thread(target=self.refit_in_background, args=(self.refit_snapshot,),
+                                             daemon=True)
+        self.refit_thread.start()
+
+    def refit_in_background(self, snapshot):
+        """
+        Fit a new model on a snapshot of the user-item matrix and swap it in, catching up with the reviews
+        added during the fit. Runs in the thread of start_background_refit.
+
+        Parameters:
+            - snapshot (csr_matrix): The user-item matrix to fit on; the updates never modify it in place.
+        """
+        refitted = type(self)(self.model_type, data_source=self.data_source, load=False,
+                              model_params=self.model_params)
+        refitted.train_data = snapshot
+        if self.ann_index is not None and self.model_type in FACTOR_MODELS:
+            refitted.ann_index = IVFIndex(self.ann_index.n_lists, self.ann_index.n_probe, self.ann_index.max_iter,
+                                          self.ann_index.training_size, self.ann_index.seed)
+        refitted.fit_model()
+
+        with self.update_lock:
+            # the data or the model type changed during the fit
+            if self.refit_snapshot is not snapshot or self.model_type != refitted.model_type:
+                return
+
+            number_of_users, number_of_businesses = snapshot.shape
+            pending_users = np.unique(np.concatenate(self.pending_users + [np.empty(0, dtype=np.intp)]))
+            pending_businesses = np.unique(np.concatenate(self.pending_businesses + [np.empty(0, dtype=np.intp)]))
+            new_businesses = np.arange(number_of_businesses, self.train_data.shape[1])
+
+            if self.model_type in FACTOR_MODELS:
+                self.model = refitted.model
+                self.singular_values = refitted.singular_values
+                self.user_factors = np.vstack([refitted.user_factors, self.user_factors[number_of_users:]])
+                self.item_factors = np.vstack([refitted.item_factors, self.item_factors[number_of_businesses:]])
+                if refitted.ann_index is not None:
+                    self.ann_index = refitted.ann_index
+                self.fold_in(pending_users, new_businesses)
+            elif self.model_type == 'knn':
+                self.model = refitted.model
+                self.model.refresh(self.train_data, pending_businesses)
+            else:
+                self.model.fit(self.train_data)
+
+            self.ratings_at_fit = snapshot.nnz
+            self.reviews_since_fit -= self.reviews_at_snapshot
+            self.refit_snapshot = None
+            self.pending_users = []
+            self.pending_businesses = []
+            self.update_model_version()
+
+    @instrumented()
+    def make_recommendations(self, user_id, number_of_recommendations, categories=None):
         """
         Make recommendations for a given user based on the trained model.
 
         Parameters:
             - user_id (str): The ID of the user for whom recommendations are to be made.
+            - number_of_recommendations (int): The number of recommendations to make.
+            - categories (list): Optional categories to recommend businesses from, e.g. ['Restaurants', 'Bars'].
+                                 The other businesses are masked before the top recommendations are selected.
 
         Returns:
-            - recommended_items (list): A list of the top 5 recommended items for the given user.
+            - recommended_items (Index): The IDs of the top recommended businesses for the given user.
         """
+        if categories is not None:
+            # the recommendations filtered by category are not cached
+            recommended_indices = self.recommend_users(np.array([self.user_ids.get_loc(user_id)]),
+                                                       number_of_recommendations,
+                                                       allowed=self.get_category_mask(categories))[0]
+            return self.business_ids[recommended_indices[recommended_indices >= 0]]
 
-        # preprocess data
-        user_ratings = self.train_data.loc[user_id].values.reshape(1, -1)
+        model_version = self.model_version
+        if self.recommendation_cache is not None:
+            cached_items = self.recommendation_cache.get(user_id, self.model_type, model_version,
+                                                         number_of_recommendations)
+            if cached_items is not None:
+                return pd.Index(cached_items, name=self.business_ids.name)
 
-        # create a DataFrame with the reshaped data and feature names
-        reshaped_data = pd.DataFrame(user_ratings, columns=self.train_data.columns)
+        user_position = self.user_ids.get_loc(user_id)
 
-        # make recommendations for a user
-        if self.model_type == 'svd':
-            predicted_ratings = self.model.transform(reshaped_data)
-            top_n_indices = predicted_ratings.argsort()[0, ::-1][:number_of_recommendations]
-            recommended_items = self.train_data.columns[top_n_indices]
+        recommended_indices = self.recommend_users(np.array([user_position]), number_of_recommendations)[0]
+        recommended_items = self.business_ids[recommended_indices[recommended_indices >= 0]]
+
+        if self.recommendation_cache is not None:
+            self.recommendation_cache.put(user_id, self.model_type, model_version, number_of_recommendations,
+                                          recommended_items.to_numpy())
+
+        return recommended_items
+
+    @instrumented()
+    def make_recommendations_batch(self, user_ids, number_of_recommendations, chunk_size=1024, categories=None):
+        """
+        Make recommendations for many users at once.
+
+        The rows of the users are scored together, chunk_size users at a time, so the memory used
+        by the scores is bounded by the chunk size and not by the number of users. The users with cached
+        recommendations are not scored again.
+
+        Parameters:
+            - user_ids (list): The IDs of the users for whom recommendations are to be made.
+            - number_of_recommendations (int): The number of recommendations to make for each user.
+            - chunk_size (int): The number of users scored in each matrix operation.
+            - categories (list): Optional categories to recommend businesses from, see make_recommendations.
+
+        Returns:
+            - recommendations (DataFrame): One row per user, indexed by user ID, with the IDs of the
+                                           recommended businesses from the best (column 0) to the worst,
+                                           padded with None when there are not enough businesses to recommend
+                                           (the -1 padding of recommend_users).
+        """
+        user_positions = self.user_ids.get_indexer(user_ids)
+        if (user_positions < 0).any():
+            raise KeyError(np.asarray(user_ids, dtype=object)[user_positions < 0][0])
+
+        user_ids = list(user_ids)
+        model_version = self.model_version
+        allowed = self.get_category_mask(categories) if categories is not None else None
+        cache = self.recommendation_cache if categories is None else None
+        recommended_items = np.full((len(user_ids), number_of_recommendations), None, dtype=object)
+
+        scored = np.ones(len(user_ids), dtype=bool)
+        if cache is not None:
+            for row, user_id in enumerate(user_ids):
+                cached_items = cache.get(user_id, self.model_type, model_version, number_of_recommendations)
+                if cached_items is not None:
+                    recommended_items[row, :len(cached_items)] = cached_items
+                    scored[row] = False
+
+        scored_rows = np.flatnonzero(scored)
+        business_ids = self.business_ids.to_numpy()
+        for start in range(0, len(scored_rows), chunk_size):
+            rows = scored_rows[start:start + chunk_size]
+            recommended_indices = self.recommend_users(user_positions[rows], number_of_recommendations, allowed)
+            recommended_items[rows] = np.where(recommended_indices >= 0, business_ids[recommended_indices], None)
+
+            if cache is not None:
+                for row, indices in zip(rows, recommended_indices):
+                    cache.put(user_ids[row], self.model_type, model_version, number_of_recommendations,
+                              business_ids[indices[indices >= 0]])
+
+        # an object frame keeps the None padding, which pandas would otherwise turn into NaN in string columns
+        return pd.DataFrame(recommended_items, index=pd.Index(user_ids, name='user_id'), dtype=object)
+
+    @instrumented()
+    def recommend_users(self, user_positions, number_of_recommendations, allowed=None):
+        """
+        Get the top recommended businesses for a chunk of users, from the models of their communities
+        if build_community_models was called, otherwise (or as a fallback) from the global model.
+
+        Parameters:
+            - user_positions (ndarray): The rows of the users in the user-item matrix.
+            - number_of_recommendations (int): The number of recommendations to make for each user.
+            - allowed (ndarray): An optional boolean mask of the businesses that can be recommended.
+
+        Returns:
+            - recommended_indices (ndarray): The column indices of the recommended businesses, one row per user,
+                                             padded with -1 when there are not enough businesses to recommend
+                                             (None in the IDs of make_recommendations_batch).
+        """
+        instrumentation.increment('recommended_users', len(user_positions))
+        if self.community_models is None:
+            return self.recommend_users_globally(user_positions, number_of_recommendations, allowed)
+
+        recommended_indices, routed = self.community_models.recommend_users(user_positions, number_of_recommendations,
+                                                                            allowed)
+        if not routed.all():
+            recommended_indices[~routed] = self.recommend_users_globally(user_positions[~routed],
+                                                                         number_of_recommendations, allowed)
+        return recommended_indices
+
+    @instrumented()
+    def recommend_users_globally(self, user_positions, number_of_recommendations, allowed=None):
+        """
+        Get the top recommended businesses for a chunk of users from the global model.
+
+        With 'svd' or 'als' every business is scored by the dot product of the user and business latent factors,
+        or only the businesses of the closest clusters if build_ann_index was called.
+        With 'knn' the businesses are scored by their similarity to the businesses the user rated.
+        With 'ppr' the businesses are scored by a PageRank personalized to the businesses the user rated.
+        With 'content' the businesses are scored by the similarity of the text of their reviews and of the user's.
+        The businesses the user already rated are never recommended, nor the businesses outside the allowed mask.
+
+        Parameters:
+            - user_positions (ndarray): The rows of the users in the user-item matrix.
+            - number_of_recommendations (int): The number of recommendations to make for each user.
+            - allowed (ndarray): An optional boolean mask of the businesses that can be recommended.
+
+        Returns:
+            - recommended_indices (ndarray): The (users x number_of_recommendations) column indices of the
+                                             recommended businesses, padded with -1 when there are not enough
+                                             businesses to recommend (None in the IDs of
+                                             make_recommendations_batch), e.g. in a smaller catalog.
+        """
+        if self.model_type in FACTOR_MODELS and allowed is not None:
+            # only the allowed businesses are scored, exactly
+            candidates = np.flatnonzero(allowed)
+            candidate_indices = blocked_top_n(self.user_factors[user_positions], self.item_factors[candidates],
+                                              number_of_recommendations,
+                                              exclude=self.train_data[user_positions][:, candidates])
+            recommended_indices = np.where(candidate_indices >= 0, candidates[candidate_indices], -1)
+        elif self.model_type in FACTOR_MODELS and self.ann_index is not None:
+            recommended_indices = self.ann_index.search(self.user_factors[user_positions], self.item_factors,
+                                                        number_of_recommendations,
+                                                        exclude=self.train_data[user_positions])
+        elif self.model_type in FACTOR_MODELS:
+            recommended_indices = blocked_top_n(self.user_factors[user_positions], self.item_factors,
+                                                number_of_recommendations, exclude=self.train_data[user_positions])
         elif self.model_type == 'knn':
-            _, indices = self.model.kneighbors(reshaped_data)
-            recommended_items = self.train_data.columns[indices.flatten()][:number_of_recommendations]
+            user_ratings = self.train_data[user_positions]
+            scores = self.model.score(user_ratings)
+            if allowed is not None:
+                scores = scores @ sp.diags(allowed.astype(np.float32))
+            recommended_indices = sparse_top_n(scores, number_of_recommendations, exclude=user_ratings)
+        elif self.model_type == 'ppr':
+            user_ratings = self.train_data[user_positions]
+            recommended_indices = self.model.recommend(user_ratings, number_of_recommendations, exclude=user_ratings,
+                                                       allowed=allowed)
+        elif self.model_type == 'content':
+            recommended_indices = self.model.recommend(user_positions, number_of_recommendations,
+                                                       exclude=self.train_data[user_positions], allowed=allowed)
         else:
             raise ValueError('Invalid model type.')
 
-        return recommended_items
+        # the rankings return at most one column per business
+        return pad_columns(recommended_indices, number_of_recommendations)
 
+    def get_category_mask(self, categories):
+        """
+        Get the businesses of the user-item matrix in at least one of some categories.
+
+        Parameters:
+            - categories (list): The categories.
+
+        Returns:
+            - mask (ndarray): A boolean mask over the columns of the user-item matrix.
+        """
+        if self.category_index is None:
+            raise ValueError('The categories of the businesses are not loaded.')
+        return self.category_index.get_business_mask(categories, self.business_ids)
+
+    @instrumented()
     def get_business_info(self, business_id):
         """
         Get the information for a given business.
@@ -142,9 +892,24 @@ class RecommenderSystem:
         Returns:
             - business_info (dict): A dictionary containing the information for the given business.
         """
-        business_info = self.businesses[self.businesses['business_id'] == business_id].to_dict('records')[0]
+        business_info = self.business_records.get(business_id)
         return business_info
 
+    @instrumented()
+    def get_business_info_many(self, business_ids):
+        """
+        Get the information for many businesses at once.
+
+        Parameters:
+            - business_ids (list): The IDs of the businesses for which information is to be retrieved.
+
+        Returns:
+            - businesses_info (list): A list with the dictionary of information of each business, in the same order.
+        """
+        businesses_info = self.business_records.get_many(business_ids)
+        return businesses_info
+
+    @instrumented()
     def get_user_info(self, user_id):
         """
         Get the information for a given user.
@@ -155,7 +920,7 @@ class RecommenderSystem:
         Returns:
             - user_info (dict): A dictionary containing the information for the given user.
         """
-        user_info = self.users[self.users['user_id'] == user_id].to_dict('records')[0]
+        user_info = self.user_records.get(user_id)
         return user_info
 
     def make_recommendations_to_multiple_users(self, users_list, number_of_recommendations, verbose=True):
@@ -176,8 +941,7 @@ class RecommenderSystem:
                 print()
 
             recommendations = self.make_recommendations(user, number_of_recommendations)
-            for recommendation in recommendations:
-                business_info = self.get_business_info(recommendation)
+            for business_info in self.get_business_info_many(recommendations):
                 if verbose:
                     print(business_info['name'])
                     print(business_info['categories'])
@@ -193,15 +957,9 @@ class RecommenderSystem:
             - None
 
         Returns:
-            - len(categories) (int): The number of different categories in the dataset.
+            - number_of_categories (int): The number of different categories in the dataset.
         """
-        categories = set()
-
-        for _, business in self.businesses.iterrows():
-            if business['categories'] is not None:
-                categories.update(business['categories'])
-
-        return len(categories)
+        return self.category_index.count_categories()
 
     def get_avg_similarity_between_models(self, number_of_users, number_of_recommendations):
         user_ids = self.users.sample(number_of_users)['user_id']
@@ -210,18 +968,17 @@ class RecommenderSystem:
 
         print(user_ids)
 
+        # each model is fitted once and then used for every user
+        self.set_model_type('svd')
+        self.build_recommender_system()
         for i in user_ids:
-            print("User ID:", i)
-
-            self.set_model_type('svd')
-            self.build_recommender_system()
             svd_results.append(self.make_recommendations(i, number_of_recommendations))
 
-            self.set_model_type('knn')
-            self.build_recommender_system()
+        self.set_model_type('knn')
+        self.build_recommender_system()
+        for i in user_ids:
             knn_results.append(self.make_recommendations(i, number_of_recommendations))
 
-
         similarity = []
 
         for i in range(len(knn_results)):
@@ -242,9 +999,11 @@ class RecommenderSystem:
         business_info = self.get_business_info(business_id)
         return business_info['categories']
 
+    @instrumented()
     def get_top_x_relevant_categories(self, user_id, x):
         """
-        Get the top x relevant categories for a given user.
+        Get the top x relevant categories for a given user, i.e. the categories of the businesses
+        the user reviewed with 4 or 5 stars the most.
         
         Parameters:
             - user_id (str): The ID of the user for which categories are to be retrieved.
@@ -253,62 +1012,26 @@ class RecommenderSystem:
         Returns:
             - top_x_categories (list): A list of the top x relevant categories for the given user.
         """
-        all_pos_reviews_categories = [] # positive means with 4 or 5 stars
-
-        for _, review in self.reviews.iterrows():
-            if review['user_id'] == user_id and review['stars'] >= 4:
-                business_id = review['business_id']
-                business_info = self.get_business_info(business_id)
-                if business_info['categories'] is not None:
-                    all_pos_reviews_categories.append(business_info['categories'])
-
-        # make a histogram with the all_pos_reviews_categories counts
-        # Count the frequency of each string
-        histogram = {}
-        for item in all_pos_reviews_categories:
-            if item in histogram:
-                histogram[item] += 1
-            else:
-                histogram[item] = 1
-
-        # Extract the unique strings and their frequencies
-        labels = list(histogram.keys())
-        frequencies = list(histogram.values())
-
-        # Create the histogram
-        """ plt.bar(labels, frequencies)
-        plt.xticks(rotation=45)
-
-        # Add labels and title
-        plt.xlabel('Categories the user rated 4 or 5 stars')
-        plt.ylabel('Frequency')
-        plt.title('All Categories of businesses reviewed by user with 4 or 5 Histogram')
-
-        # Display the histogram
-        plt.show() """
+        return self.category_profiles.get_top_categories(user_id, x)
 
-        """sorted_histogram = sorted(histogram.items(), key=lambda x: x[1], reverse=True)
-
-        labels = [item[0] for item in sorted_histogram[:10]]
-        frequencies = [item[1] for item in sorted_histogram[:10]]
-
-        plt.bar(labels, frequencies)
-        plt.xticks(rotation=20)
-
-        plt.xlabel('Categories the user rated 4 or 5 stars')
-        plt.ylabel('Frequency')
-        plt.title('Top ten Categories of businesses reviewed by user with 4 or 5 Histogram')
+    def check_if_a_certain_business_is_relevant_to_user(self, user_id, business_categories, top_categories):
+        # check if the business_categories are in the top 10 categories
+        return is_relevant_to_categories(business_categories, top_categories)
 
-        # Display the histogram
-        plt.show() """
+    def check_if_businesses_are_relevant_to_users(self, user_ids, business_ids, x=10):
+        """
+        Check many (user, business) pairs at once: a business is relevant to a user if one of its categories
+        is in the top x categories of the user, as check_if_a_certain_business_is_relevant_to_user.
 
-        # get top x categories in all_pos_reviews_categories
-        return [y[0] for y in sorted(Counter(all_pos_reviews_categories).items(), key=lambda y: y[1], reverse=True)[:x]]
+        Parameters:
+            - user_ids (list): The user of each pair.
+            - business_ids (list): The business of each pair.
+            - x (int): The number of top categories of each user.
 
-    def check_if_a_certain_business_is_relevant_to_user(self, user_id, business_categories, top_categories):
-        # check if the business_categories are in the top 10 categories
-        for category in top_categories:
-            for business_category in business_categories:
-                if business_category in category:
-                    return True
-        return False
+        Returns:
+            - is_relevant (ndarray): A boolean array, True for the relevant pairs.
+        """
+        # the top categories are computed once per distinct user
+        owners, distinct_users = pd.factorize(pd.Series(user_ids, dtype=object))
+        top_categories = [self.get_top_x_relevant_categories(user_id, x) for user_id in distinct_users]
+        return self.category_index.are_relevant(business_ids, top_categories, owners)
@@ -0,0 +1,95 @@
+import numpy as np
+import pandas as pd
+
+
+class RecordIndex:
+    """
+    Hash index over the rows of a DataFrame, for constant-time lookups of records by key.
+
+    The key column is mapped to row positions once and every column is extracted once as a list of
+    Python values (the same ones to_dict('records') returns), so a lookup is a dictionary access plus
+    one element read per column.
+
+    Parameters:
+        - data (DataFrame): The table to index.
+        - key (str): The name of the column with the unique key of each row.
+    """
+
+    __slots__ = ('data', 'key', 'keys', 'rows', 'positions', 'columns')
+
+    def __init__(self, data, key):
+        """
+        Initialize the RecordIndex object.
+
+        Parameters:
+            - data (DataFrame): The table to index.
+            - key (str): The name of the column with the unique key of each row.
+        """
+        self.data = data.reset_index(drop=True)
+        self.key = key
+
+        # the first row wins when a key is duplicated, as the previous boolean scan did
+        first_rows = ~self.data[key].duplicated().to_numpy()
+        self.keys = pd.Index(self.data[key][first_rows])
+        self.rows = np.flatnonzero(first_rows)
+        self.positions = dict(zip(self.keys, self.rows))
+        self.columns = {column: self.data[column].tolist() for column in self.data.columns}
+
+    def __len__(self):
+        return len(self.data)
+
+    def __contains__(self, key):
+        return key in self.positions
+
+    def get_position(self, key):
+        """
+        Get the row position of a given key.
+
+        Parameters:
+            - key: The key of the record.
+
+        Returns:
+            - position (int): The position of the record in the indexed table.
+        """
+        return self.positions[key]
+
+    def get_positions(self, keys):
+        """
+        Get the row positions of many keys. Missing keys get the position -1.
+
+        Parameters:
+            - keys (list): The keys of the records.
+
+        Returns:
+            - positions (ndarray): The position of each record in the indexed table.
+        """
+        codes = self.keys.get_indexer(keys)
+        return np.where(codes >= 0, self.rows[codes], -1)
+
+    def get(self, key):
+        """
+        Get the record of a given key.
+
+        Parameters:
+            - key: The key of the record.
+
+        Returns:
+            - record (dict): A dictionary with the value of each column for the given key.
+        """
+        position = self.positions[key]
+        return {column: values[position] for column, values in self.columns.items()}
+
+    def get_many(self, keys):
+        """
+        Get the records of many keys with a single take over the indexed table.
+
+        Parameters:
+            - keys (list): The keys of the records.
+
+        Returns:
+            - records (list): A list of dictionaries, one per key, in the same order as the keys.
+        """
+        positions = self.get_positions(keys)
+        if (positions < 0).any():
+            raise KeyError(np.asarray(keys, dtype=object)[positions < 0][0])
+        return self.data.take(positions).to_dict('records')
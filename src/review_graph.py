@@ -0,0 +1,90 @@
+import numpy as np
+import scipy.sparse as sp
+
+from user_item_matrix import build_user_item_matrix
+
+
+class ReviewGraph:
+    """
+    Weighted bipartite graph of users and businesses, with one edge per reviewed (user, business) pair.
+
+    The nodes are numbered with the users first, in the order of user_ids, followed by the businesses,
+    in the order of business_ids. The weight of an edge is the mean stars of the reviews of the pair.
+
+    Parameters:
+        - biadjacency (csr_matrix): The (users x businesses) matrix of edge weights.
+        - user_ids (Index): The ID of each user node.
+        - business_ids (Index): The ID of each business node.
+    """
+
+    def __init__(self, biadjacency, user_ids, business_ids):
+        """
+        Initialize the ReviewGraph object.
+
+        Parameters:
+            - biadjacency (csr_matrix): The (users x businesses) matrix of edge weights.
+            - user_ids (Index): The ID of each user node.
+            - business_ids (Index): The ID of each business node.
+        """
+        self.biadjacency = sp.csr_matrix(biadjacency)
+        self.user_ids = user_ids
+        self.business_ids = business_ids
+        self.number_of_users, self.number_of_businesses = self.biadjacency.shape
+
+    @classmethod
+    def from_reviews(cls, reviews):
+        """
+        Build the graph of a review table.
+
+        Parameters:
+            - reviews (DataFrame): The reviews, with the 'user_id', 'business_id' and 'stars' columns.
+
+        Returns:
+            - graph (ReviewGraph): The review graph.
+        """
+        return cls(*build_user_item_matrix(reviews))
+
+    @classmethod
+    def from_codes(cls, user_codes, business_codes, weights, user_ids, business_ids):
+        """
+        Build the graph straight from integer-encoded review arrays, e.g. the codes of pd.factorize.
+
+        Parameters:
+            - user_codes (ndarray): The user position of each review.
+            - business_codes (ndarray): The business position of each review.
+            - weights (ndarray): The stars of each review.
+            - user_ids (Index): The ID of each user position.
+            - business_ids (Index): The ID of each business position.
+
+        Returns:
+            - graph (ReviewGraph): The review graph, weighted by the mean stars of each (user, business) pair.
+        """
+        shape = (len(user_ids), len(business_ids))
+        weight_sums = sp.csr_matrix((np.asarray(weights, dtype=np.float32), (user_codes, business_codes)), shape=shape)
+        counts = sp.csr_matrix((np.ones(len(user_codes), dtype=np.float32), (user_codes, business_codes)), shape=shape)
+
+        # both matrices have the same sparsity pattern, so their data arrays are aligned
+        weight_sums.sum_duplicates()
+        counts.sum_duplicates()
+        weight_sums.data /= counts.data
+
+        return cls(weight_sums, user_ids, business_ids)
+
+    @property
+    def number_of_nodes(self):
+        return self.number_of_users + self.number_of_businesses
+
+    @property
+    def adjacency(self):
+        """
+        The symmetric (nodes x nodes) adjacency matrix of the graph.
+        """
+        return sp.bmat([[None, self.biadjacency], [self.biadjacency.T, None]], format='csr',
+                       dtype=self.biadjacency.dtype)
+
+    @property
+    def node_ids(self):
+        """
+        The ID of every node, users first.
+        """
+        return np.concatenate([np.asarray(self.user_ids, dtype=object), np.asarray(self.business_ids, dtype=object)])
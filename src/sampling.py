@@ -0,0 +1,238 @@
+import argparse
+
+import numpy as np
+import pandas as pd
+import scipy.sparse as sp
+
+from data_sources import ParquetDataSource, PickleDataSource
+
+# the users the sample of the notebook was grown from
+DEFAULT_SEED_USERS = ['qVc8ODYU5SZjKXVBgXdI7w', 'j14WgRoU_-2ZE1aw1dXrJg']
+
+
+def parse_friends(friends):
+    """
+    Parse a friends column into one list of IDs per user.
+
+    The raw dataset stores the friends as comma separated strings ('None' for no friend),
+    while the samples store them as lists.
+
+    Parameters:
+        - friends (Series): The friends of each user, as lists or as comma separated strings.
+
+    Returns:
+        - friend_lists (Series): The list of friend IDs of each user, with the same index.
+    """
+    split = friends.astype(object).str.split(', ')
+    friend_lists = split.where(split.notna(), friends.astype(object))
+    return friend_lists.map(lambda friend_ids: friend_ids if isinstance(friend_ids, list) else [])
+
+
+def build_friend_graph(users, chunk_size=100_000):
+    """
+    Build the sparse friendship adjacency of a user table, parsing the friend lists once.
+
+    The friends are parsed and mapped to user positions one chunk of users at a time, so only the integer
+    positions of every friendship are held in memory and not millions of ID strings.
+
+    Parameters:
+        - users (DataFrame): The users, with the 'user_id' and 'friends' columns.
+        - chunk_size (int): The number of users parsed at a time.
+
+    Returns:
+        - adjacency (csr_matrix): The boolean (users x users) matrix of the listed friendships,
+                                  with the users in the order of the table; friends not in the table are dropped.
+        - user_ids (Index): The ID of each row of the matrix.
+    """
+    user_ids = pd.Index(users['user_id'].astype(object), name='user_id')
+    friend_column = users['friends'].reset_index(drop=True)
+
+    rows, columns = [], []
+    for start in range(0, len(friend_column), chunk_size):
+        friends = parse_friends(friend_column.iloc[start:start + chunk_size]).explode()
+        positions = user_ids.get_indexer(friends.to_numpy())
+        known = positions >= 0
+        rows.append(friends.index.to_numpy()[known].astype(np.int32))
+        columns.append(positions[known].astype(np.int32))
+
+    rows = np.concatenate(rows) if rows else np.empty(0, dtype=np.int32)
+    columns = np.concatenate(columns) if columns else np.empty(0, dtype=np.int32)
+    adjacency = sp.csr_matrix((np.ones(len(rows), dtype=bool), (rows, columns)), shape=(len(user_ids), len(user_ids)))
+    return adjacency, user_ids
+
+
+def bfs_sample(adjacency, seeds, size, rng):
+    """
+    Sample users breadth first from seed users: the seeds, then their friends, then the friends of their friends...
+
+    Each level is expanded at once; the level that overflows the size is truncated at random. When the
+    component of the seeds is exhausted, the search restarts from a random user not yet sampled.
+
+    Parameters:
+        - adjacency (csr_matrix): The (users x users) friendships.
+        - seeds (ndarray): The positions of the seed users.
+        - size (int): The number of users to sample.
+        - rng (Generator): The random generator.
+
+    Returns:
+        - sample (ndarray): The positions of the sampled users, in the order they were reached.
+    """
+    size = min(size, adjacency.shape[0])
+    visited = np.zeros(adjacency.shape[0], dtype=bool)
+    levels = []
+    number_sampled = 0
+    frontier = pd.unique(np.asarray(seeds))
+
+    while number_sampled < size:
+        frontier = frontier[~visited[frontier]]
+        if len(frontier) == 0:
+            frontier = rng.choice(np.flatnonzero(~visited), 1)
+
+        if number_sampled + len(frontier) > size:
+            frontier = rng.permutation(frontier)[:size - number_sampled]
+        visited[frontier] = True
+        levels.append(frontier)
+        number_sampled += len(frontier)
+
+        # the friends of the whole level, in the order they are listed
+        friends = adjacency[frontier].indices
+        frontier = pd.unique(friends[~visited[friends]])
+
+    return np.concatenate(levels)
+
+
+def random_walk_sample(adjacency, seeds, size, rng, number_of_walkers=1000, restart_probability=0.15):
+    """
+    Sample users with random walks on the friendships, moving many walkers at once.
+
+    At each step every walker moves to a random friend of its user, or jumps back to a random sampled user
+    with the restart probability or when its user has no friend. When a step reaches no new user, a walker
+    jumps to a random user not yet sampled, so the sample keeps growing.
+
+    Parameters:
+        - adjacency (csr_matrix): The (users x users) friendships.
+        - seeds (ndarray): The positions of the seed users.
+        - size (int): The number of users to sample.
+        - rng (Generator): The random generator.
+        - number_of_walkers (int): The number of walkers moving at each step.
+        - restart_probability (float): The probability that a walker jumps back to a sampled user.
+
+    Returns:
+        - sample (ndarray): The positions of the sampled users, in the order they were reached.
+    """
+    size = min(size, adjacency.shape[0])
+    degrees = np.diff(adjacency.indptr)
+    visited = np.zeros(adjacency.shape[0], dtype=bool)
+
+    sample = np.empty(size, dtype=np.intp)
+    seeds = pd.unique(np.asarray(seeds))[:size]
+    sample[:len(seeds)] = seeds
+    visited[seeds] = True
+    number_sampled = len(seeds)
+    walkers = rng.choice(seeds, number_of_walkers)
+
+    while number_sampled < size:
+        # move every walker to a random friend, or back to a random sampled user
+        restart = (rng.random(number_of_walkers) < restart_probability) | (degrees[walkers] == 0)
+        offsets = (rng.random(number_of_walkers) * degrees[walkers]).astype(np.intp)
+        walkers = np.where(restart, sample[rng.integers(0, number_sampled, number_of_walkers)],
+                           adjacency.indices[np.minimum(adjacency.indptr[walkers] + offsets, adjacency.nnz - 1)])
+
+        new_users = pd.unique(walkers[~visited[walkers]])
+        if len(new_users) == 0:
+            new_users = rng.choice(np.flatnonzero(~visited), 1)
+            walkers[0] = new_users[0]
+
+        new_users = new_users[:size - number_sampled]
+        visited[new_users] = True
+        sample[number_sampled:number_sampled + len(new_users)] = new_users
+        number_sampled += len(new_users)
+
+    return sample
+
+
+def sample_users(adjacency, seeds, size, method='bfs', seed=0):
+    """
+    Sample users by a snowball sample of the friend graph.
+
+    Parameters:
+        - adjacency (csr_matrix): The (users x users) friendships, see build_friend_graph.
+        - seeds (ndarray): The positions of the seed users.
+        - size (int): The number of users to sample.
+        - method (str): 'bfs' or 'random_walk'.
+        - seed (int): The seed of the sample.
+
+    Returns:
+        - sample (ndarray): The positions of the sampled users, in the order they were reached.
+    """
+    rng = np.random.default_rng(seed)
+    if method == 'bfs':
+        return bfs_sample(adjacency, seeds, size, rng)
+    elif method == 'random_walk':
+        return random_walk_sample(adjacency, seeds, size, rng)
+    else:
+        raise ValueError('Invalid sampling method.')
+
+
+def build_sample(source, target, size, seed_users=DEFAULT_SEED_USERS, method='bfs', seed=0):
+    """
+    Build a sample dataset from a larger one: a snowball sample of the users, their reviews and the businesses
+    they reviewed, with the friends of each sampled user restricted to the sample, as in the sna.ipynb notebook.
+
+    Only the IDs and friends of every user are read to sample; the tables are then read filtered to the sample.
+
+    Parameters:
+        - source (PickleDataSource): The data source of the full dataset.
+        - target (PickleDataSource): The data source to write the sample to, read by RecommenderSystem.load_data.
+        - size (int): The number of users to sample.
+        - seed_users (list): The IDs of the users to grow the sample from.
+        - method (str): 'bfs' or 'random_walk'.
+        - seed (int): The seed of the sample.
+
+    Returns:
+        - sizes (dict): The number of rows of each table of the sample.
+    """
+    adjacency, user_ids = build_friend_graph(source.read('users', columns=['user_id', 'friends']))
+    seeds = user_ids.get_indexer(seed_users)
+    if (seeds < 0).any():
+        raise KeyError(np.asarray(seed_users, dtype=object)[seeds < 0][0])
+
+    sample = sample_users(adjacency, seeds, size, method, seed)
+    sampled_ids = user_ids[sample]
+
+    # the sampled users in the order they were reached, with their friends in the sample
+    users = source.read('users', filters=[('user_id', 'in', list(sampled_ids))])
+    users = users.set_index(users['user_id'].astype(object)).loc[sampled_ids].reset_index(drop=True)
+    friendships = adjacency[sample][:, sample].tocsr()
+    sampled_ids = np.asarray(sampled_ids, dtype=object)
+    users['friends'] = [list(friend_ids) for friend_ids in
+                        np.split(sampled_ids[friendships.indices], friendships.indptr[1:-1])]
+
+    reviews = source.read('reviews', filters=[('user_id', 'in', list(sampled_ids))])
+    businesses = source.read('businesses', filters=[('business_id', 'in', list(pd.unique(reviews['business_id'])))])
+
+    target.write('users', users)
+    target.write('reviews', reviews)
+    target.write('businesses', businesses)
+
+    return {'users': len(users), 'reviews': len(reviews), 'businesses': len(businesses)}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Build a sample dataset by a snowball sample of the friend graph.')
+    parser.add_argument('source_dir', help='directory of the full tables')
+    parser.add_argument('target_dir', help='directory to write the sample tables to')
+    parser.add_argument('--size', type=int, default=1000, help='number of users to sample')
+    parser.add_argument('--seed-users', nargs='+', default=DEFAULT_SEED_USERS)
+    parser.add_argument('--method', default='bfs', choices=['bfs', 'random_walk'])
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--source-format', default='parquet', choices=['parquet', 'pickle'])
+    parser.add_argument('--target-format', default='pickle', choices=['parquet', 'pickle'])
+    args = parser.parse_args()
+
+    data_sources = {'parquet': ParquetDataSource, 'pickle': PickleDataSource}
+    sizes = build_sample(data_sources[args.source_format](args.source_dir),
+                         data_sources[args.target_format](args.target_dir),
+                         args.size, args.seed_users, args.method, args.seed)
+    for table, number_of_rows in sizes.items():
+        print('Number of {}: {}'.format(table, number_of_rows))
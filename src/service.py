@@ -0,0 +1,408 @@
+import argparse
+import asyncio
+import json
+import math
+from concurrent.futures import ThreadPoolExecutor
+from http import HTTPStatus
+from urllib.parse import parse_qs, urlsplit
+
+import pandas as pd
+
+from data_sources import ParquetDataSource, PickleDataSource
+from record_index import RecordIndex
+from recommender_system import RecommenderSystem
+
+# the columns of the business table returned with each recommendation
+BUSINESS_FIELDS = ('name', 'city', 'state', 'stars', 'review_count', 'categories')
+
+
+def to_json_value(value):
+    """
+    Convert a value of a table to a value json can write, NaN and missing values to null.
+    """
+    if isinstance(value, float) and math.isnan(value):
+        return None
+    if hasattr(value, 'item'):
+        return value.item()
+    return value
+
+
+class MicroBatcher:
+    """
+    Collect the concurrent recommendation requests into batches scored with a single matrix operation.
+
+    The first request of a batch waits at most max_wait seconds for other requests, and a batch is scored
+    as soon as it has max_batch_size requests. The batches are scored in a worker thread, so the event loop
+    keeps accepting requests, which form the next batch, while a batch is scored.
+
+    Parameters:
+        - score_batch (callable): The function that scores a batch, taking the lists of user IDs and of numbers
+                                  of recommendations and returning one result per request.
+        - max_batch_size (int): The maximum number of requests in a batch.
+        - max_wait (float): The maximum number of seconds a request waits for the batch to fill.
+    """
+
+    def __init__(self, score_batch, max_batch_size=256, max_wait=0.002):
+        """
+        Initialize the MicroBatcher object.
+
+        Parameters:
+            - score_batch (callable): The function that scores a batch, taking the lists of user IDs and of numbers
+                                      of recommendations and returning one result per request.
+            - max_batch_size (int): The maximum number of requests in a batch.
+            - max_wait (float): The maximum number of seconds a request waits for the batch to fill.
+        """
+        self.score_batch = score_batch
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+
+        self.number_of_batches = 0
+        self.number_of_requests = 0
+
+    async def start(self):
+        """
+        Start collecting the requests, in the running event loop.
+        """
+        self.queue = asyncio.Queue()
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        self.task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        """
+        Stop collecting the requests and shut the worker thread down.
+        """
+        self.task.cancel()
+        try:
+            await self.task
+        except asyncio.CancelledError:
+            pass
+        self.executor.shutdown(wait=True)
+
+    async def submit(self, user_id, number_of_recommendations):
+        """
+        Queue a request and wait for the result of its batch.
+
+        Parameters:
+            - user_id (str): The ID of the user.
+            - number_of_recommendations (int): The number of recommendations to make.
+
+        Returns:
+            - result: The result of the request, as returned by score_batch.
+        """
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((user_id, number_of_recommendations, future))
+        return await future
+
+    async def collect_batch(self):
+        """
+        Wait for a request, then collect the requests that arrive within max_wait, up to max_batch_size.
+        """
+        loop = asyncio.get_running_loop()
+        batch = [await self.queue.get()]
+        deadline = loop.time() + self.max_wait
+
+        while len(batch) < self.max_batch_size:
+            # take the queued requests first, then wait for new ones until the deadline
+            if not self.queue.empty():
+                batch.append(self.queue.get_nowait())
+                continue
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+
+        return batch
+
+    async def run(self):
+        """
+        Score the batches one after the other until stopped.
+        """
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await self.collect_batch()
+            user_ids = [user_id for user_id, _, _ in batch]
+            numbers_of_recommendations = [number for _, number, _ in batch]
+
+            try:
+                results = await loop.run_in_executor(self.executor, self.score_batch, user_ids,
+                                                     numbers_of_recommendations)
+            except Exception as error:
+                for _, _, future in batch:
+                    if not future.done():
+                        future.set_exception(error)
+                continue
+
+            self.number_of_batches += 1
+            self.number_of_requests += len(batch)
+            for (_, _, future), result in zip(batch, results):
+                if not future.done():
+                    future.set_result(result)
+
+    def get_stats(self):
+        """
+        Get the number of scored batches and requests, and the mean batch size.
+        """
+        return {
+            'batches': self.number_of_batches,
+            'requests': self.number_of_requests,
+            'mean_batch_size': self.number_of_requests / self.number_of_batches if self.number_of_batches else 0.0
+        }
+
+
+class RecommendationService:
+    """
+    HTTP service that serves the recommendations of a persisted model, built on asyncio streams.
+
+    The model is loaded once, the concurrent requests are scored in micro-batches (see MicroBatcher),
+    and every recommended business is returned with its record from an index of the business table.
+
+    Endpoints:
+        - GET /recommendations?user_id=<id>&n=<number>: the top n recommendations of a user.
+        - GET /health: the type and the size of the model.
+        - GET /stats: the counters of the batches and of the recommendation cache.
+
+    Parameters:
+        - recommender_system (RecommenderSystem): The recommender system with a fitted model.
+        - businesses (DataFrame): The business table, with a 'business_id' column.
+        - fields (tuple): The columns of the business table returned with each recommendation.
+        - max_batch_size (int): The maximum number of requests scored together.
+        - max_wait (float): The maximum number of seconds a request waits for its batch to fill.
+        - max_recommendations (int): The maximum number of recommendations of a request.
+    """
+
+    def __init__(self, recommender_system, businesses, fields=BUSINESS_FIELDS, max_batch_size=256, max_wait=0.002,
+                 max_recommendations=100):
+        """
+        Initialize the RecommendationService object.
+
+        Parameters:
+            - recommender_system (RecommenderSystem): The recommender system with a fitted model.
+            - businesses (DataFrame): The business table, with a 'business_id' column.
+            - fields (tuple): The columns of the business table returned with each recommendation.
+            - max_batch_size (int): The maximum number of requests scored together.
+            - max_wait (float): The maximum number of seconds a request waits for its batch to fill.
+            - max_recommendations (int): The maximum number of recommendations of a request.
+        """
+        self.recommender_system = recommender_system
+        self.fields = [field for field in fields if field in businesses.columns and field != 'business_id']
+        self.business_records = RecordIndex(businesses[['business_id'] + self.fields], 'business_id')
+        self.max_recommendations = max_recommendations
+        self.batcher = MicroBatcher(self.score_batch, max_batch_size, max_wait)
+
+    @classmethod
+    def from_model_dir(cls, model_dir, data_source=None, **kwargs):
+        """
+        Create a service from a model saved with RecommenderSystem.save_model and the business table of a data source.
+
+        Parameters:
+            - model_dir (str): The directory of the saved model.
+            - data_source (PickleDataSource): The data source of the business table, the data directory by default.
+            - kwargs: The other parameters of RecommendationService.
+
+        Returns:
+            - service (RecommendationService): The service, ready to run.
+        """
+        data_source = data_source if data_source is not None else PickleDataSource()
+        recommender_system = RecommenderSystem.load_model(model_dir, data_source=data_source)
+        return cls(recommender_system, data_source.read('businesses'), **kwargs)
+
+    def score_batch(self, user_ids, numbers_of_recommendations):
+        """
+        Make the recommendations of a batch of requests with a single call to make_recommendations_batch.
+
+        Runs in the worker thread of the batcher.
+
+        Parameters:
+            - user_ids (list): The ID of the user of each request.
+            - numbers_of_recommendations (list): The number of recommendations of each request.
+
+        Returns:
+            - results (list): The list of recommended business records of each request, or None for an unknown user.
+        """
+        rs = self.recommender_system
+        known = rs.user_ids.get_indexer(user_ids) >= 0
+        known_user_ids = [user_id for user_id, is_known in zip(user_ids, known) if is_known]
+        if not known_user_ids:
+            return [None] * len(user_ids)
+
+        # every request of the batch is a prefix of the longest one
+        recommendations = rs.make_recommendations_batch(known_user_ids, max(numbers_of_recommendations)).to_numpy()
+
+        records = self.get_business_records(
+            {business_id for row in recommendations for business_id in row if pd.notna(business_id)})
+
+        results = []
+        rows = iter(recommendations)
+        for is_known, number_of_recommendations in zip(known, numbers_of_recommendations):
+            if not is_known:
+                results.append(None)
+                continue
+            row = next(rows)
+            results.append([records[business_id] for business_id in row[:number_of_recommendations]
+                            if pd.notna(business_id)])
+        return results
+
+    def get_business_records(self, business_ids):
+        """
+        Get the records of the recommended businesses; the businesses missing from the table only get their ID.
+
+        Parameters:
+            - business_ids (set): The IDs of the businesses.
+
+        Returns:
+            - records (dict): The record of each business, by ID.
+        """
+        business_ids = list(business_ids)
+        positions = self.business_records.get_positions(business_ids)
+        columns = self.business_records.columns
+
+        records = {}
+        for business_id, position in zip(business_ids, positions):
+            record = {'business_id': business_id}
+            if position >= 0:
+                record.update((field, to_json_value(columns[field][position])) for field in self.fields)
+            records[business_id] = record
+        return records
+
+    async def handle_request(self, method, target):
+        """
+        Route a request to its endpoint.
+
+        Parameters:
+            - method (str): The HTTP method.
+            - target (str): The path and query of the request.
+
+        Returns:
+            - status (HTTPStatus): The status of the response.
+            - body (dict): The body of the response, written as JSON.
+        """
+        url = urlsplit(target)
+        if method != 'GET':
+            return HTTPStatus.METHOD_NOT_ALLOWED, {'error': 'Only GET is supported.'}
+
+        if url.path == '/recommendations':
+            query = parse_qs(url.query)
+            if 'user_id' not in query:
+                return HTTPStatus.BAD_REQUEST, {'error': 'Missing user_id.'}
+            try:
+                number_of_recommendations = int(query.get('n', ['10'])[0])
+            except ValueError:
+                return HTTPStatus.BAD_REQUEST, {'error': 'n must be an integer.'}
+            if not 0 < number_of_recommendations <= self.max_recommendations:
+                return HTTPStatus.BAD_REQUEST, {
+                    'error': 'n must be between 1 and {}.'.format(self.max_recommendations)}
+
+            user_id = query['user_id'][0]
+            recommendations = await self.batcher.submit(user_id, number_of_recommendations)
+            if recommendations is None:
+                return HTTPStatus.NOT_FOUND, {'error': 'Unknown user {}.'.format(user_id)}
+            return HTTPStatus.OK, {'user_id': user_id, 'recommendations': recommendations}
+
+        if url.path == '/health':
+            rs = self.recommender_system
+            return HTTPStatus.OK, {'status': 'ok', 'model_type': rs.model_type, 'users': len(rs.user_ids),
+                                   'businesses': len(rs.business_ids)}
+
+        if url.path == '/stats':
+            return HTTPStatus.OK, {'batches': self.batcher.get_stats(),
+                                   'cache': self.recommender_system.get_cache_stats()}
+
+        return HTTPStatus.NOT_FOUND, {'error': 'Unknown path {}.'.format(url.path)}
+
+    async def handle_connection(self, reader, writer):
+        """
+        Serve the HTTP/1.1 requests of a connection, kept alive until the client closes it.
+        """
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                method, target, version = request_line.decode('latin-1').split()
+
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+
+                # the endpoints take no body
+                if int(headers.get('content-length', 0)):
+                    await reader.readexactly(int(headers['content-length']))
+
+                try:
+                    status, body = await self.handle_request(method, target)
+                except Exception as error:
+                    status, body = HTTPStatus.INTERNAL_SERVER_ERROR, {'error': str(error)}
+
+                keep_alive = version == 'HTTP/1.1' and headers.get('connection', '').lower() != 'close'
+                payload = json.dumps(body).encode()
+                writer.write('HTTP/1.1 {} {}\r\nContent-Type: application/json\r\nContent-Length: {}\r\n'
+                             'Connection: {}\r\n\r\n'.format(status.value, status.phrase, len(payload),
+                                                             'keep-alive' if keep_alive else 'close').encode()
+                             + payload)
+                await writer.drain()
+
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, host='127.0.0.1', port=8000, ready=None):
+        """
+        Serve the requests until cancelled.
+
+        Parameters:
+            - host (str): The address to listen on.
+            - port (int): The port to listen on.
+            - ready (Event): An optional asyncio event set once the service is listening.
+        """
+        await self.batcher.start()
+        server = await asyncio.start_server(self.handle_connection, host, port)
+        try:
+            async with server:
+                if ready is not None:
+                    ready.set()
+                await server.serve_forever()
+        finally:
+            await self.batcher.stop()
+
+    def run(self, host='127.0.0.1', port=8000):
+        """
+        Serve the requests until interrupted.
+        """
+        try:
+            asyncio.run(self.serve(host, port))
+        except KeyboardInterrupt:
+            pass
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Serve the recommendations of a saved model over HTTP.')
+    parser.add_argument('model_dir', help='directory of the model saved with RecommenderSystem.save_model')
+    parser.add_argument('--data-dir', default=None, help='directory of the business table')
+    parser.add_argument('--data-format', default='pickle', choices=['parquet', 'pickle'])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--max-batch-size', type=int, default=256, help='maximum number of requests per batch')
+    parser.add_argument('--max-wait-ms', type=float, default=2.0, help='maximum wait for a batch to fill')
+    parser.add_argument('--ann-probes', type=int, default=None,
+                        help='recommend from an IVF index probing this many lists (svd only), instead of a full scan')
+    args = parser.parse_args()
+
+    data_sources = {'parquet': ParquetDataSource, 'pickle': PickleDataSource}
+    data_source = data_sources[args.data_format](args.data_dir) if args.data_dir else PickleDataSource()
+    service = RecommendationService.from_model_dir(args.model_dir, data_source, max_batch_size=args.max_batch_size,
+                                                   max_wait=args.max_wait_ms / 1000)
+    if args.ann_probes is not None:
+        service.recommender_system.build_ann_index(n_probe=args.ann_probes)
+    print('Serving {} recommendations on http://{}:{}'.format(service.recommender_system.model_type, args.host,
+                                                             args.port))
+    service.run(args.host, args.port)
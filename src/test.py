@@ -1,14 +1,18 @@
 import os
 
+from evaluation import Evaluator
 from recommender_system import RecommenderSystem
 
 
 current_directory = os.getcwd()
 print("Current working directory:", current_directory)
 
+# the models directory of the repository, so the script runs from any working directory
+MODEL_DIR = os.path.normpath(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'models', 'svd'))
+
 # creating an instance of the RecommenderSystem
 rs = RecommenderSystem('svd')
-rs.build_recommender_system()
+rs.build_recommender_system(model_dir=MODEL_DIR)
 
 """ # TEST 1: get top 3 recommendations for 2 different users and check their validity
 number_of_recommendations = 5
@@ -36,12 +40,13 @@ print("---------- Average similarity between SVD and KNN ----------")
 # TEST 3: check the recommendations inside the communities
 print("---------- Recommendations inside the communities ----------")
 
-rs.reviews = rs.read_file('../data/user1_community_reviews.pickle')
-rs.preprocess_data()
+# one svd model per louvain community, fitted in parallel, with the global svd model as the fallback
 rs.set_model_type('svd')
 rs.build_recommender_system()
+rs.build_community_models(method='louvain', n_jobs=-1)
 
-rs.make_recommendations_to_multiple_users([user1], number_of_recommendations) """
+print("Community of user 1:", rs.get_user_community(user1))
+rs.make_recommendations_to_multiple_users([user1, user2], number_of_recommendations) """
 
 user1 = 'bJ5FtCtZX3ZZacz2_2PJjA'
 
@@ -75,56 +80,7 @@ print(rs.check_if_a_certain_business_is_relevant_to_user(user1, ["Restaurants",
 # Testing the recommender system with svd and knn with a sample of 100 users
 # rs.get_avg_similarity_between_models(100, 20)
 
-# create a sample of users to test 100, svd
-rs = RecommenderSystem('svd')
-rs.build_recommender_system()
-
-users_to_test = rs.users.sample(100)['user_id']
-number_of_recommendations = 10
-
-precision_per_user = []
-
-for user in users_to_test:
-    recommendations = rs.make_recommendations(user, number_of_recommendations)
-    top_ten_relevants = rs.get_top_x_relevant_categories(user, 5)
-    print("top ten relevants: ", top_ten_relevants)
-
-    results = []
-    for recommendation in recommendations:
-        print("recommendation: ", recommendation)
-        business_categories = rs.get_businesses_categories(recommendation)
-        is_relevant = rs.check_if_a_certain_business_is_relevant_to_user(user, business_categories, top_ten_relevants)
-        results.append(is_relevant)
-
-    precision = results.count(True) / len(results)
-    print("precision: ", precision)
-    precision_per_user.append(precision)
-
-print("Average precision for svd: ", sum(precision_per_user) / len(precision_per_user))
-
-# create a sample of users to test 100, knn
-rs = RecommenderSystem('knn')
-rs.build_recommender_system()
-
-users_to_test = rs.users.sample(100)['user_id']
-number_of_recommendations = 10
-
-precision_per_user = []
-
-for user in users_to_test:
-    recommendations = rs.make_recommendations(user, number_of_recommendations)
-    top_ten_relevants = rs.get_top_x_relevant_categories(user, 5)
-    print("top ten relevants: ", top_ten_relevants)
-
-    results = []
-    for recommendation in recommendations:
-        print("recommendation: ", recommendation)
-        business_categories = rs.get_businesses_categories(recommendation)
-        is_relevant = rs.check_if_a_certain_business_is_relevant_to_user(user, business_categories, top_ten_relevants)
-        results.append(is_relevant)
-
-    precision = results.count(True) / len(results)
-    print("precision: ", precision)
-    precision_per_user.append(precision)
-
-print("Average precision for knn: ", sum(precision_per_user) / len(precision_per_user))
+# evaluate svd and knn over the same sample of 100 users, with a held-out split of their reviews, one batch of
+# users per core
+evaluator = Evaluator(rs, number_of_users=100, k=10, seed=0, n_jobs=os.cpu_count() or 1)
+print(evaluator.evaluate_models(['svd', 'knn']).to_string())
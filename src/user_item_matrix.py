@@ -0,0 +1,92 @@
+import numpy as np
+import pandas as pd
+from scipy.sparse import csr_matrix
+
+
+def build_user_item_matrix(reviews, return_counts=False):
+    """
+    Build a sparse user-item matrix with the mean rating of each (user, business) pair.
+
+    The users and businesses are integer encoded (sorted, as the columns of the old dense pivot table),
+    so the matrix is built from a vectorized groupby over the codes and never materialized as dense.
+
+    Parameters:
+        - reviews (DataFrame): The reviews, with at least the 'user_id', 'business_id' and 'stars' columns.
+        - return_counts (bool): Whether to also return the number of reviews of each pair.
+
+    Returns:
+        - user_item_ratings (csr_matrix): A users x businesses matrix with the mean stars of each pair.
+        - user_ids (Index): The user ID of each row of the matrix.
+        - business_ids (Index): The business ID of each column of the matrix.
+        - review_counts (csr_matrix): Only with return_counts, the number of reviews of each pair,
+                                      stored in the same order as the ratings.
+    """
+    user_codes, user_ids = pd.factorize(reviews['user_id'], sort=True)
+    business_codes, business_ids = pd.factorize(reviews['business_id'], sort=True)
+
+    # average the duplicated (user, business) pairs, as the pivot table did with aggfunc='mean'
+    codes = pd.DataFrame({
+        'user': user_codes.astype(np.int32),
+        'business': business_codes.astype(np.int32),
+        'stars': reviews['stars'].to_numpy(dtype=np.float32)
+    })
+    pair_stars = codes.groupby(['user', 'business'], sort=True)['stars'].agg(['mean', 'size'])
+    pairs = (pair_stars.index.get_level_values('user'), pair_stars.index.get_level_values('business'))
+    shape = (len(user_ids), len(business_ids))
+
+    user_item_ratings = csr_matrix((pair_stars['mean'].to_numpy(dtype=np.float32), pairs), shape=shape)
+    user_ids, business_ids = pd.Index(user_ids, name='user_id'), pd.Index(business_ids, name='business_id')
+
+    if return_counts:
+        review_counts = csr_matrix((pair_stars['size'].to_numpy(dtype=np.float32), pairs), shape=shape)
+        return user_item_ratings, user_ids, business_ids, review_counts
+
+    return user_item_ratings, user_ids, business_ids
+
+
+def grow_matrix(matrix, shape):
+    """
+    Grow a csr matrix to a larger shape, with empty rows and columns after the existing ones.
+    """
+    matrix = csr_matrix(matrix)
+    indptr = np.pad(matrix.indptr, (0, shape[0] - matrix.shape[0]), mode='edge')
+    return csr_matrix((matrix.data, matrix.indices, indptr), shape=shape)
+
+
+def add_to_user_item_matrix(user_item_ratings, review_counts, user_positions, business_positions, stars, shape):
+    """
+    Add reviews to a user-item matrix of mean ratings, updating the mean of every reviewed pair.
+
+    Parameters:
+        - user_item_ratings (csr_matrix): The mean stars of each (user, business) pair.
+        - review_counts (csr_matrix): The number of reviews of each pair, with the same entries as the ratings.
+        - user_positions (ndarray): The row of the user of each new review.
+        - business_positions (ndarray): The column of the business of each new review.
+        - stars (ndarray): The stars of each new review.
+        - shape (tuple): The shape of the updated matrix, at least the shape of the current one.
+
+    Returns:
+        - user_item_ratings (csr_matrix): The updated mean stars of each pair.
+        - review_counts (csr_matrix): The updated number of reviews of each pair.
+    """
+    codes = pd.DataFrame({
+        'user': np.asarray(user_positions, dtype=np.int32),
+        'business': np.asarray(business_positions, dtype=np.int32),
+        'stars': np.asarray(stars, dtype=np.float32)
+    })
+    pair_stars = codes.groupby(['user', 'business'], sort=True)['stars'].agg(['sum', 'size'])
+    pairs = (pair_stars.index.get_level_values('user'), pair_stars.index.get_level_values('business'))
+
+    ratings = grow_matrix(user_item_ratings, shape)
+    counts = grow_matrix(review_counts, shape)
+
+    # both sums have the entries of every pair, in the same sorted order
+    star_sums = ratings.multiply(counts).tocsr() + csr_matrix((pair_stars['sum'].to_numpy(dtype=np.float32), pairs),
+                                                              shape=shape)
+    counts = counts + csr_matrix((pair_stars['size'].to_numpy(dtype=np.float32), pairs), shape=shape)
+    star_sums.sum_duplicates()
+    counts.sum_duplicates()
+
+    ratings = csr_matrix((star_sums.data / counts.data, star_sums.indices, star_sums.indptr), shape=shape,
+                         dtype=np.float32)
+    return ratings, counts
@@ -0,0 +1,26 @@
+import numpy as np
+import scipy.sparse as sp
+
+from als import ALS
+
+
+def test_explicit_fit_refits_on_held_out_ratings():
+    rng = np.random.default_rng(0)
+    users, items = rng.normal(size=(200, 4)), rng.normal(size=(100, 4))
+    ratings = sp.random(200, 100, density=0.2, random_state=0, format='coo')
+    ratings.data = 3 + (users[ratings.row] * items[ratings.col]).sum(axis=1) + rng.normal(scale=0.1, size=ratings.nnz)
+    ratings = ratings.tocsr()
+
+    als = ALS(rank=4, regularization=0.01, validation_fraction=0.2, seed=0).fit(ratings)
+
+    # the same split as in fit
+    coo = ratings.tocoo()
+    held_out = np.random.default_rng(0).random(coo.nnz) < 0.2
+    predictions = als.mean_ + np.einsum('ij,ij->i', als.user_factors_[coo.row], als.item_factors_[coo.col])
+    errors = (coo.data - predictions) ** 2
+
+    assert np.isclose(als.mean_, coo.data.mean(), rtol=1e-5)
+    assert 0 < als.n_iter_ <= len(als.history_)
+    # the held-out ratings are fitted as closely as the others, and better than while they were held out
+    assert np.sqrt(errors[held_out].mean()) < 2 * np.sqrt(errors[~held_out].mean())
+    assert np.sqrt(errors[held_out].mean()) < min(als.history_)
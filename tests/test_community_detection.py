@@ -0,0 +1,37 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from community_detection import detect_communities, modularity
+from review_graph import ReviewGraph
+
+
+def make_graph(seed=0):
+    """
+    Make the review graph of random reviews in two groups of users and businesses.
+    """
+    rng = np.random.default_rng(seed)
+    users = rng.integers(0, 40, 300)
+    businesses = rng.integers(0, 15, 300) + 15 * (users % 2)
+    return ReviewGraph.from_reviews(pd.DataFrame({
+        'user_id': ['u{}'.format(user) for user in users],
+        'business_id': ['b{}'.format(business) for business in businesses],
+        'stars': rng.integers(1, 6, 300)
+    }))
+
+
+@pytest.mark.parametrize('method', ['louvain', 'label_propagation', 'greedy_modularity'])
+def test_detect_communities(method):
+    graph = make_graph()
+
+    labels = detect_communities(graph, method)
+
+    assert labels.dtype == np.int32
+    assert len(labels) == graph.number_of_users + len(graph.business_ids)
+    assert (labels >= 0).all()
+    assert modularity(graph, labels) > 0.3
+
+
+def test_detect_communities_invalid_method():
+    with pytest.raises(ValueError):
+        detect_communities(make_graph(), 'girvan_newman')
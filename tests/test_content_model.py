@@ -0,0 +1,34 @@
+import numpy as np
+import pandas as pd
+import scipy.sparse as sp
+
+from content_model import ContentModel
+from ranking import sparse_top_n
+
+WORDS = np.array(['pizza', 'sushi', 'tacos', 'burger', 'coffee', 'noodles', 'salad', 'steak', 'bagel', 'curry'])
+
+
+def test_blocked_recommendations_match_full_scores():
+    rng = np.random.default_rng(0)
+    reviews = pd.DataFrame({
+        'user_id': ['u{}'.format(user) for user in rng.integers(0, 30, 300)],
+        'business_id': ['b{}'.format(business) for business in rng.integers(0, 50, 300)],
+        'text': [' '.join(rng.choice(WORDS, 3)) for _ in range(300)]
+    })
+    user_ids, business_ids = pd.Index(pd.unique(reviews['user_id'])), pd.Index(pd.unique(reviews['business_id']))
+    model = ContentModel(n_features=2 ** 10).fit([reviews], user_ids, business_ids)
+    users = np.arange(len(user_ids))
+    exclude = sp.random(len(user_ids), len(business_ids), density=0.2, random_state=0, format='csr')
+    allowed = np.arange(len(business_ids)) % 4 != 0
+
+    indices = model.recommend(users, 8, exclude=exclude, allowed=allowed, block_size=7)
+
+    scores = model.score(users) @ sp.diags(allowed.astype(np.float32))
+    expected = sparse_top_n(scores, 8, exclude=exclude)
+    assert indices.shape == expected.shape
+    np.testing.assert_array_equal(indices >= 0, expected >= 0)
+    for user in users:
+        row = indices[user][indices[user] >= 0]
+        assert allowed[row].all() and not exclude[user, row].toarray().any()
+        expected_row = expected[user][expected[user] >= 0]
+        np.testing.assert_allclose(scores[user, row].toarray(), scores[user, expected_row].toarray(), rtol=1e-6)
@@ -0,0 +1,32 @@
+import numpy as np
+import pandas as pd
+
+from evaluation import Evaluator
+from test_recommender_system import make_recommender_system
+
+
+def test_evaluate_models():
+    rs = make_recommender_system('svd')
+    businesses = rs.businesses.copy()
+    businesses['categories'] = np.where(np.arange(len(businesses)) % 2, 'Restaurants, Pizza', 'Bars')
+    rs.businesses = businesses
+    rs.category_index = None
+    rs.preprocess_data()
+
+    results = Evaluator(rs, number_of_users=20, k=5).evaluate_models(['svd', 'knn'])
+
+    assert list(results.index) == ['svd', 'knn']
+    assert (results['users'] > 0).all()
+    for metric in ('precision@k', 'recall@k', 'ndcg@k', 'coverage', 'category_precision'):
+        assert results[metric].between(0, 1).all()
+    assert not results.isna().any().any()
+
+
+def test_evaluate_models_across_processes():
+    rs = make_recommender_system('svd')
+
+    serial = Evaluator(rs, number_of_users=20, k=5).evaluate_models(['svd', 'knn'])
+    parallel = Evaluator(rs, number_of_users=20, k=5, n_jobs=3).evaluate_models(['svd', 'knn'])
+
+    columns = ['users', 'precision@k', 'recall@k', 'ndcg@k', 'coverage', 'category_precision']
+    pd.testing.assert_frame_equal(parallel[columns], serial[columns])
@@ -0,0 +1,32 @@
+import json
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from data_sources import ParquetDataSource
+from ingestion import DATASET_FILES, ingest_yelp_dataset
+
+
+@pytest.mark.parametrize('n_jobs', [1, 2])
+def test_ingested_reviews_read_back(tmp_path, n_jobs):
+    rng = np.random.default_rng(0)
+    dataset_dir, data_dir = tmp_path / 'dataset', tmp_path / 'data'
+    dataset_dir.mkdir()
+    # the first chunk has fewer than 128 distinct IDs, which fit in int8 categories, the next ones more
+    reviews = [{'review_id': 'r{}'.format(review),
+                'user_id': 'u{}'.format(rng.integers(0, 100 if review < 500 else 400)),
+                'business_id': 'b{}'.format(rng.integers(0, 100 if review < 500 else 300)), 'stars': int(rng.integers(1, 6)),
+                'date': '2018-01-0{} 12:00:00'.format(rng.integers(1, 10)), 'text': 'great food'}
+               for review in range(1050)]
+    with open(dataset_dir / DATASET_FILES['reviews'], 'w', encoding='utf8') as f:
+        f.writelines(json.dumps(review) + '\n' for review in reviews)
+
+    ingest_yelp_dataset(str(dataset_dir), str(data_dir), tables=['reviews'], chunk_size=500, n_jobs=n_jobs)
+
+    data = ParquetDataSource(str(data_dir)).read('reviews', columns=['user_id', 'business_id', 'stars'])
+    assert list(data.columns) == ['user_id', 'business_id', 'stars']
+    assert sorted(data['user_id'].astype(str)) == sorted(review['user_id'] for review in reviews)
+    assert data['stars'].sum() == sum(review['stars'] for review in reviews)
+    chunks = list(ParquetDataSource(str(data_dir)).iter_chunks('reviews', columns=['business_id'], chunk_size=200))
+    assert sum(len(chunk) for chunk in chunks) == len(reviews)
@@ -0,0 +1,31 @@
+import numpy as np
+import scipy.sparse as sp
+
+from pagerank import PersonalizedPageRank, pagerank
+from review_graph import ReviewGraph
+
+
+def test_blocked_recommendations_match_full_personalized_pagerank():
+    rng = np.random.default_rng(0)
+    ratings = sp.random(80, 50, density=0.1, random_state=0, format='csr', data_rvs=lambda size: rng.integers(1, 6, size))
+    model = PersonalizedPageRank(tol=1e-9, max_iter=200, block_size=7).fit(ratings)
+    allowed = np.arange(50) % 3 != 0
+
+    indices = model.recommend(ratings, 10, exclude=ratings, allowed=allowed)
+
+    # the float64 personalized PageRank of every user, over the whole graph at once
+    adjacency = ReviewGraph(ratings, user_ids=None, business_ids=None).adjacency
+    seeds = sp.hstack([sp.csr_matrix((80, 80)), ratings], format='csr').T
+    scores = pagerank(adjacency, personalization=seeds, tol=1e-12, max_iter=500)[80:].T
+    scores[:, ~allowed] = -np.inf
+    scores[ratings.nonzero()] = -np.inf
+
+    assert model.score(ratings[:3]).dtype == np.float32
+    assert indices.shape == (80, 10)
+    for user, row in enumerate(indices):
+        expected = np.sort(scores[user])[::-1][:10]
+        expected = expected[expected > -np.inf]
+        selected = row[row >= 0]
+        assert len(selected) == len(expected)
+        assert allowed[selected].all() and not ratings[user, selected].toarray().any()
+        np.testing.assert_allclose(scores[user, selected], expected, rtol=1e-4, atol=1e-7)
@@ -0,0 +1,104 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from data_sources import ParquetDataSource
+from recommender_system import RecommenderSystem
+
+
+def make_recommender_system(model_type, number_of_users=60, number_of_businesses=40, number_of_reviews=600,
+                            seed=0, build=True):
+    """
+    Make a recommender system over random reviews, without loading any file, fitted unless build is False.
+    """
+    rng = np.random.default_rng(seed)
+    reviews = pd.DataFrame({
+        'user_id': ['u{}'.format(user) for user in rng.integers(0, number_of_users, number_of_reviews)],
+        'business_id': ['b{}'.format(business) for business in rng.integers(0, number_of_businesses,
+                                                                             number_of_reviews)],
+        'stars': rng.integers(1, 6, number_of_reviews)
+    })
+
+    rs = RecommenderSystem(model_type, load=False, cache_size=0)
+    rs.reviews = reviews
+    rs.businesses = pd.DataFrame({'business_id': pd.unique(reviews['business_id']), 'categories': None})
+    rs.preprocess_data()
+    if build:
+        rs.build_recommender_system()
+    return rs
+
+
+@pytest.mark.parametrize('model_type', ['svd', 'knn', 'ppr'])
+def test_batch_recommendations_larger_than_catalog(model_type):
+    rs = make_recommender_system(model_type)
+    number_of_businesses = len(rs.business_ids)
+    user_ids = list(rs.user_ids[:2])
+
+    recommendations = rs.make_recommendations_batch(user_ids, 100)
+
+    assert recommendations.shape == (2, 100)
+    assert all(business_id is None for business_id in recommendations.iloc[:, number_of_businesses:].to_numpy().ravel())
+    # the users rated different numbers of businesses, so some columns mix IDs and padding
+    assert all(isinstance(business_id, str) or business_id is None
+               for business_id in recommendations.to_numpy().ravel())
+    for user_id, row in zip(user_ids, recommendations.to_numpy()):
+        recommended = [business_id for business_id in row if pd.notna(business_id)]
+        assert len(recommended) == len(set(recommended))
+        assert list(rs.make_recommendations(user_id, 100)) == recommended
+
+
+
+def test_save_model_after_fit_model(tmp_path):
+    rs = make_recommender_system('svd', build=False)
+    rs.fit_model()
+    rs.save_model(str(tmp_path))
+
+    loaded = RecommenderSystem.load_model(str(tmp_path))
+    user_id = rs.user_ids[0]
+    assert list(loaded.make_recommendations(user_id, 5)) == list(rs.make_recommendations(user_id, 5))
+
+
+def test_community_recommendations_larger_than_community():
+    rs = make_recommender_system('svd', number_of_reviews=200)
+    number_of_users, number_of_businesses = len(rs.user_ids), len(rs.business_ids)
+    labels = np.concatenate([np.arange(number_of_users) % 2, np.arange(number_of_businesses) % 2])
+    rs.build_community_models(labels=labels, min_size=5)
+    user_positions = np.arange(10)
+
+    # more recommendations than the businesses of any community
+    n = max(len(community_businesses) for _, _, community_businesses in rs.community_models.models_.values()) + 1
+    indices, routed = rs.community_models.recommend_users(user_positions, n)
+
+    assert indices.shape == (10, n)
+    assert not routed.any()
+    np.testing.assert_array_equal(rs.recommend_users(user_positions, n), rs.recommend_users_globally(user_positions, n))
+
+
+def test_content_model_without_review_texts(tmp_path):
+    rs = make_recommender_system('content', build=False)
+    rs.data_source = ParquetDataSource(str(tmp_path))
+    rs.data_source.write('reviews', rs.reviews)
+    rs.reviews = None
+
+    with pytest.raises(ValueError, match="'text'"):
+        rs.fit_model()
+
+
+@pytest.mark.parametrize('model_type', ['svd', 'knn'])
+def test_save_model_over_its_memory_mapped_arrays(tmp_path, model_type):
+    # large enough for the arrays to span several pages
+    rs = make_recommender_system('svd', number_of_users=2000, number_of_businesses=500, number_of_reviews=20000,
+                                 build=False)
+    rs.build_recommender_system(model_dir=str(tmp_path))
+    rs.build_recommender_system(model_dir=str(tmp_path))
+    user_id = rs.user_ids[0]
+
+    # the restored arrays are memory-mapped from the directory they are saved to again
+    rs.set_model_type(model_type)
+    rs.build_recommender_system(model_dir=str(tmp_path))
+    loaded = RecommenderSystem.load_model(str(tmp_path))
+    loaded.save_model(str(tmp_path))
+
+    reloaded = RecommenderSystem.load_model(str(tmp_path))
+    assert reloaded.model_type == model_type
+    assert list(reloaded.make_recommendations(user_id, 5)) == list(rs.make_recommendations(user_id, 5))
@@ -0,0 +1,19 @@
+import json
+
+from service import RecommendationService
+from test_recommender_system import make_recommender_system
+
+
+def test_score_batch_shorter_than_n():
+    rs = make_recommender_system('knn')
+    service = RecommendationService(rs, rs.businesses)
+    user_ids = list(rs.user_ids[:2])
+
+    # more recommendations than businesses, so every list is shorter than n
+    results = service.score_batch(user_ids + ['unknown'], [5, 100, 100])
+
+    assert len(results[0]) == 5
+    assert 0 < len(results[1]) < len(rs.business_ids)
+    assert results[2] is None
+    assert all(isinstance(record['business_id'], str) for result in results[:2] for record in result)
+    json.dumps(results, allow_nan=False)